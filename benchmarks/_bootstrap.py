@@ -0,0 +1,50 @@
+"""
+Shared setup for the scripts in this directory.
+
+Benchmarks never touch the configured database by default: they point Django
+at a throwaway SQLite file (or at --database-url when given), migrate it and
+delete it afterwards.
+"""
+import atexit
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup_django(database_url=None, keep=False):
+    if str(REPO_ROOT) not in sys.path:
+        sys.path.insert(0, str(REPO_ROOT))
+    if not database_url:
+        fd, path = tempfile.mkstemp(prefix='bench-', suffix='.sqlite3')
+        os.close(fd)
+        database_url = f'sqlite:///{path}'
+        if not keep:
+            atexit.register(_remove_sqlite_files, path)
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tiles_automation.settings')
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return database_url
+
+
+def _remove_sqlite_files(path):
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
@@ -0,0 +1,29 @@
+"""
+Settings for the servers asgi_load.py starts: those named by
+BENCH_BASE_SETTINGS plus a fixed delay of BENCH_QUERY_DELAY_MS before every
+query, standing in for a database across the network.
+"""
+import importlib
+import os
+import time
+
+from django.db.backends.signals import connection_created
+
+_base = importlib.import_module(os.environ.get('BENCH_BASE_SETTINGS', 'tiles_automation.settings'))
+globals().update({name: value for name, value in vars(_base).items() if name.isupper()})
+
+_DELAY = float(os.environ.get('BENCH_QUERY_DELAY_MS', '0')) / 1000
+
+
+def _delay(execute, sql, params, many, context):
+    time.sleep(_DELAY)
+    return execute(sql, params, many, context)
+
+
+def _install_delay(sender, connection, **kwargs):
+    if _delay not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_delay)
+
+
+if _DELAY:
+    connection_created.connect(_install_delay)
@@ -0,0 +1,201 @@
+"""
+WSGI vs ASGI load test for the read-only views.
+
+    python benchmarks/asgi_load.py --workers 2 --connections 8,32,128 --duration 10
+
+Seeds a throwaway database with a catalog and a day of sales, then starts
+gunicorn twice on it: sync workers on tiles_automation.wsgi, and uvicorn
+workers on tiles_automation.asgi. Both get the same number of workers.
+Against each, it holds N connections open at once, each requesting the
+sales summary, the today cards and a catalog delta in turn for --duration
+seconds. It reports throughput, latency percentiles and failed or timed-out
+requests per level of concurrency.
+
+--query-delay-ms adds a sleep before every query the servers run (see
+_latency_settings.py), standing in for a database across the network; with
+the local SQLite file every query is CPU time and no server model can overlap
+it.
+
+The load comes from one asyncio process, one request per connection
+(gunicorn's sync workers do not keep connections alive). Needs gunicorn,
+uvicorn and uvicorn-worker (requirements.txt).
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from _bootstrap import REPO_ROOT, percentile, setup_django
+
+SERVERS = {
+    'wsgi': ['tiles_automation.wsgi:application'],
+    'asgi': ['tiles_automation.asgi:application', '-k', 'uvicorn_worker.UvicornWorker'],
+}
+
+
+def seed(products, sales, rng):
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from inventory.ledger import set_stock_quantity
+    from inventory.models import Location, Product, Stock, Store, UserProfile
+    from inventory.services import record_sale
+
+    godown = Store.objects.create(name='Central Godown', store_type='GODOWN')
+    shops = [Store.objects.create(name=f'Shop {i}', store_type='DISPLAY') for i in range(3)]
+    location = Location.objects.create(name='Rack A1')
+    Product.objects.bulk_create([Product(name=f'Tile {i}', size='2x2') for i in range(products)], batch_size=2000)
+    ids = list(Product.objects.values_list('id', flat=True))
+    for pid in ids:
+        set_stock_quantity(Stock(product_id=pid, store=godown), Decimal('100000'), kind='OPENING')
+    for _ in range(sales):
+        lines = [(pid, Decimal(rng.randint(1, 5)), Decimal('45'), location.id) for pid in rng.sample(ids, 3)]
+        record_sale(rng.choice(shops), 'Bench', [], Decimal('0'), lines)
+
+    user = User.objects.create_user('bench', password='bench', is_staff=True)
+    UserProfile.objects.create(user=user, store=shops[0])
+    client = Client()
+    client.force_login(user)
+    return client.cookies['sessionid'].value
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, workers, env):
+    port = free_port()
+    command = [sys.executable, '-m', 'gunicorn', *SERVERS[mode], '-w', str(workers),
+               '-b', f'127.0.0.1:{port}', '--timeout', '120', '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process, port
+        except OSError:
+            if process.poll() is not None:
+                raise SystemExit(f"{mode} server exited with {process.returncode}")
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f"{mode} server did not start")
+
+
+async def fetch(port, path, cookie, timeout):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: localhost\r\nCookie: sessionid={cookie}\r\n'
+            f'Accept-Encoding: gzip\r\nConnection: close\r\n\r\n'.encode()
+        )
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    return int(response.split(b' ', 2)[1]) if response.startswith(b'HTTP/') else 0
+
+
+async def run_level(port, paths, cookie, connections, duration, timeout):
+    timings, failures = {path: [] for path in paths}, 0
+    stop = time.monotonic() + duration
+
+    async def connection(n):
+        nonlocal failures
+        i = n
+        while time.monotonic() < stop:
+            path = paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                status = await fetch(port, path, cookie, timeout)
+            except (OSError, asyncio.TimeoutError):
+                status = 0
+            if status == 200:
+                timings[path].append((time.perf_counter() - started) * 1000)
+            else:
+                failures += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(connection(n) for n in range(connections)))
+    return timings, failures, time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--connections', default='8,32,128', help="Comma-separated concurrency levels.")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per level.")
+    parser.add_argument('--timeout', type=float, default=10.0, help="Seconds before a request counts as failed.")
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--sales', type=int, default=600)
+    parser.add_argument('--modes', default='wsgi,asgi')
+    parser.add_argument('--query-delay-ms', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help="Database to use instead of a throwaway SQLite file.")
+    args = parser.parse_args()
+
+    database_url = setup_django(args.database_url)
+    started = time.perf_counter()
+    cookie = seed(args.products, args.sales, random.Random(args.seed))
+    print(f"Seeded {args.products} products and {args.sales} sales in {time.perf_counter() - started:.1f}s")
+
+    from inventory import catalog_sync
+    from inventory.models import Location, Product, Stock
+
+    # Catalog clients last synced before the seeding; deltas carry only what changes now
+    for model in (Product, Location, Stock):
+        model.objects.update(version=1)
+    since = catalog_sync.now_version()
+    paths = ['/sales/summary/', '/sales/today/', f'/api/catalog/?since={since}']
+    cache_dir = tempfile.TemporaryDirectory()
+    env = {
+        **os.environ,
+        'DATABASE_URL': database_url,
+        'CACHE_LOCATION': cache_dir.name,
+        'METRICS_DIR': str(Path(cache_dir.name) / 'metrics'),
+        'PYTHONPATH': os.pathsep.join(filter(None, [
+            str(REPO_ROOT), str(Path(__file__).resolve().parent), os.environ.get('PYTHONPATH'),
+        ])),
+        'DJANGO_SETTINGS_MODULE': '_latency_settings',
+        'BENCH_BASE_SETTINGS': os.environ['DJANGO_SETTINGS_MODULE'],
+        'BENCH_QUERY_DELAY_MS': str(args.query_delay_ms),
+    }
+    levels = [int(n) for n in args.connections.split(',')]
+    try:
+        for mode in args.modes.split(','):
+            process, port = start_server(mode, args.workers, env)
+            try:
+                # Warm every worker's caches and connections
+                asyncio.run(run_level(port, paths, cookie, args.workers * 2, 1.0, args.timeout))
+                for connections in levels:
+                    timings, failures, elapsed = asyncio.run(
+                        run_level(port, paths, cookie, connections, args.duration, args.timeout)
+                    )
+                    every = [ms for path_timings in timings.values() for ms in path_timings]
+                    print(
+                        f"{mode} {connections:>4} connections: {len(every) / elapsed:7.1f} req/s, "
+                        f"p50 {percentile(every, 50):7.1f} ms, p95 {percentile(every, 95):7.1f} ms, "
+                        f"p99 {percentile(every, 99):7.1f} ms, {failures} failed"
+                    )
+                    for path, path_timings in timings.items():
+                        print(
+                            f"    {path.split('?')[0]:<16} p50 {percentile(path_timings, 50):7.1f} ms, "
+                            f"p95 {percentile(path_timings, 95):7.1f} ms"
+                        )
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        cache_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Concurrent-checkout benchmark: many threads selling the same hot product.
+
+    python benchmarks/checkout_contention.py --sales 400 --threads 32 --stock 300
+
+Every sale asks for --quantity units of one product whose godown stock starts
+at --stock, so some sales must be refused once stock runs out. The script
+reports throughput and latency percentiles and checks that the final Stock
+quantity, the stock ledger and the number of invoices all agree exactly,
+i.e. nothing was oversold. It exits non-zero when they do not.
+
+--mode naive replays the old read-check-save sequence for comparison.
+"""
+import argparse
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from _bootstrap import percentile, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sales', type=int, default=400, help="Number of sale attempts.")
+    parser.add_argument('--threads', type=int, default=32, help="Concurrent sellers.")
+    parser.add_argument('--stock', type=int, default=300, help="Starting godown stock of the hot product.")
+    parser.add_argument('--quantity', type=int, default=1, help="Units per sale.")
+    parser.add_argument('--mode', choices=('conditional', 'naive'), default='conditional')
+    parser.add_argument('--database-url', help="Database to use instead of a throwaway SQLite file.")
+    args = parser.parse_args()
+
+    setup_django(args.database_url)
+
+    from django.db import connections, transaction
+    from django.db.models import Sum
+    from inventory.ledger import set_stock_quantity
+    from inventory.models import Invoice, InvoiceItem, Product, Stock, StockMovement, Store
+    from inventory.services import SaleError, record_sale
+
+    godown = Store.objects.create(name='Bench Godown', store_type='GODOWN')
+    shop = Store.objects.create(name='Bench Shop', store_type='DISPLAY')
+    product = Product.objects.create(name='Hot Tile', size='2x4')
+    stock = Stock(product=product, store=godown)
+    set_stock_quantity(stock, Decimal(args.stock), kind='OPENING')
+    qty = Decimal(args.quantity)
+
+    def naive_sale():
+        # The pre-ledger sales_new sequence: read, check, then save the new value.
+        with transaction.atomic():
+            row = Stock.objects.get(product=product, store=godown)
+            if row.quantity < qty:
+                raise SaleError("Insufficient stock")
+            invoice = Invoice.objects.create(store=shop, customer_name='Bench', total_amount=qty, paid_amount=qty)
+            row.quantity -= qty
+            row.save()
+            InvoiceItem.objects.create(invoice=invoice, product=product, quantity=qty, rate=1)
+
+    def conditional_sale():
+        record_sale(shop, 'Bench', [], qty, [(product.id, qty, Decimal('1'), None)])
+
+    sale = conditional_sale if args.mode == 'conditional' else naive_sale
+    start_gate = threading.Barrier(args.threads)
+    remaining = iter(range(args.sales))
+    lock = threading.Lock()
+    latencies, outcomes = [], {'sold': 0, 'refused': 0, 'errors': 0}
+
+    def seller():
+        start_gate.wait()
+        try:
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                began = time.perf_counter()
+                try:
+                    sale()
+                    outcome = 'sold'
+                except SaleError:
+                    outcome = 'refused'
+                except Exception:
+                    outcome = 'errors'
+                elapsed = time.perf_counter() - began
+                with lock:
+                    latencies.append(elapsed)
+                    outcomes[outcome] += 1
+        finally:
+            connections.close_all()
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for _ in range(args.threads):
+            pool.submit(seller)
+    wall = time.perf_counter() - began
+
+    final = Stock.objects.get(pk=stock.pk).quantity
+    ledger = StockMovement.objects.filter(product=product, store=godown).aggregate(total=Sum('quantity'))['total']
+    invoices = Invoice.objects.filter(store=shop).count()
+    expected = Decimal(args.stock) - qty * invoices
+
+    print(f"mode={args.mode} sales={args.sales} threads={args.threads} vendor={connections['default'].vendor}")
+    print(f"sold={outcomes['sold']} refused={outcomes['refused']} errors={outcomes['errors']}")
+    print(f"throughput={args.sales / wall:.1f} attempts/s ({outcomes['sold'] / wall:.1f} sales/s) wall={wall:.2f}s")
+    print(
+        "latency ms: "
+        f"p50={percentile(latencies, 50) * 1000:.1f} "
+        f"p95={percentile(latencies, 95) * 1000:.1f} "
+        f"p99={percentile(latencies, 99) * 1000:.1f} "
+        f"max={max(latencies, default=0) * 1000:.1f}"
+    )
+    print(f"final stock={final} expected={expected} ledger={ledger} invoices={invoices}")
+
+    exact = final == expected and final >= 0 and (args.mode == 'naive' or ledger == final)
+    print("stock is exact" if exact else "STOCK MISMATCH: oversold or lost updates")
+    return 0 if exact else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Customer search benchmark.
+
+    python benchmarks/customer_search.py --customers 50000 --invoices 300000
+
+Seeds customers with one or two phone numbers each and spreads invoices over
+them, then times search_customers() for random phone prefixes (4-10 digits)
+and name prefixes, reporting latency percentiles per kind.
+"""
+import argparse
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from _bootstrap import percentile, setup_django
+
+FIRST_NAMES = ['Ravi', 'Asha', 'Sunil', 'Meena', 'Arjun', 'Kavita', 'Imran', 'Pooja', 'Vijay', 'Neha']
+LAST_NAMES = ['Sharma', 'Verma', 'Patel', 'Yadav', 'Khan', 'Jain', 'Gupta', 'Singh', 'Rao', 'Das']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, default=50000)
+    parser.add_argument('--invoices', type=int, default=300000)
+    parser.add_argument('--searches', type=int, default=500, help="Searches of each kind.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help="Database to use instead of a throwaway SQLite file.")
+    args = parser.parse_args()
+
+    setup_django(args.database_url)
+
+    from django.db import transaction
+    from django.utils import timezone
+    from inventory.customers import name_key, search_customers
+    from inventory.models import Customer, CustomerPhone, Invoice, Store
+    from inventory.receivables import rebuild_receivables
+
+    rng = random.Random(args.seed)
+    store = Store.objects.create(name='Bench Shop', store_type='DISPLAY')
+    started = time.perf_counter()
+    with transaction.atomic():
+        names = [f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}' for i in range(args.customers)]
+        Customer.objects.bulk_create([Customer(name=n, name_key=name_key(n)) for n in names], batch_size=2000)
+        ids = list(Customer.objects.order_by('id').values_list('id', flat=True))
+        numbers = rng.sample(range(6000000000, 9999999999), args.customers * 2)
+        CustomerPhone.objects.bulk_create(
+            [CustomerPhone(customer_id=cid, number=f'+91{numbers[i]}') for i, cid in enumerate(ids)]
+            + [CustomerPhone(customer_id=cid, number=f'+91{numbers[-i - 1]}') for i, cid in enumerate(ids[::3])],
+            batch_size=2000,
+        )
+        now = timezone.now()
+        for start in range(0, args.invoices, 5000):
+            Invoice.objects.bulk_create([
+                Invoice(
+                    store=store, customer_name='Bench', customer_id=rng.choice(ids),
+                    total_amount=Decimal(rng.randint(100, 50000)), paid_amount=Decimal('0'),
+                )
+                for _ in range(min(5000, args.invoices - start))
+            ])
+        Invoice.objects.update(date=now - timedelta(days=1))
+        rebuild_receivables()
+    print(f"Seeded {args.customers} customers and {args.invoices} invoices in {time.perf_counter() - started:.1f}s")
+
+    queries = {
+        'phone': [str(rng.choice(numbers))[:rng.randint(4, 10)] for _ in range(args.searches)],
+        'name': [rng.choice(names)[:rng.randint(2, 12)] for _ in range(args.searches)],
+    }
+    for kind, terms in queries.items():
+        timings = []
+        for term in terms:
+            t0 = time.perf_counter()
+            search_customers(term)
+            timings.append((time.perf_counter() - t0) * 1000)
+        print(
+            f"{kind:>5} search: p50 {percentile(timings, 50):.2f} ms, p95 {percentile(timings, 95):.2f} ms, "
+            f"max {max(timings):.2f} ms over {len(timings)} searches"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Dues page benchmark.
+
+    python benchmarks/dues.py --customers 20000 --invoices 500000 --open 0.02
+
+Seeds invoices spread over three years, of which only the ``--open`` fraction
+still has money due, builds the customer balances, then times the queries
+behind the dues page: the aging totals and pages of customers by balance.
+"""
+import argparse
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from _bootstrap import percentile, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, default=20000)
+    parser.add_argument('--invoices', type=int, default=500000)
+    parser.add_argument('--open', type=float, default=0.02, help="Fraction of invoices not fully paid.")
+    parser.add_argument('--pages', type=int, default=200, help="Dues pages to time.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help="Database to use instead of a throwaway SQLite file.")
+    args = parser.parse_args()
+
+    setup_django(args.database_url)
+
+    from django.db import transaction
+    from django.utils import timezone
+    from inventory.models import Customer, Invoice, Payment, Store
+    from inventory.receivables import aging_totals, decode_dues_cursor, dues_page, rebuild_receivables
+
+    rng = random.Random(args.seed)
+    store = Store.objects.create(name='Bench Shop', store_type='DISPLAY')
+    started = time.perf_counter()
+    now = timezone.now()
+    with transaction.atomic():
+        Customer.objects.bulk_create(
+            [Customer(name=f'Customer {i}', name_key=f'customer {i}') for i in range(args.customers)], batch_size=2000
+        )
+        ids = list(Customer.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, args.invoices, 5000):
+            invoices = []
+            for _ in range(min(5000, args.invoices - start)):
+                total = Decimal(rng.randint(100, 50000))
+                paid = Decimal(rng.randint(0, int(total) - 1)) if rng.random() < args.open else total
+                invoices.append(Invoice(
+                    store=store, customer_name='Bench', customer_id=rng.choice(ids), total_amount=total,
+                    paid_amount=paid, due_amount=total - paid, date=now - timedelta(minutes=rng.randint(0, 3 * 525600)),
+                ))
+            Invoice.objects.bulk_create(invoices)
+            Payment.objects.bulk_create(
+                [Payment(invoice=inv, amount=inv.paid_amount, date=inv.date) for inv in invoices if inv.paid_amount]
+            )
+        rebuild_receivables()
+    print(f"Seeded {args.customers} customers and {args.invoices} invoices in {time.perf_counter() - started:.1f}s")
+
+    timings = {'aging totals': [], 'dues page': []}
+    for _ in range(20):
+        t0 = time.perf_counter()
+        aging_totals()
+        timings['aging totals'].append((time.perf_counter() - t0) * 1000)
+    cursor = None
+    for _ in range(args.pages):
+        t0 = time.perf_counter()
+        _, next_cursor = dues_page(cursor)
+        timings['dues page'].append((time.perf_counter() - t0) * 1000)
+        cursor = decode_dues_cursor(next_cursor) if next_cursor else None
+    for kind, values in timings.items():
+        print(
+            f"{kind:>12}: p50 {percentile(values, 50):.2f} ms, p95 {percentile(values, 95):.2f} ms, "
+            f"max {max(values):.2f} ms over {len(values)} runs"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Product search benchmark.
+
+    python benchmarks/product_search.py --products 100000
+
+Seeds a catalog of made-up tile names and sizes, builds the in-process search
+index and times search_products() against the equivalent ``icontains``
+queries for the same terms: whole words, prefixes being typed, misspellings
+and sizes typed with spaces. Also reports how often each approach puts the
+product the term was taken from in its top 20 (size terms match thousands of
+products equally well, so that rate is low for both).
+"""
+import argparse
+import random
+import time
+
+from _bootstrap import percentile, setup_django
+
+SERIES = ['Ivory', 'Glossy', 'Statuario', 'Carrara', 'Onyx', 'Rustic', 'Sahara', 'Nero', 'Crema', 'Slate',
+          'Terrazzo', 'Travertine', 'Calacatta', 'Emperador', 'Pietra', 'Sandstone', 'Concrete', 'Oak', 'Walnut']
+FINISHES = ['Matt', 'Gloss', 'Satin', 'Rustic', 'Carving', 'Sugar', 'Lappato', 'Polished', 'Anti Skid']
+COLOURS = ['White', 'Beige', 'Grey', 'Black', 'Brown', 'Blue', 'Green', 'Gold', 'Silver', 'Cream']
+SIZES = ['2x2', '2x4', '1x1', '12x18', '300x300', '300x600', '600x600', '600x1200', '800x1600', '800x2400']
+CATEGORIES = ['TILES', 'TILES', 'TILES', 'MARBLE', 'GRANITE', 'SANITARY']
+
+
+def typo(word, rng):
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word))
+    return word[:i] + word[i + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--searches', type=int, default=300, help="Searches of each kind.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help="Database to use instead of a throwaway SQLite file.")
+    args = parser.parse_args()
+
+    setup_django(args.database_url)
+
+    from django.db.models import Q
+    from inventory import catalog_cache
+    from inventory.models import Product
+    from inventory.product_search import index, search_products
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    rows = []
+    for i in range(args.products):
+        name = f'{rng.choice(SERIES)} {rng.choice(COLOURS)} {rng.choice(FINISHES)} {i}'
+        rows.append(Product(name=name, size=rng.choice(SIZES), category=rng.choice(CATEGORIES)))
+    Product.objects.bulk_create(rows, batch_size=2000)
+    products = list(Product.objects.values('id', 'name', 'size'))
+    print(f"Seeded {args.products} products in {time.perf_counter() - started:.1f}s")
+
+    # bulk_create sends no signals
+    catalog_cache.clear()
+    started = time.perf_counter()
+    index.refresh()
+    print(f"Index built in {time.perf_counter() - started:.2f}s")
+
+    def term(kind, product):
+        words = product['name'].split()
+        if kind == 'words':
+            return f"{words[0]} {words[1]} {words[-1]}"
+        if kind == 'prefix':
+            return f"{words[0][:4]} {words[1][:3]} {words[-1]}"
+        if kind == 'typo':
+            return f"{typo(words[0], rng)} {typo(words[1], rng)} {words[-1]}"
+        return f"{words[0]} {product['size'].replace('x', ' x ')}"
+
+    def icontains(query):
+        condition = Q()
+        for word in query.split():
+            condition &= Q(name__icontains=word) | Q(size__icontains=word)
+        return list(Product.objects.filter(condition).order_by('name').values_list('id', flat=True)[:20])
+
+    def fuzzy(query):
+        return [p['id'] for p in search_products(query)]
+
+    for kind in ('words', 'prefix', 'typo', 'size'):
+        picks = [rng.choice(products) for _ in range(args.searches)]
+        terms = [term(kind, p) for p in picks]
+        for label, search in (('index', fuzzy), ('icontains', icontains)):
+            timings, found = [], 0
+            for product, query in zip(picks, terms):
+                t0 = time.perf_counter()
+                ids = search(query)
+                timings.append((time.perf_counter() - t0) * 1000)
+                found += product['id'] in ids
+            print(
+                f"{kind:>6} {label:>9}: p50 {percentile(timings, 50):.2f} ms, p95 {percentile(timings, 95):.2f} ms, "
+                f"max {max(timings):.2f} ms, source product in top 20 for {found * 100 // len(terms)}%"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Sales screen benchmark.
+
+    python benchmarks/sales_screen.py --products 20000 --requests 30
+
+Seeds a catalog with locations and godown stock, then times GET /sales/new/
+and its product options fragment, with the catalog cache cleared before every
+request (each request rebuilds from the database) and with it warm, and a
+revalidation of the fragment that the browser's ETag turns into a 304. Then
+times the JSON catalog API: a full sync, an unchanged revalidation and the
+delta a counter downloads after another counter's sale.
+"""
+import argparse
+import random
+import time
+from decimal import Decimal
+
+from _bootstrap import percentile, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--locations', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help="Database to use instead of a throwaway SQLite file.")
+    args = parser.parse_args()
+
+    setup_django(args.database_url)
+
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from django.test import Client
+    from django.urls import reverse
+    from inventory import catalog_cache
+    from inventory.models import Location, Product, Stock, Store, UserProfile
+    from inventory.services import record_sale
+
+    rng = random.Random(args.seed)
+    categories = [code for code, _ in Product.CATEGORY_CHOICES]
+    started = time.perf_counter()
+    with transaction.atomic():
+        godown = Store.objects.create(name='Central Godown', store_type='GODOWN')
+        shop = Store.objects.create(name='Bench Shop', store_type='DISPLAY')
+        Location.objects.bulk_create([Location(name=f'Rack {i}') for i in range(args.locations)])
+        location_ids = list(Location.objects.values_list('id', flat=True))
+        Product.objects.bulk_create(
+            [Product(name=f'Tile {i}', size='2x2', category=rng.choice(categories)) for i in range(args.products)],
+            batch_size=2000,
+        )
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        Through = Product.locations.through
+        Through.objects.bulk_create(
+            [Through(product_id=pid, location_id=lid) for pid in product_ids for lid in rng.sample(location_ids, 2)],
+            batch_size=5000,
+        )
+        Stock.objects.bulk_create(
+            [Stock(product_id=pid, store=godown, quantity=Decimal(rng.randint(0, 500))) for pid in product_ids],
+            batch_size=5000,
+        )
+        user = User.objects.create_user('bench', password='bench')
+        UserProfile.objects.create(user=user, store=shop)
+        # As if seeded long before the clients' last sync
+        for model in (Product, Location, Stock):
+            model.objects.update(version=1)
+    print(f"Seeded {args.products} products in {time.perf_counter() - started:.1f}s")
+
+    client = Client()
+    client.force_login(user)
+    page, options = reverse('sales_new'), reverse('product_options')
+
+    def timed(label, url, clear=False, **headers):
+        timings = []
+        for _ in range(args.requests):
+            if clear:
+                catalog_cache.clear()
+            t0 = time.perf_counter()
+            response = client.get(url, headers=headers)
+            timings.append((time.perf_counter() - t0) * 1000)
+            assert response.status_code in (200, 304)
+        print(
+            f"{label:>28}: p50 {percentile(timings, 50):7.1f} ms, p95 {percentile(timings, 95):7.1f} ms, "
+            f"{len(response.content) / 1024:6.0f} KiB, status {response.status_code}"
+        )
+        return response
+
+    timed('page, cold cache', page, clear=True)
+    timed('page, warm cache', page)
+    timed('product options, cold cache', options, clear=True, accept_encoding='gzip')
+    response = timed('product options, warm cache', options, accept_encoding='gzip')
+    timed('product options, revalidated', options, accept_encoding='gzip', if_none_match=response['ETag'])
+
+    api = reverse('catalog_api')
+    response = timed('catalog API, full sync', api, accept_encoding='gzip')
+    timed('catalog API, unchanged', api, accept_encoding='gzip', if_none_match=response['ETag'])
+    sold = rng.sample(product_ids, 3)
+    record_sale(shop, 'Bench', [], Decimal('0'), [(pid, Decimal('1'), Decimal('10'), None) for pid in sold])
+    timed('catalog API, delta after a sale', f'{api}?since={int(time.time() * 1000)}', accept_encoding='gzip')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Scenario benchmark at several data sizes, saved as JSON for comparing commits.
+
+    python benchmarks/scenarios.py --sizes small,medium --output before.json
+    (change something)
+    python benchmarks/scenarios.py --sizes small,medium --output after.json --compare before.json
+
+For each size preset of inventory.sample_data (small, medium, large) it seeds
+a throwaway database with seed_sample_data() and runs every scenario through
+the test client as a superuser: the sales screen, recording a sale, the sales
+summary, the purchase screen, recording a purchase and the admin changelists.
+Each scenario is requested once to warm caches, then --requests times for
+latency, then once more counting queries (as the metrics middleware counts
+them) and once under tracemalloc for peak memory. Results go to --output with
+the commit they were taken at; --compare prints the change against an earlier
+file.
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from _bootstrap import REPO_ROOT, percentile, setup_django
+
+ADMIN_CHANGELISTS = ['invoice', 'product', 'purchase', 'stockmovement', 'customer', 'payment']
+
+
+def scenarios(client, rng, product_ids, store_id):
+    from django.urls import reverse
+
+    def sale():
+        lines = rng.sample(product_ids, 3)
+        return client.post(reverse('sales_new'), {
+            'client_key': uuid.uuid4().hex,
+            'customer_name': 'Bench',
+            'customer_mobile[]': [f'9{rng.randrange(10 ** 9):09d}'],
+            'paid_amount': '100',
+            'product_ids[]': lines,
+            'quantities[]': ['2'] * 3,
+            'rates[]': ['45'] * 3,
+        })
+
+    def purchase():
+        return client.post(reverse('purchase_new'), {
+            'supplier_name': 'Bench Supplier',
+            'invoice_number': uuid.uuid4().hex[:8],
+            'product_ids[]': rng.sample(product_ids, 5),
+            'quantities[]': ['100'] * 5,
+            'rates[]': ['30'] * 5,
+        })
+
+    found = {
+        'sales_new GET': (lambda: client.get(reverse('sales_new')), 200),
+        'sales_new POST': (sale, 302),
+        'sales_summary': (lambda: client.get(reverse('sales_summary')), 200),
+        'sales_summary one store': (lambda: client.get(reverse('sales_summary'), {'store': store_id}), 200),
+        'purchase_new GET': (lambda: client.get(reverse('purchase_new')), 200),
+        'purchase_new POST': (purchase, 302),
+    }
+    for model in ADMIN_CHANGELISTS:
+        url = reverse(f'admin:inventory_{model}_changelist')
+        found[f'admin {model} changelist'] = (lambda url=url: client.get(url), 200)
+    return found
+
+
+def queries_so_far():
+    # Counted by the metrics middleware, which also sees the queries async views run on other threads
+    from inventory import metrics
+
+    return sum(totals['queries'] for totals in metrics._totals.values())
+
+
+def measure(request, expected_status, requests):
+    def run():
+        response = request()
+        if response.status_code != expected_status:
+            raise SystemExit(f"expected {expected_status}, got {response.status_code}")
+        return response
+
+    run()
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    before = queries_so_far()
+    run()
+    queries = queries_so_far() - before
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'requests': requests,
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'max_ms': round(max(timings), 2),
+        'queries': queries,
+        'peak_memory_kib': round(peak / 1024),
+    }
+
+
+def run_size(size, requests, seed):
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.test import Client
+    from inventory import catalog_cache, product_search
+    from inventory.models import Stock, Store, UserProfile
+    from inventory.sample_data import SIZES, seed_sample_data
+
+    call_command('flush', interactive=False, verbosity=0)
+    catalog_cache.clear()
+    product_search.index.clear()
+    started = time.perf_counter()
+    rows = seed_sample_data(**SIZES[size], seed=seed)
+    seed_seconds = time.perf_counter() - started
+    print(f"{size}: seeded {rows['Invoice']} invoices, {rows['Product']} products in {seed_seconds:.1f}s")
+
+    shop = Store.objects.filter(store_type='DISPLAY').order_by('id').first()
+    user = User.objects.create_superuser('bench', password='bench')
+    UserProfile.objects.create(user=user, store=shop)
+    client = Client()
+    client.force_login(user)
+    # Products with enough stock for every sale the run records
+    product_ids = list(
+        Stock.objects.filter(quantity__gte=Decimal(10 * (requests + 3))).values_list('product_id', flat=True)[:1000]
+    )
+    results = {}
+    for name, (request, expected_status) in scenarios(client, random.Random(seed), product_ids, shop.id).items():
+        results[name] = measure(request, expected_status, requests)
+        r = results[name]
+        print(
+            f"    {name:<32} p50 {r['p50_ms']:8.1f} ms, p95 {r['p95_ms']:8.1f} ms, "
+            f"{r['queries']:3} queries, peak {r['peak_memory_kib']:7} KiB"
+        )
+    return {'rows': rows, 'seed_seconds': round(seed_seconds, 1), 'scenarios': results}
+
+
+def compare(current, previous):
+    print(f"Compared with {previous.get('commit') or 'unknown commit'}:")
+    for size, data in current['sizes'].items():
+        before = previous.get('sizes', {}).get(size)
+        if not before:
+            continue
+        for name, result in data['scenarios'].items():
+            old = before['scenarios'].get(name)
+            if not old:
+                continue
+            change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0
+            print(
+                f"    {size:<6} {name:<32} p50 {old['p50_ms']:8.1f} -> {result['p50_ms']:8.1f} ms ({change:+.0f}%), "
+                f"queries {old['queries']} -> {result['queries']}, "
+                f"peak {old['peak_memory_kib']} -> {result['peak_memory_kib']} KiB"
+            )
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='small', help="Comma-separated presets: small, medium, large.")
+    parser.add_argument('--requests', type=int, default=20, help="Timed requests per scenario.")
+    parser.add_argument('--output', default='scenarios.json')
+    parser.add_argument('--compare', help="Earlier --output file to compare with.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help="Database to use instead of a throwaway SQLite file. It is flushed.")
+    args = parser.parse_args()
+
+    setup_django(args.database_url)
+
+    import django
+    from django.db import connection
+
+    report = {
+        'commit': git_commit(),
+        'taken_at': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'sizes': {size: run_size(size, args.requests, args.seed) for size in args.sizes.split(',')},
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Mixed read/write load on SQLite, with and without SQLite production mode.
+
+    python benchmarks/sqlite_writes.py --workers 2 --threads 4 --connections 16 --duration 15
+
+Seeds a throwaway SQLite database, copies it once per mode and starts
+gunicorn (threaded workers) on each copy: first with the default settings,
+then with SQLITE_PRODUCTION=1 (WAL and pragmas, BEGIN IMMEDIATE, the
+in-process write queue). Against each it holds --connections open, each
+either recording a sale through the sales form (--write-ratio of requests)
+or reading the today cards, the product options or the sales screen. It
+reports reads and writes per second, their latency percentiles and how many
+failed: a write fails when the form does not redirect, e.g. when the sale was
+refused with "database is locked".
+
+Needs gunicorn (requirements.txt).
+"""
+import argparse
+import asyncio
+import os
+import random
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import urlencode
+
+from _bootstrap import REPO_ROOT, percentile, setup_django
+from asgi_load import free_port, seed
+
+READS = ['/sales/today/', '/sales/products/', '/sales/new/']
+MODES = {'default': '0', 'production': '1'}
+
+
+def start_server(env, workers, threads):
+    port = free_port()
+    command = [sys.executable, '-m', 'gunicorn', 'tiles_automation.wsgi:application', '-k', 'gthread',
+               '-w', str(workers), '--threads', str(threads), '-b', f'127.0.0.1:{port}',
+               '--timeout', '120', '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process, port
+        except OSError:
+            if process.poll() is not None:
+                raise SystemExit(f"server exited with {process.returncode}")
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("server did not start")
+
+
+async def send(port, method, path, headers, body=b'', timeout=30.0):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        head = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+        writer.write(
+            f'{method} {path} HTTP/1.1\r\nHost: localhost\r\n{head}Content-Length: {len(body)}\r\n'
+            f'Connection: close\r\n\r\n'.encode() + body
+        )
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    return int(response.split(b' ', 2)[1]) if response.startswith(b'HTTP/') else 0
+
+
+async def run_load(port, cookie, product_ids, connections, duration, write_ratio, rng):
+    token = secrets.token_hex(16)
+    headers = {'Cookie': f'sessionid={cookie}; csrftoken={token}', 'X-CSRFToken': token}
+    timings = {'read': [], 'write': []}
+    failures = {'read': 0, 'write': 0}
+    stop = time.monotonic() + duration
+
+    def sale_form():
+        products = rng.sample(product_ids, 3)
+        return urlencode({
+            'client_key': uuid.uuid4().hex,
+            'customer_name': 'Bench',
+            'paid_amount': '90',
+            'product_ids[]': products,
+            'quantities[]': ['1'] * 3,
+            'rates[]': ['30'] * 3,
+        }, doseq=True).encode()
+
+    async def connection():
+        while time.monotonic() < stop:
+            kind = 'write' if rng.random() < write_ratio else 'read'
+            started = time.perf_counter()
+            try:
+                if kind == 'write':
+                    status = await send(port, 'POST', '/sales/new/', {
+                        **headers, 'Content-Type': 'application/x-www-form-urlencoded',
+                    }, sale_form())
+                else:
+                    status = await send(port, 'GET', rng.choice(READS), headers)
+            except (OSError, asyncio.TimeoutError):
+                status = 0
+            if status == (302 if kind == 'write' else 200):
+                timings[kind].append((time.perf_counter() - started) * 1000)
+            else:
+                failures[kind] += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(connection() for _ in range(connections)))
+    return timings, failures, time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help="Threads per worker.")
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=15.0, help="Seconds per mode.")
+    parser.add_argument('--write-ratio', type=float, default=0.3)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--sales', type=int, default=300)
+    parser.add_argument('--modes', default='default,production')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    # Each mode runs on its own copy: WAL mode stays set in a database file
+    database_url = setup_django()
+    source = database_url[len('sqlite:///'):]
+    started = time.perf_counter()
+    cookie = seed(args.products, args.sales, random.Random(args.seed))
+    print(f"Seeded {args.products} products and {args.sales} sales in {time.perf_counter() - started:.1f}s")
+
+    from django.db import connections
+    from inventory.models import Product
+
+    product_ids = list(Product.objects.values_list('id', flat=True))
+    connections.close_all()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in args.modes.split(','):
+            database = Path(workdir) / f'{mode}.sqlite3'
+            shutil.copy(source, database)
+            env = {
+                **os.environ,
+                'DATABASE_URL': f'sqlite:///{database}',
+                'SQLITE_PRODUCTION': MODES[mode],
+                'CACHE_LOCATION': str(Path(workdir) / f'{mode}-cache'),
+                'METRICS_DIR': str(Path(workdir) / f'{mode}-metrics'),
+                'PYTHONPATH': os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get('PYTHONPATH')])),
+            }
+            process, port = start_server(env, args.workers, args.threads)
+            try:
+                # Warm every worker's caches and connections
+                asyncio.run(run_load(port, cookie, product_ids, args.workers * args.threads, 1.0, 0.0,
+                                     random.Random(args.seed)))
+                timings, failures, elapsed = asyncio.run(run_load(
+                    port, cookie, product_ids, args.connections, args.duration, args.write_ratio,
+                    random.Random(args.seed),
+                ))
+            finally:
+                process.terminate()
+                process.wait()
+            for kind in ('read', 'write'):
+                print(
+                    f"{mode:>10} {kind}s: {len(timings[kind]) / elapsed:6.1f}/s, "
+                    f"p50 {percentile(timings[kind], 50):7.1f} ms, p95 {percentile(timings[kind], 95):7.1f} ms, "
+                    f"p99 {percentile(timings[kind], 99):7.1f} ms, {failures[kind]} failed"
+                )
+
+
+if __name__ == '__main__':
+    main()
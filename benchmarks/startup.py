@@ -0,0 +1,139 @@
+"""
+Cold start benchmark: import time and time to first response.
+
+    python benchmarks/startup.py --products 5000
+
+First runs ``python -X importtime`` over django.setup() and the WSGI
+application and lists the modules that take longest to import, counting what
+they import in turn. Then seeds a throwaway database and starts gunicorn with
+gunicorn.conf.py on it, once with the warm-up and once with WARM_UP=0, each
+time against an empty cache. For both it reports the seconds from launch
+until /healthz answers, and how long the first and second requests for the
+sales screen, the product picker and the sales summary take.
+
+Needs gunicorn (requirements.txt).
+"""
+import argparse
+import http.client
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from _bootstrap import REPO_ROOT, setup_django
+from asgi_load import free_port, seed
+
+PAGES = ['/sales/new/', '/sales/products/', '/sales/summary/']
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def import_times(env, top):
+    code = 'import django; django.setup(); import tiles_automation.wsgi'
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], cwd=REPO_ROOT, env=env,
+        capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            rows.append((int(match[2]), int(match[1]), len(match[3]) // 2, match[4]))
+    # Top-level imports (depth 0) add up to the whole start-up
+    total = sum(cumulative for cumulative, _, depth, _ in rows if depth == 0)
+    print(f"Imports: {len(rows)} modules, {total / 1000:.0f} ms")
+    for cumulative, own, _, name in sorted(rows, reverse=True)[:top]:
+        print(f"    {name:<48} {cumulative / 1000:7.1f} ms ({own / 1000:.1f} ms own)")
+
+
+def get(port, path, cookie):
+    started = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request('GET', path, headers={'Cookie': f'sessionid={cookie}'})
+        response = conn.getresponse()
+        response.read()
+    finally:
+        conn.close()
+    return response.status, (time.perf_counter() - started) * 1000
+
+
+def cold_start(env, cookie):
+    port = free_port()
+    launched = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'tiles_automation.wsgi:application', '-c', 'gunicorn.conf.py',
+         '--log-level', 'warning'],
+        cwd=REPO_ROOT, env={**env, 'PORT': str(port)},
+    )
+    try:
+        deadline = launched + 60
+        while True:
+            try:
+                status, _ = get(port, '/healthz', cookie)
+                if status == 200:
+                    break
+            except OSError:
+                pass
+            if process.poll() is not None:
+                raise SystemExit(f"server exited with {process.returncode}")
+            if time.perf_counter() > deadline:
+                raise SystemExit("server did not start")
+            time.sleep(0.05)
+        ready = time.perf_counter() - launched
+        timings = {}
+        for path in PAGES:
+            first = get(port, path, cookie)
+            second = get(port, path, cookie)
+            if first[0] != 200 or second[0] != 200:
+                raise SystemExit(f"{path} answered {first[0]}, {second[0]}")
+            timings[path] = (first[1], second[1])
+        return ready, timings
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--sales', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--runs', type=int, default=3, help="Cold starts of each kind.")
+    parser.add_argument('--top', type=int, default=15, help="Slowest imports to list.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help="Database to use instead of a throwaway SQLite file.")
+    args = parser.parse_args()
+
+    database_url = setup_django(args.database_url)
+    env = {
+        **os.environ,
+        'DATABASE_URL': database_url,
+        'WEB_CONCURRENCY': str(args.workers),
+        'PYTHONPATH': os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get('PYTHONPATH')])),
+    }
+    import_times(env, args.top)
+
+    started = time.perf_counter()
+    cookie = seed(args.products, args.sales, random.Random(args.seed))
+    print(f"Seeded {args.products} products and {args.sales} sales in {time.perf_counter() - started:.1f}s")
+
+    for warm_up in ('1', '0'):
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as cache_dir:
+                ready, timings = cold_start({
+                    **env,
+                    'WARM_UP': warm_up,
+                    'CACHE_LOCATION': cache_dir,
+                    'METRICS_DIR': str(Path(cache_dir) / 'metrics'),
+                }, cookie)
+            print(f"warm-up {'on ' if warm_up == '1' else 'off'}: healthz after {ready:.2f}s; " + ', '.join(
+                f"{path} {first:.0f}/{second:.0f} ms" for path, (first, second) in timings.items()
+            ))
+
+
+if __name__ == '__main__':
+    main()
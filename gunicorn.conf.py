@@ -0,0 +1,39 @@
+"""
+gunicorn settings, read from the working directory on start:
+
+    gunicorn tiles_automation.wsgi:application
+
+The application is imported once in the master (preload_app) and warmed up
+there before the workers fork, so they start with Django loaded, templates
+compiled and the catalog caches and search index filled. WARM_UP=0 skips the
+warm-up; WEB_CONCURRENCY, PORT and GUNICORN_WORKER_CLASS (e.g.
+uvicorn_worker.UvicornWorker with tiles_automation.asgi:application) follow
+the usual conventions.
+"""
+import os
+import shutil
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+
+
+def on_starting(server):
+    # Request metrics only ever grow; files of the previous run's workers must go
+    from inventory.metrics import metrics_dir
+
+    shutil.rmtree(metrics_dir(), ignore_errors=True)
+
+
+def when_ready(server):
+    if os.environ.get('WARM_UP', '1') == '0':
+        return
+    from inventory.warmup import warm_up
+
+    timings = warm_up()
+    server.log.info(
+        "Warm-up: %s",
+        ', '.join(f"{name} {'failed' if seconds is None else f'{seconds * 1000:.0f} ms'}" for name, seconds in timings.items()),
+    )
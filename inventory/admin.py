@@ -1,8 +1,17 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import Store, Product, Stock, Invoice, InvoiceItem, UserProfile, Supplier, Purchase, PurchaseItem, Location, InvoiceContact
-from django.db.models import Sum, Count, Max
+from .models import Store, Product, Stock, Invoice, InvoiceItem, UserProfile, Supplier, Purchase, PurchaseItem, Location, InvoiceContact, DailyStoreSales, StockMovement, ProductStats, Customer, CustomerPhone, Payment, CustomerBalance, ArchivedInvoice, ArchivedInvoiceItem, ArchivedInvoiceContact, ArchivedPayment, ArchivedPurchase, ArchivedPurchaseItem
+from .ledger import delete_stock, set_stock_quantity
+from .product_stats import ensure_stats
+from .customers import name_key
+from .catalog_import import CATALOG_COLUMNS, CatalogImportError, import_catalog
+from django.contrib import messages
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import render
+from django.urls import path
+from django.utils.html import format_html
+from . import thumbnails
 
 class UserProfileInline(admin.StackedInline):
     model = UserProfile
@@ -22,58 +31,179 @@ class StoreAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'size', 'unit', 'total_stock', 'purchase_count', 'last_purchase_date')
+    list_display = ('thumbnail', 'name', 'category', 'size', 'unit', 'total_stock', 'purchase_count', 'last_purchase_date')
+    list_display_links = ('thumbnail', 'name')
     list_filter = ('category', 'locations')
     search_fields = ('name',)
+    readonly_fields = ('image_preview',)
 
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        qs = qs.annotate(
-            total_stock=Sum('stock__quantity'),
-            purchase_count=Count('purchaseitem', distinct=True),
-            last_purchase_date=Max('purchaseitem__purchase__date'),
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            ensure_stats([obj.pk])
+        if 'image' in form.changed_data:
+            thumbnails.schedule([obj])
+
+    def thumbnail(self, obj):
+        if not obj.image:
+            return ''
+        return format_html(
+            '<picture><source srcset="{}" type="image/webp"><img src="{}" width="40" height="40" loading="lazy" alt="" style="object-fit: cover;"></picture>',
+            obj.thumbnail_webp_url, obj.thumbnail_url,
         )
-        return qs
+    thumbnail.short_description = ''
+
+    def image_preview(self, obj):
+        if not obj.image:
+            return '-'
+        return format_html('<img src="{}" style="max-width: 240px;" alt="">', obj.preview_webp_url)
+    image_preview.short_description = 'Preview'
+
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name='inventory_product_import'),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            raise PermissionDenied
+        result = None
+        if request.method == 'POST' and request.FILES.get('catalog_file'):
+            upload = request.FILES['catalog_file']
+            try:
+                result = import_catalog(upload, upload.name, dry_run=bool(request.POST.get('dry_run')))
+            except CatalogImportError as e:
+                messages.error(request, str(e))
+            except Exception as e:
+                messages.error(request, f"Error importing catalog: {str(e)}")
+            else:
+                if not result.dry_run:
+                    messages.success(request, result.summary())
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import catalog',
+            'columns': CATALOG_COLUMNS,
+            'result': result,
+        }
+        return render(request, 'admin/inventory/product/import_catalog.html', context)
+
+    def get_queryset(self, request):
+        # Totals come from ProductStats, so sorting on them is an indexed read
+        return super().get_queryset(request).select_related('stats')
+
+    def _stats(self, obj):
+        try:
+            return obj.stats
+        except ProductStats.DoesNotExist:
+            return ProductStats(product=obj)
 
     def total_stock(self, obj):
-        return obj.total_stock or 0
-    total_stock.admin_order_field = 'total_stock'
+        return self._stats(obj).total_stock
+    total_stock.admin_order_field = 'stats__total_stock'
     total_stock.short_description = 'Stock Qty (All)'
 
     def purchase_count(self, obj):
-        return obj.purchase_count or 0
-    purchase_count.admin_order_field = 'purchase_count'
+        return self._stats(obj).purchase_count
+    purchase_count.admin_order_field = 'stats__purchase_count'
     purchase_count.short_description = 'Times Purchased'
 
     def last_purchase_date(self, obj):
-        return obj.last_purchase_date
-    last_purchase_date.admin_order_field = 'last_purchase_date'
+        return self._stats(obj).last_purchase_date
+    last_purchase_date.admin_order_field = 'stats__last_purchase_date'
     last_purchase_date.short_description = 'Last Purchase'
 
 @admin.register(Stock)
 class StockAdmin(admin.ModelAdmin):
     list_display = ('product', 'store', 'quantity')
     list_filter = ('store',)
+    list_select_related = ('product', 'store')
     
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "store":
             kwargs["queryset"] = Store.objects.filter(store_type='GODOWN')
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
+    def get_readonly_fields(self, request, obj=None):
+        # Moving a stock row to another product or store would bypass the ledger
+        if obj:
+            return ('product', 'store')
+        return ()
+
+    # Manual edits are recorded in the stock ledger as adjustments
+    def save_model(self, request, obj, form, change):
+        set_stock_quantity(obj, obj.quantity, note=f"Admin edit by {request.user.username}")
+
+    def delete_model(self, request, obj):
+        delete_stock(obj, note=f"Admin delete by {request.user.username}")
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            delete_stock(obj, note=f"Admin delete by {request.user.username}")
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'product', 'store', 'kind', 'quantity', 'invoice', 'purchase', 'note')
+    list_filter = ('kind', 'store')
+    list_select_related = ('product', 'store', 'invoice', 'purchase__supplier')
+    search_fields = ('product__name', 'note')
+    date_hierarchy = 'created_at'
+
+    # The ledger is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 class InvoiceItemInline(admin.TabularInline):
+    # Items were taken from stock by services.record_sale; editing them here would bypass the ledger
     model = InvoiceItem
     extra = 0
     fields = ('product', 'quantity', 'rate', 'location')
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 class InvoiceContactInline(admin.TabularInline):
     model = InvoiceContact
     extra = 0
 
+class PaymentInline(admin.TabularInline):
+    # Payments go through services.record_payment so invoice and customer balances stay in step
+    model = Payment
+    extra = 0
+    fields = ('date', 'amount', 'method', 'note', 'recorded_by')
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
-    list_display = ('id', 'customer_name', 'customer_phones', 'store', 'date', 'total_amount', 'paid_amount')
+    list_display = ('id', 'customer_name', 'customer_phones', 'store', 'date', 'total_amount', 'paid_amount', 'due_amount')
     list_filter = ('store', 'date')
-    inlines = [InvoiceItemInline, InvoiceContactInline]
+    list_select_related = ('store',)
+    # Amounts, store and customer feed the rollups and customer balances; only the contact details are editable
+    readonly_fields = ('store', 'customer', 'date', 'total_amount', 'paid_amount', 'due_amount')
+    inlines = [InvoiceItemInline, InvoiceContactInline, PaymentInline]
+
+    # Sales are recorded and stock taken by services.record_sale
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('contacts')
 
     def customer_phones(self, obj):
         others = ', '.join(c.mobile for c in obj.contacts.all())
@@ -82,7 +212,149 @@ class InvoiceAdmin(admin.ModelAdmin):
         return obj.customer_mobile or others or ''
     customer_phones.short_description = 'Mobile Numbers'
 
+@admin.register(DailyStoreSales)
+class DailyStoreSalesAdmin(admin.ModelAdmin):
+    list_display = ('day', 'store', 'sales_total', 'paid_total', 'invoice_count', 'purchase_total')
+    list_filter = ('store',)
+    list_select_related = ('store',)
+    date_hierarchy = 'day'
+
+class CustomerPhoneInline(admin.TabularInline):
+    model = CustomerPhone
+    extra = 0
+
+@admin.register(Customer)
+class CustomerAdmin(admin.ModelAdmin):
+    list_display = ('name', 'phone_numbers', 'created_at')
+    search_fields = ('name_key', 'phones__number')
+    readonly_fields = ('name_key',)
+    inlines = [CustomerPhoneInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('phones')
+
+    def phone_numbers(self, obj):
+        return ', '.join(p.number for p in obj.phones.all())
+
+    def save_model(self, request, obj, form, change):
+        obj.name_key = name_key(obj.name)
+        super().save_model(request, obj, form, change)
+
+@admin.register(Payment)
+class PaymentAdmin(admin.ModelAdmin):
+    list_display = ('date', 'invoice', 'amount', 'method', 'recorded_by', 'note')
+    list_filter = ('method',)
+    list_select_related = ('invoice', 'recorded_by')
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(CustomerBalance)
+class CustomerBalanceAdmin(admin.ModelAdmin):
+    list_display = ('customer', 'invoice_count', 'billed', 'paid', 'balance', 'last_payment_at')
+    list_select_related = ('customer',)
+    ordering = ('-balance',)
+    search_fields = ('customer__name_key',)
+
+    # Maintained by services; rebuild with manage.py rebuild_receivables
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 admin.site.register(Supplier)
-admin.site.register(Purchase)
-admin.site.register(PurchaseItem)
+
+class PurchaseItemInline(admin.TabularInline):
+    model = PurchaseItem
+    extra = 0
+    fields = ('product', 'quantity', 'rate')
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+@admin.register(Purchase)
+class PurchaseAdmin(admin.ModelAdmin):
+    list_display = ('id', 'supplier', 'invoice_number', 'date', 'total_amount')
+    list_select_related = ('supplier',)
+    # Items and totals feed godown stock, the purchase rollups and ProductStats; only the supplier's details are editable
+    readonly_fields = ('date', 'total_amount')
+    inlines = [PurchaseItemInline]
+
+    # Purchases are recorded by services.record_purchase
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(PurchaseItem)
+class PurchaseItemAdmin(admin.ModelAdmin):
+    list_display = ('purchase', 'product', 'quantity', 'rate')
+    list_select_related = ('product', 'purchase__supplier')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 admin.site.register(Location)
+
+
+class ArchiveReadOnly:
+    # Rows are moved here by manage.py archive_history and are never edited
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class ArchivedInvoiceItemInline(ArchiveReadOnly, admin.TabularInline):
+    model = ArchivedInvoiceItem
+    fields = ('product', 'quantity', 'rate', 'location')
+
+class ArchivedInvoiceContactInline(ArchiveReadOnly, admin.TabularInline):
+    model = ArchivedInvoiceContact
+
+class ArchivedPaymentInline(ArchiveReadOnly, admin.TabularInline):
+    model = ArchivedPayment
+    fields = ('date', 'amount', 'method', 'note', 'recorded_by')
+
+@admin.register(ArchivedInvoice)
+class ArchivedInvoiceAdmin(ArchiveReadOnly, admin.ModelAdmin):
+    list_display = ('id', 'customer_name', 'customer_mobile', 'store', 'date', 'total_amount', 'paid_amount')
+    list_filter = ('store',)
+    list_select_related = ('store',)
+    search_fields = ('=id', 'customer_mobile', 'customer_name')
+    date_hierarchy = 'date'
+    inlines = [ArchivedInvoiceItemInline, ArchivedInvoiceContactInline, ArchivedPaymentInline]
+
+class ArchivedPurchaseItemInline(ArchiveReadOnly, admin.TabularInline):
+    model = ArchivedPurchaseItem
+
+@admin.register(ArchivedPurchase)
+class ArchivedPurchaseAdmin(ArchiveReadOnly, admin.ModelAdmin):
+    list_display = ('id', 'supplier', 'invoice_number', 'date', 'total_amount')
+    list_select_related = ('supplier',)
+    search_fields = ('=id', 'invoice_number', 'supplier__name')
+    date_hierarchy = 'date'
+    inlines = [ArchivedPurchaseItemInline]
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class InventoryConfig(AppConfig):
     name = 'inventory'
+
+    def ready(self):
+        # Connects the cache invalidation, sync version, search index and query metrics signals
+        from . import catalog_cache, catalog_sync, metrics, product_search  # noqa: F401
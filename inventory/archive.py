@@ -0,0 +1,119 @@
+"""
+Archival of closed financial years.
+
+Invoices (settled ones only) and purchases dated before a cutoff, by default
+the start of the current financial year, are moved with their items,
+contacts and payments into the Archived* tables, keeping their ids. Each
+chunk is copied and deleted in one short transaction, so the shop keeps
+selling while ``manage.py archive_history`` runs. Invoices with money still
+due stay in Invoice so payments can be recorded against them.
+
+Stock movements of archived invoices and purchases lose their link (the
+foreign keys are SET_NULL) and get a note naming the archived row instead.
+Rollups and customer balances are unchanged; the rebuild functions read the
+archive tables as well, and so do the exports and customer search.
+"""
+import time
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+
+from .models import (
+    ArchivedInvoice, ArchivedInvoiceContact, ArchivedInvoiceItem, ArchivedPayment, ArchivedPurchase,
+    ArchivedPurchaseItem, Invoice, InvoiceContact, InvoiceItem, Payment, Purchase, PurchaseItem, StockMovement,
+)
+from .reports import day_bounds
+from .services import retry_on_lock
+
+# Invoices or purchases per transaction; a chunk of 200 holds the SQLite write lock for ~0.2s
+ARCHIVE_CHUNK_SIZE = 200
+DEFAULT_FINANCIAL_YEAR_START_MONTH = 4
+
+
+def financial_year_start(day=None):
+    """First day of the financial year containing ``day`` (default: today)."""
+    day = day or timezone.localdate()
+    month = getattr(settings, 'FINANCIAL_YEAR_START_MONTH', DEFAULT_FINANCIAL_YEAR_START_MONTH)
+    year = day.year if day.month >= month else day.year - 1
+    return date(year, month, 1)
+
+
+def _start(day):
+    return day_bounds(day, day)[0]
+
+
+def archivable_invoices(before):
+    return Invoice.objects.filter(date__lt=_start(before), due_amount=0)
+
+
+def archivable_purchases(before):
+    return Purchase.objects.filter(date__lt=_start(before))
+
+
+def _copy(queryset, archive_model):
+    # Archive tables have the same column names as the tables they mirror
+    fields = [field.attname for field in queryset.model._meta.concrete_fields]
+    archive_model.objects.bulk_create(
+        [archive_model(**row) for row in queryset.values(*fields)], batch_size=ARCHIVE_CHUNK_SIZE,
+    )
+
+
+def _note_archived(link, ids, label):
+    StockMovement.objects.filter(**{f'{link}_id__in': ids}, note='').update(
+        note=Concat(Value(f'Archived {label} #'), Cast(f'{link}_id', CharField()))
+    )
+
+
+@retry_on_lock
+def _archive_invoice_chunk(before, size):
+    with transaction.atomic():
+        ids = list(archivable_invoices(before).order_by('id').values_list('id', flat=True)[:size])
+        if ids:
+            _copy(Invoice.objects.filter(id__in=ids), ArchivedInvoice)
+            _copy(InvoiceItem.objects.filter(invoice_id__in=ids), ArchivedInvoiceItem)
+            _copy(InvoiceContact.objects.filter(invoice_id__in=ids), ArchivedInvoiceContact)
+            _copy(Payment.objects.filter(invoice_id__in=ids), ArchivedPayment)
+            _note_archived('invoice', ids, 'invoice')
+            Invoice.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+@retry_on_lock
+def _archive_purchase_chunk(before, size):
+    with transaction.atomic():
+        ids = list(archivable_purchases(before).order_by('id').values_list('id', flat=True)[:size])
+        if ids:
+            _copy(Purchase.objects.filter(id__in=ids), ArchivedPurchase)
+            _copy(PurchaseItem.objects.filter(purchase_id__in=ids), ArchivedPurchaseItem)
+            _note_archived('purchase', ids, 'purchase')
+            Purchase.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def _archive(chunk, before, size, pause, progress):
+    if size <= 0:
+        raise ValueError("The chunk size must be a positive number.")
+    total = 0
+    while True:
+        moved = chunk(before, size)
+        total += moved
+        if progress and moved:
+            progress(total)
+        if moved < size:
+            return total
+        # Let counters' sales in between chunks
+        time.sleep(pause)
+
+
+def archive_invoices(before, size=ARCHIVE_CHUNK_SIZE, pause=0.0, progress=None):
+    """Move settled invoices dated before ``before`` to the archive; returns how many."""
+    return _archive(_archive_invoice_chunk, before, size, pause, progress)
+
+
+def archive_purchases(before, size=ARCHIVE_CHUNK_SIZE, pause=0.0, progress=None):
+    """Move purchases dated before ``before`` to the archive; returns how many."""
+    return _archive(_archive_purchase_chunk, before, size, pause, progress)
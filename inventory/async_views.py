@@ -0,0 +1,178 @@
+"""
+Read-only views written as coroutines.
+
+Under ASGI (tiles_automation.asgi) these wait on the database without holding
+a worker, so slow reports and catalog fetches no longer queue everything else
+behind them; under WSGI Django runs them to completion as before. Writes (sales,
+purchases, payments) stay in views.py on the sync path.
+
+Django runs each request's ORM calls on one thread, so the aggregates gathered
+below overlap their waiting with other requests rather than with each other.
+Helpers that only have a sync API (the catalog cache, keyset pages) are called
+through sync_to_async, and templates render there too because the context
+processors read the session.
+"""
+import asyncio
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django.db.models import Prefetch, Sum
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import render
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+
+from .models import DailyStoreSales, Invoice, InvoiceItem, Store, UserProfile
+from . import catalog_cache, catalog_sync, product_search, reports, rollups
+
+
+async def _render(request, template_name, context):
+    # Reuse the user the async login check loaded instead of reading it again
+    request.user = await request.auser()
+    return await sync_to_async(render)(request, template_name, context)
+
+
+def _product_options_etag(request):
+    return '"%s"' % catalog_cache.versions(catalog_cache.CATALOG, catalog_cache.STOCK)
+
+
+def _product_options_last_modified(request):
+    newest = max(catalog_cache.version(catalog_cache.CATALOG), catalog_cache.version(catalog_cache.STOCK))
+    return datetime.fromtimestamp(newest / 1000, tz=dt_timezone.utc)
+
+
+@login_required
+@gzip_page
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_product_options_etag, last_modified_func=_product_options_last_modified)
+async def product_options(request):
+    # Browsers revalidate on every page view and get a 304 until the catalog or stock changes
+    return HttpResponse(await sync_to_async(catalog_cache.product_options)())
+
+
+@login_required
+@gzip_page
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_product_options_etag)
+async def catalog_api(request):
+    """
+    The picker's catalog as JSON: everything, or with ``?since=<version>``
+    only what changed after an earlier response's ``version``.
+    """
+    # Taken before reading, so nothing written meanwhile is skipped next time
+    version = catalog_sync.now_version()
+    since = request.GET.get('since', '')
+    if since.isdigit() and int(since) > 0:
+        data = {'full': False, **await sync_to_async(catalog_sync.catalog_delta)(int(since))}
+    else:
+        data = {'full': True, **await sync_to_async(catalog_sync.full_catalog)()}
+    return JsonResponse({'version': version, **data})
+
+
+@login_required
+async def product_search_view(request):
+    results = await sync_to_async(product_search.search_products)(request.GET.get('q', ''))
+    return JsonResponse({'products': results})
+
+
+@login_required
+async def today_totals(request):
+    """The sales screen's today cards for the user's store, refreshed after offline sales sync."""
+    user = await request.auser()
+    store_id = await UserProfile.objects.filter(user=user).values_list('store_id', flat=True).afirst()
+    totals = await rollups.adaily_totals(store_id, timezone.localdate())
+    return JsonResponse({
+        'sales': totals.sales_total,
+        'received': totals.paid_total,
+        'due': totals.due_total,
+    })
+
+
+async def _totals_by_store(first_day, last_day, selected_store):
+    # Totals come from the per-store daily rollup, grouped per store in one query
+    day_rows = DailyStoreSales.objects.filter(day__gte=first_day, day__lte=last_day)
+    if selected_store:
+        day_rows = day_rows.filter(store=selected_store)
+    rows = day_rows.values('store').annotate(
+        sales=Sum('sales_total'),
+        paid=Sum('paid_total'),
+        invoices=Sum('invoice_count'),
+        purchases=Sum('purchase_total'),
+    ).order_by()
+    return {row['store']: row async for row in rows}
+
+
+async def _invoice_pages(start, end, selected_store, cursor):
+    # Detailed Invoices per Store: one windowed query for every store's first page,
+    # over a half-open range on (store, date) so the composite index applies
+    invoices = Invoice.objects.filter(date__gte=start, date__lt=end).prefetch_related(
+        Prefetch('items', queryset=InvoiceItem.objects.select_related('product', 'location').only(
+            'invoice', 'quantity', 'rate', 'product__name', 'product__size', 'location__name',
+        ))
+    )
+    if selected_store:
+        invoices = invoices.filter(store=selected_store)
+    return await sync_to_async(reports.keyset_pages_by_store)(invoices, cursor)
+
+
+@staff_member_required
+async def sales_summary(request):
+    first_day, last_day = reports.summary_period(request.GET)
+    start, end = reports.day_bounds(first_day, last_day)
+    stores = [store async for store in Store.objects.all()]
+    selected_store = next((st for st in stores if str(st.id) == request.GET.get('store')), None)
+    cursor = reports.decode_cursor(request.GET.get('before'))
+
+    totals_by_store, pages = await asyncio.gather(
+        _totals_by_store(first_day, last_day, selected_store),
+        _invoice_pages(start, end, selected_store, cursor),
+    )
+    total_sales = sum(row['sales'] for row in totals_by_store.values())
+    total_paid = sum(row['paid'] for row in totals_by_store.values())
+    total_due = total_sales - total_paid
+    total_invoices = sum(row['invoices'] for row in totals_by_store.values())
+
+    # Purchases (Expenses)
+    total_purchases = sum(row['purchases'] for row in totals_by_store.values())
+    net_profit = total_sales - total_purchases
+
+    store_sections = []
+    for store in stores:
+        if store.store_type != 'DISPLAY' or (selected_store and store != selected_store):
+            continue
+        totals = totals_by_store.get(store.id, {})
+        store_invoices, next_cursor = pages.get(store.id, ([], None))
+        store_sections.append({
+            'store': store,
+            'sales': totals.get('sales') or 0,
+            'paid': totals.get('paid') or 0,
+            'invoice_count': totals.get('invoices') or 0,
+            'invoices': store_invoices,
+            'next_cursor': next_cursor,
+        })
+
+    context = {
+        'first_day': first_day,
+        'last_day': last_day,
+        'stores': stores,
+        'selected_store': selected_store,
+        'total_sales': total_sales,
+        'total_paid': total_paid,
+        'total_due': total_due,
+        'total_invoices': total_invoices,
+        'total_purchases': total_purchases,
+        'net_profit': net_profit,
+        'store_sections': store_sections,
+        'export_choices': [
+            ('invoices', 'Invoices'),
+            ('invoice-items', 'Invoice items'),
+            ('invoice-contacts', 'Invoice contacts'),
+            ('purchases', 'Purchases'),
+            ('purchase-items', 'Purchase items'),
+        ],
+    }
+    return await _render(request, 'inventory/sales_summary.html', context)
@@ -0,0 +1,201 @@
+"""
+Versioned cache for the data every sales screen needs: the product catalog,
+the location names, the godown and its stock.
+
+Each value is stored under ``<name>:<version>``. The catalog version is bumped
+by signals when a Product, Location or Store changes (and explicitly by code
+that writes them with bulk queries); the stock version by Stock signals and by
+the ledger, whose UPDATEs send no signals. Versions are millisecond
+timestamps, so a version key lost from the cache comes back newer than any
+value stored under the old one. Stock is also given a short TTL as a backstop.
+
+Bumps run at once and again when the transaction commits, so a request that
+rebuilds a value between the two cannot keep serving pre-commit data.
+
+Values live in the ``CATALOG_CACHE`` cache (settings), and each process keeps
+the last value it read in memory, so a hit costs one version read.
+Callers must treat returned values as read-only.
+"""
+import threading
+import time
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import groupby
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.core.files.storage import default_storage
+from django.utils.html import escape
+
+from .models import Location, Product, Stock, Store
+from . import thumbnails
+
+CATALOG = 'catalog'
+STOCK = 'stock'
+DEFAULT_STOCK_TTL = 30
+WHOLE = Decimal('1')
+
+_lock = threading.Lock()
+# name -> (version, expires at or None, value)
+_local = {}
+
+
+def cache():
+    return caches[getattr(settings, 'CATALOG_CACHE', 'default')]
+
+
+def stock_ttl():
+    return getattr(settings, 'STOCK_CACHE_TTL', DEFAULT_STOCK_TTL)
+
+
+def version(kind):
+    key = f'{kind}:version'
+    value = cache().get(key)
+    if value is None:
+        value = int(time.time() * 1000)
+        if not cache().add(key, value, None):
+            value = cache().get(key, value)
+    return value
+
+
+def _bump(kind):
+    key = f'{kind}:version'
+    cache().set(key, max(int(time.time() * 1000), (cache().get(key) or 0) + 1), None)
+
+
+def bump(kind):
+    """Invalidate everything cached under ``kind`` (CATALOG or STOCK), now and on commit."""
+    _bump(kind)
+    transaction.on_commit(lambda: _bump(kind))
+
+
+def versions(*kinds):
+    return '-'.join(str(version(kind)) for kind in kinds)
+
+
+def cached(name, kind, build, timeout=None):
+    """
+    ``build()``, cached under the current version of ``kind`` (or of every
+    kind in a tuple) for ``timeout`` seconds (None: until bumped).
+    """
+    current = versions(*kind) if isinstance(kind, tuple) else version(kind)
+    now = time.monotonic()
+    with _lock:
+        hit = _local.get(name)
+    if hit and hit[0] == current and (hit[1] is None or hit[1] > now):
+        return hit[2]
+    key = f'{name}:{current}'
+    value = cache().get(key)
+    if value is None:
+        value = build()
+        cache().set(key, value, timeout)
+    with _lock:
+        _local[name] = (current, now + timeout if timeout else None, value)
+    return value
+
+
+def clear():
+    cache().clear()
+    with _lock:
+        _local.clear()
+
+
+def _image_url(row, ext):
+    # Same as Product.thumbnail_url, without building model instances
+    if not row['image']:
+        return ''
+    if not row['image_hash']:
+        return default_storage.url(row['image'])
+    return thumbnails.derivative_url(row['image_hash'], 'thumb', ext)
+
+
+def product_dicts(products):
+    """Products of the ``products`` queryset as dicts for the sales screen, in its order."""
+    location_ids = {}
+    links = Product.locations.through.objects.filter(product__in=products.values('id'))
+    for product_id, location_id in links.values_list('product_id', 'location_id'):
+        location_ids.setdefault(product_id, []).append(location_id)
+    categories = dict(Product.CATEGORY_CHOICES)
+    rows = products.values('id', 'name', 'size', 'category', 'unit', 'image', 'image_hash')
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'size': row['size'],
+            'category': row['category'],
+            'category_display': categories.get(row['category'], row['category']),
+            'unit': row['unit'],
+            'thumbnail_url': _image_url(row, 'jpg'),
+            'thumbnail_webp_url': _image_url(row, 'webp'),
+            'location_ids': ','.join(map(str, sorted(location_ids.get(row['id'], [])))),
+        }
+        for row in rows
+    ]
+
+
+def catalog():
+    """Every product as a dict for the sales screen, ordered by category and name."""
+    return cached('catalog:products', CATALOG, lambda: product_dicts(Product.objects.order_by('category', 'name')))
+
+
+def locations():
+    return cached('catalog:locations', CATALOG, lambda: list(Location.objects.order_by('id').values('id', 'name')))
+
+
+def godown():
+    """The Central Godown Store, or None."""
+    # Wrapped in a tuple because None means a miss to the cache
+    return cached('catalog:godown', CATALOG, lambda: (Store.objects.filter(store_type='GODOWN').first(),))[0]
+
+
+def godown_stock():
+    """{product_id: quantity} in the godown."""
+    store = godown()
+    if store is None:
+        return {}
+    return cached(
+        f'stock:godown:{store.pk}', STOCK,
+        lambda: dict(Stock.objects.filter(store=store).values_list('product_id', 'quantity')),
+        stock_ttl(),
+    )
+
+
+def _render_product_options():
+    stock = godown_stock()
+    parts = []
+    for category, products in groupby(catalog(), key=lambda p: p['category_display']):
+        parts.append(f'<optgroup label="{escape(category)}">')
+        for p in products:
+            quantity = stock.get(p['id'], Decimal('0'))
+            size = f' ({escape(p["size"])})' if p['size'] else ''
+            parts.append(
+                f'<option value="{p["id"]}" data-image="{escape(p["thumbnail_url"])}"'
+                f' data-image-webp="{escape(p["thumbnail_webp_url"])}" data-location-ids="{p["location_ids"]}"'
+                f' data-stock="{quantity}">{escape(p["name"])}{size} - Stock: {quantity.quantize(WHOLE, ROUND_HALF_UP)}</option>'
+            )
+        parts.append('</optgroup>')
+    return ''.join(parts)
+
+
+def product_options():
+    """
+    The sales screen's product <option>s, grouped by category and showing
+    godown stock, rendered once per catalog and stock version.
+    """
+    return cached('catalog:product_options', (CATALOG, STOCK), _render_product_options, stock_ttl())
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Location)
+@receiver([post_save, post_delete], sender=Store)
+@receiver(m2m_changed, sender=Product.locations.through)
+def catalog_changed(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        bump(CATALOG)
+
+
+@receiver([post_save, post_delete], sender=Stock)
+def stock_changed(sender, **kwargs):
+    bump(STOCK)
@@ -0,0 +1,321 @@
+"""
+Bulk product catalog import.
+
+Reads a CSV file, or a ZIP holding one CSV plus the images it names, and
+upserts products keyed on (name, size) in batches: new products are
+bulk-created, changed ones bulk-updated, locations and product-location links
+bulk-inserted, and images are decoded, stored and thumbnailed by a thread pool
+while the batch is written. Used by ``manage.py import_catalog`` and the "Import
+catalog" page in the product admin.
+"""
+import csv
+import hashlib
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.text import slugify
+from PIL import Image, UnidentifiedImageError
+
+from .models import Product, Location
+from .product_stats import ensure_stats
+from .thumbnails import build_derivatives
+from . import catalog_cache
+from .catalog_sync import now_version
+
+CATALOG_COLUMNS = "name, size, category, unit, description, locations (separated by ;), image (file name inside the ZIP)"
+UPDATABLE_FIELDS = ('category', 'unit', 'description')
+IMPORT_BATCH_SIZE = 500
+IMAGE_WORKERS = 4
+# Changes listed in the dry-run diff; the counts always cover every row.
+MAX_LISTED_CHANGES = 200
+
+
+class CatalogImportError(Exception):
+    """Raised for a catalog file that cannot be imported at all."""
+
+
+class ImportResult:
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.locations_created = 0
+        self.links_created = 0
+        self.images_stored = 0
+        self.changes = []
+        self.errors = []
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def note_change(self, text):
+        if len(self.changes) < MAX_LISTED_CHANGES:
+            self.changes.append(text)
+
+    def summary(self):
+        verb = "would be" if self.dry_run else "were"
+        return (
+            f"{self.rows} row(s) in {self.seconds:.1f}s ({self.rows_per_second:.0f} rows/s): "
+            f"{self.created} product(s) {verb} created, {self.updated} updated, {self.unchanged} unchanged; "
+            f"{self.locations_created} new location(s), {self.links_created} new location link(s), "
+            f"{self.images_stored} image(s); {len(self.errors)} error(s)."
+        )
+
+
+def _category_codes():
+    codes = {}
+    for code, label in Product.CATEGORY_CHOICES:
+        codes[code.lower()] = code
+        codes[label.lower()] = code
+    return codes
+
+
+def _open_catalog(fileobj, filename):
+    """Return (text stream of the CSV, ZipFile or None)."""
+    if filename.lower().endswith('.zip'):
+        try:
+            archive = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile:
+            raise CatalogImportError("The ZIP file is damaged or not a ZIP file.")
+        members = [n for n in archive.namelist() if n.lower().endswith('.csv') and not n.startswith('__MACOSX/')]
+        if len(members) != 1:
+            raise CatalogImportError("The ZIP file must contain exactly one CSV file.")
+        return io.TextIOWrapper(archive.open(members[0]), encoding='utf-8-sig', newline=''), archive
+    return io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''), None
+
+
+def read_catalog_rows(text, result):
+    """Yield (line_number, row) for each usable CSV row; problems go to ``result.errors``."""
+    reader = csv.DictReader(text)
+    fields = {(f or '').strip().lower() for f in reader.fieldnames or []}
+    if not {'name', 'size'} <= fields:
+        raise CatalogImportError(f"The CSV header must contain at least name and size. Columns: {CATALOG_COLUMNS}.")
+    categories = _category_codes()
+    for row in reader:
+        row = {(k or '').strip().lower(): (v or '').strip() for k, v in row.items()}
+        if not any(row.values()):
+            continue
+        if not row.get('name') or not row.get('size'):
+            result.errors.append(f"line {reader.line_num}: name and size are required")
+            continue
+        category = row.get('category', '')
+        if category and category.lower() not in categories:
+            result.errors.append(f"line {reader.line_num}: unknown category {category!r}")
+            continue
+        row['category'] = categories.get(category.lower(), '')
+        row['locations'] = [n.strip() for n in row.get('locations', '').split(';') if n.strip()]
+        yield reader.line_num, row
+
+
+def _image_digest(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _store_image(product_name, data, original_name):
+    """
+    Decode ``data`` to make sure it is an image, then save it and its
+    thumbnails. Runs in the worker pool; returns (name, image_hash).
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise CatalogImportError(f"{original_name}: not a valid image ({e})")
+    digest = _image_digest(data)
+    ext = os.path.splitext(original_name)[1].lower() or '.jpg'
+    name = default_storage.save(f'product_images/{slugify(product_name)}-{digest}{ext}', ContentFile(data))
+    return name, build_derivatives(name)
+
+
+class CatalogImporter:
+    def __init__(self, dry_run=False, batch_size=IMPORT_BATCH_SIZE, workers=IMAGE_WORKERS):
+        self.result = ImportResult(dry_run)
+        self.batch_size = batch_size
+        self.workers = workers
+        # What earlier batches of a dry run would have created, for later batches to compare with
+        self.dry_run_created = {}
+        self.dry_run_links = {}
+        self.dry_run_locations = set()
+
+    def run(self, fileobj, filename):
+        started = time.perf_counter()
+        text, archive = _open_catalog(fileobj, filename)
+        self.archive = archive
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            self.pool = pool
+            batch = {}
+            for line_num, row in read_catalog_rows(text, self.result):
+                self.result.rows += 1
+                # Later rows for the same (name, size) win
+                batch[(row['name'], row['size'])] = (line_num, row)
+                if len(batch) >= self.batch_size:
+                    self.import_batch(batch)
+                    batch = {}
+            if batch:
+                self.import_batch(batch)
+        self.result.seconds = time.perf_counter() - started
+        return self.result
+
+    def import_batch(self, batch):
+        names = {name for name, _ in batch}
+        existing = {
+            (p.name, p.size): p
+            for p in Product.objects.filter(name__in=names).prefetch_related('locations')
+            if (p.name, p.size) in batch
+        }
+
+        if self.result.dry_run:
+            # Created by an earlier batch of this dry run
+            existing.update((key, self.dry_run_created[key]) for key in batch if key in self.dry_run_created)
+
+        new_products, changed_products = [], []
+        for key, (line_num, row) in batch.items():
+            product = existing.get(key)
+            if product is None:
+                self.result.created += 1
+                self.result.note_change(f"+ {row['name']} ({row['size']})")
+                product = Product(
+                    name=row['name'], size=row['size'], category=row['category'] or 'TILES',
+                    unit=row.get('unit') or 'sqft', description=row.get('description') or None,
+                )
+                new_products.append(product)
+                if self.result.dry_run:
+                    self.dry_run_created[key] = product
+                continue
+            diffs = []
+            for field in UPDATABLE_FIELDS:
+                value = row.get(field)
+                # Blank cells leave the current value alone
+                if not value:
+                    continue
+                if getattr(product, field) != value:
+                    diffs.append(f"{field} {getattr(product, field)!r} -> {value!r}")
+                    setattr(product, field, value)
+            if diffs:
+                self.result.updated += 1
+                self.result.note_change(f"~ {row['name']} ({row['size']}): " + ", ".join(diffs))
+                changed_products.append(product)
+            else:
+                self.result.unchanged += 1
+
+        links = self.missing_links(batch, existing)
+        image_jobs = self.submit_images(batch, existing)
+
+        if self.result.dry_run:
+            self.resolve_locations(batch, create=False)
+            for key, name in links:
+                self.dry_run_links.setdefault(key, set()).add(name)
+            self.result.links_created += len(links)
+            self.result.images_stored += len(image_jobs)
+            return
+
+        with transaction.atomic():
+            Product.objects.bulk_create(new_products, batch_size=self.batch_size)
+            Product.objects.bulk_update(changed_products, UPDATABLE_FIELDS, batch_size=self.batch_size)
+            if new_products:
+                # Fetch the new ids rather than relying on bulk_create returning them
+                products = {
+                    (p.name, p.size): p
+                    for p in Product.objects.filter(name__in={p.name for p in new_products})
+                    if (p.name, p.size) in batch
+                }
+                products.update(existing)
+                existing = products
+                ensure_stats([p.pk for p in existing.values()])
+            self.link_locations(batch, links, existing)
+
+            stored = []
+            for key, future in image_jobs:
+                try:
+                    existing[key].image, existing[key].image_hash = future.result()
+                    stored.append(existing[key])
+                except CatalogImportError as e:
+                    self.result.errors.append(f"line {batch[key][0]}: {e}")
+            Product.objects.bulk_update(stored, ['image', 'image_hash'], batch_size=self.batch_size)
+            self.result.images_stored += len(stored)
+
+            # Bulk writes send no signals
+            touched = {p.pk for p in changed_products + stored} | {existing[key].pk for key, _ in links}
+            touched.update(existing[(p.name, p.size)].pk for p in new_products)
+            Product.objects.filter(pk__in=touched).update(version=now_version())
+            catalog_cache.bump(catalog_cache.CATALOG)
+
+    def submit_images(self, batch, existing):
+        """Start decoding and saving this batch's images; returns [(key, future)]."""
+        jobs = []
+        if not self.archive:
+            return jobs
+        for key, (line_num, row) in batch.items():
+            image_name = row.get('image')
+            if not image_name:
+                continue
+            try:
+                data = self.archive.read(image_name)
+            except KeyError:
+                self.result.errors.append(f"line {line_num}: image {image_name!r} is not in the ZIP file")
+                continue
+            product = existing.get(key)
+            # Stored names carry a content hash, so re-importing the same picture is a no-op
+            if product and product.image and _image_digest(data) in product.image.name:
+                continue
+            if self.result.dry_run:
+                jobs.append((key, None))
+                continue
+            jobs.append((key, self.pool.submit(_store_image, row['name'], data, image_name)))
+        return jobs
+
+    def resolve_locations(self, batch, create):
+        wanted = {name for _, row in batch.values() for name in row['locations']}
+        if not wanted:
+            return {}
+        locations = dict(Location.objects.filter(name__in=wanted).values_list('name', 'id'))
+        missing = wanted - set(locations)
+        if not create:
+            # Counted by an earlier batch of this dry run
+            missing -= self.dry_run_locations
+            self.dry_run_locations |= missing
+        self.result.locations_created += len(missing)
+        if missing and create:
+            Location.objects.bulk_create([Location(name=n, version=now_version()) for n in missing], ignore_conflicts=True)
+            locations.update(Location.objects.filter(name__in=missing).values_list('name', 'id'))
+        return locations
+
+    def missing_links(self, batch, existing):
+        """[(key, location name)] for locations a row lists that its product is not linked to yet."""
+        missing = []
+        for key, (_, row) in batch.items():
+            product = existing.get(key)
+            # Existing products come with their locations prefetched; new ones have none
+            if product is None:
+                current = set()
+            elif product.pk is None:
+                # Pending from an earlier batch of this dry run
+                current = self.dry_run_links.get(key, set())
+            else:
+                current = {loc.name for loc in product.locations.all()}
+            missing.extend((key, name) for name in dict.fromkeys(row['locations']) if name not in current)
+        return missing
+
+    def link_locations(self, batch, links, products):
+        locations = self.resolve_locations(batch, create=True)
+        Through = Product.locations.through
+        Through.objects.bulk_create(
+            [Through(product_id=products[key].pk, location_id=locations[name]) for key, name in links],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        self.result.links_created += len(links)
+
+
+def import_catalog(fileobj, filename, dry_run=False, batch_size=IMPORT_BATCH_SIZE, workers=IMAGE_WORKERS):
+    return CatalogImporter(dry_run=dry_run, batch_size=batch_size, workers=workers).run(fileobj, filename)
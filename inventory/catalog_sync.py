@@ -0,0 +1,103 @@
+"""
+Catalog delta sync for the sales screen's product picker.
+
+Product, Location and Stock rows carry a ``version``, the time of their last
+change in milliseconds. It is set by a pre_save signal, and by the code that
+changes them with queryset or bulk writes (the ledger, the catalog import,
+thumbnail builds). Deletions leave a SyncTombstone.
+
+A client sends back the ``version`` of its previous response as ``since`` and
+receives the rows changed after it. Versions are taken before a transaction
+commits, so a row can become visible after a response that was newer than
+it. Each delta therefore reaches SYNC_LOOKBACK back further than ``since``;
+clients apply rows idempotently, so the overlap only costs a few repeats.
+"""
+import time
+
+from django.db.models.signals import m2m_changed, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Location, Product, Stock, SyncTombstone
+from . import catalog_cache
+
+# Milliseconds; longer than any write transaction is expected to take
+SYNC_LOOKBACK = 60_000
+
+
+def now_version():
+    return int(time.time() * 1000)
+
+
+def _stock_rows(queryset):
+    return [[product_id, quantity] for product_id, quantity in queryset.values_list('product_id', 'quantity')]
+
+
+def full_catalog():
+    """Everything the picker needs, from the versioned cache."""
+    return {
+        'products': catalog_cache.catalog(),
+        'locations': catalog_cache.locations(),
+        'stock': [[product_id, quantity] for product_id, quantity in catalog_cache.godown_stock().items()],
+    }
+
+
+def catalog_delta(since):
+    """Rows changed or deleted after ``since`` (minus SYNC_LOOKBACK), in the shape of full_catalog()."""
+    after = since - SYNC_LOOKBACK
+    godown = catalog_cache.godown()
+    products = Product.objects.filter(version__gt=after).order_by('category', 'name')
+    deleted = {'products': [], 'locations': [], 'stock': []}
+    rows = SyncTombstone.objects.filter(version__gt=after).values_list('kind', 'object_id', 'store_id')
+    for kind, object_id, store_id in rows:
+        if kind == 'product':
+            deleted['products'].append(object_id)
+        elif kind == 'location':
+            deleted['locations'].append(object_id)
+        elif godown and store_id == godown.pk:
+            deleted['stock'].append(object_id)
+    return {
+        'products': catalog_cache.product_dicts(products),
+        'locations': list(Location.objects.filter(version__gt=after).order_by('id').values('id', 'name')),
+        'stock': _stock_rows(Stock.objects.filter(store=godown, version__gt=after)) if godown else [],
+        'deleted': deleted,
+    }
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=Location)
+@receiver(pre_save, sender=Stock)
+def set_version(sender, instance, **kwargs):
+    instance.version = now_version()
+
+
+@receiver(m2m_changed, sender=Product.locations.through)
+def product_locations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            Product.objects.filter(pk=instance.pk).update(version=now_version())
+    elif action == 'pre_clear':
+        # clear() gives no pk_set; bump the location's products while still linked
+        instance.products.update(version=now_version())
+    elif action in ('post_add', 'post_remove'):
+        Product.objects.filter(pk__in=pk_set).update(version=now_version())
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    SyncTombstone.objects.create(kind='product', object_id=instance.pk, version=now_version())
+
+
+@receiver(pre_delete, sender=Location)
+def location_deleting(sender, instance, **kwargs):
+    # Products linked to it lose the location id
+    instance.products.update(version=now_version())
+
+
+@receiver(post_delete, sender=Location)
+def location_deleted(sender, instance, **kwargs):
+    SyncTombstone.objects.create(kind='location', object_id=instance.pk, version=now_version())
+
+
+@receiver(post_delete, sender=Stock)
+def stock_deleted(sender, instance, **kwargs):
+    SyncTombstone.objects.create(kind='stock', object_id=instance.product_id, store_id=instance.store_id, version=now_version())
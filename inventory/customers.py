@@ -0,0 +1,152 @@
+"""
+Customer lookup by phone number.
+
+Phone numbers typed at the counter are normalised to E.164 (``+91...``) and
+stored once in CustomerPhone, so any number seen on an earlier invoice finds
+the same Customer. Search uses range conditions on the indexed ``number`` and
+``name_key`` columns (``>= prefix AND < next prefix``), which every database
+can answer from the index, unlike LIKE on SQLite.
+"""
+import re
+
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import ArchivedInvoice, Customer, CustomerBalance, CustomerPhone, Invoice
+
+MIN_PHONE_DIGITS = 7
+SEARCH_LIMIT = 10
+RECENT_INVOICES = 10
+_NON_DIGITS = re.compile(r'\D')
+_PHONE_QUERY = re.compile(r'[\d\s+()-]+')
+
+
+def country_code():
+    return getattr(settings, 'PHONE_DEFAULT_COUNTRY_CODE', '91')
+
+
+def _to_e164_digits(raw):
+    raw = (raw or '').strip()
+    digits = _NON_DIGITS.sub('', raw)
+    if raw.startswith('+'):
+        return digits
+    if digits.startswith('00'):
+        return digits[2:]
+    digits = digits.lstrip('0')
+    code = country_code()
+    # Ten digits is a national number; longer ones already carry the country code
+    if len(digits) > 10 and digits.startswith(code):
+        return digits
+    return code + digits if digits else ''
+
+
+def normalize_phone(raw):
+    """E.164 form of ``raw`` ('+919876543210'), or None when it is too short to be a number."""
+    digits = _to_e164_digits(raw)
+    if len(digits) - len(country_code()) < MIN_PHONE_DIGITS or len(digits) > 15:
+        return None
+    return '+' + digits
+
+
+def display_phone(number):
+    """Drop the default country code for display and form filling."""
+    prefix = '+' + country_code()
+    return number[len(prefix):] if number.startswith(prefix) else number
+
+
+def name_key(name):
+    return ' '.join((name or '').split()).casefold()[:100]
+
+
+def _prefix_range(field, prefix):
+    return {f'{field}__gte': prefix, f'{field}__lt': prefix[:-1] + chr(ord(prefix[-1]) + 1)}
+
+
+def customer_for_sale(customer_name, mobiles):
+    """
+    Id of the customer owning any of ``mobiles``, creating one when none is
+    known, and register numbers not seen before. None for sales without a
+    usable phone number.
+    """
+    numbers = list(dict.fromkeys(n for n in map(normalize_phone, mobiles) if n))
+    if not numbers:
+        return None
+    known = dict(CustomerPhone.objects.filter(number__in=numbers).values_list('number', 'customer_id'))
+    if known:
+        # Numbers already belonging to different customers are not merged; the oldest wins
+        customer_id = min(known.values())
+    else:
+        customer_id = Customer.objects.create(name=customer_name, name_key=name_key(customer_name)).pk
+    new_numbers = [n for n in numbers if n not in known]
+    if new_numbers:
+        CustomerPhone.objects.bulk_create(
+            [CustomerPhone(customer_id=customer_id, number=n) for n in new_numbers], ignore_conflicts=True
+        )
+        if not known:
+            # A concurrent sale may have registered the same new numbers first;
+            # then the customer created here owns none of them and is dropped
+            owners = set(CustomerPhone.objects.filter(number__in=new_numbers).values_list('customer_id', flat=True))
+            if customer_id not in owners:
+                Customer.objects.filter(pk=customer_id).delete()
+                customer_id = min(owners)
+    return customer_id
+
+
+def matching_customer_ids(query, limit=SEARCH_LIMIT):
+    query = (query or '').strip()
+    digits = _NON_DIGITS.sub('', query)
+    if len(digits) >= 3 and _PHONE_QUERY.fullmatch(query):
+        prefix = '+' + _to_e164_digits(query)
+        rows = CustomerPhone.objects.filter(**_prefix_range('number', prefix)).order_by('number')
+        return list(dict.fromkeys(rows.values_list('customer_id', flat=True)[:limit * 3]))[:limit]
+    key = name_key(query)
+    if len(key) < 2:
+        return []
+    rows = Customer.objects.filter(**_prefix_range('name_key', key)).order_by('name_key', 'id')
+    return list(rows.values_list('id', flat=True)[:limit])
+
+
+def search_customers(query, limit=SEARCH_LIMIT):
+    """
+    Customers whose phone number or name starts with ``query``, each with
+    invoice count, total spend and balance due from their CustomerBalance, and
+    the most recent invoices, archived ones included. Six queries regardless of
+    how many invoices the customers have.
+    """
+    ids = matching_customer_ids(query, limit)
+    if not ids:
+        return []
+    customers = Customer.objects.in_bulk(ids)
+    phones = {}
+    for customer_id, number in CustomerPhone.objects.filter(customer_id__in=ids).values_list('customer_id', 'number'):
+        phones.setdefault(customer_id, []).append(display_phone(number))
+    balances = CustomerBalance.objects.in_bulk(ids)
+    recent = {}
+    # Settled invoices of closed financial years are in the archive
+    for model in (Invoice, ArchivedInvoice):
+        rows = (
+            model.objects.filter(customer_id__in=ids)
+            .annotate(row=Window(RowNumber(), partition_by=F('customer_id'), order_by=[F('date').desc(), F('id').desc()]))
+            .filter(row__lte=RECENT_INVOICES)
+            .values('customer_id', 'id', 'date', 'store__name', 'total_amount', 'paid_amount')
+        )
+        for row in rows:
+            recent.setdefault(row.pop('customer_id'), []).append(row)
+    for rows in recent.values():
+        rows.sort(key=lambda row: (row['date'], row['id']), reverse=True)
+        del rows[RECENT_INVOICES:]
+
+    results = []
+    for customer_id in ids:
+        customer, balance = customers[customer_id], balances.get(customer_id)
+        results.append({
+            'id': customer.id,
+            'name': customer.name,
+            'phones': sorted(phones.get(customer_id, [])),
+            'invoice_count': balance.invoice_count if balance else 0,
+            'total_spend': balance.billed if balance else 0,
+            'balance_due': balance.balance if balance else 0,
+            'recent_invoices': recent.get(customer_id, []),
+        })
+    return results
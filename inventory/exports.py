@@ -0,0 +1,163 @@
+"""
+Streaming CSV / JSON-lines exports of invoices and purchases for accounting.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)`` and encoded
+into ~64 KB chunks as they arrive, so a year of lines is exported in constant
+memory and the first bytes leave the server straight away. Archived rows
+(inventory/archive.py) come first, then the live ones.
+"""
+import csv
+import zlib
+from itertools import chain
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import (
+    ArchivedInvoice, ArchivedInvoiceContact, ArchivedInvoiceItem, ArchivedPurchase, ArchivedPurchaseItem,
+    Invoice, InvoiceItem, InvoiceContact, Purchase, PurchaseItem,
+)
+
+EXPORT_CHUNK_SIZE = 2000
+# Encoded output is flushed to the client in pieces of about this many bytes.
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+class Export:
+    def __init__(self, model, archive_model, columns, date_field, store_field=None):
+        self.model = model
+        # Same columns, moved out of ``model`` for closed financial years
+        self.archive_model = archive_model
+        # (header, values_list lookup) pairs
+        self.columns = columns
+        self.date_field = date_field
+        self.store_field = store_field
+
+    @property
+    def headers(self):
+        return [header for header, _ in self.columns]
+
+    def rows(self, start=None, end=None, store=None):
+        return chain(self._rows(self.archive_model, start, end, store), self._rows(self.model, start, end, store))
+
+    def _rows(self, model, start, end, store):
+        queryset = model.objects.all()
+        if start:
+            queryset = queryset.filter(**{f'{self.date_field}__gte': start})
+        if end:
+            queryset = queryset.filter(**{f'{self.date_field}__lt': end})
+        if store and self.store_field:
+            queryset = queryset.filter(**{self.store_field: store})
+        return (
+            queryset.order_by('pk')
+            .values_list(*[lookup for _, lookup in self.columns])
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+
+
+EXPORTS = {
+    'invoices': Export(Invoice, ArchivedInvoice, [
+        ('invoice_id', 'id'),
+        ('date', 'date'),
+        ('store', 'store__name'),
+        ('customer_name', 'customer_name'),
+        ('customer_mobile', 'customer_mobile'),
+        ('total_amount', 'total_amount'),
+        ('paid_amount', 'paid_amount'),
+    ], 'date', 'store'),
+    'invoice-items': Export(InvoiceItem, ArchivedInvoiceItem, [
+        ('invoice_id', 'invoice_id'),
+        ('date', 'invoice__date'),
+        ('store', 'invoice__store__name'),
+        ('product_id', 'product_id'),
+        ('product', 'product__name'),
+        ('size', 'product__size'),
+        ('unit', 'product__unit'),
+        ('quantity', 'quantity'),
+        ('rate', 'rate'),
+        ('location', 'location__name'),
+    ], 'invoice__date', 'invoice__store'),
+    'invoice-contacts': Export(InvoiceContact, ArchivedInvoiceContact, [
+        ('invoice_id', 'invoice_id'),
+        ('date', 'invoice__date'),
+        ('store', 'invoice__store__name'),
+        ('mobile', 'mobile'),
+    ], 'invoice__date', 'invoice__store'),
+    'purchases': Export(Purchase, ArchivedPurchase, [
+        ('purchase_id', 'id'),
+        ('date', 'date'),
+        ('supplier', 'supplier__name'),
+        ('supplier_invoice_number', 'invoice_number'),
+        ('total_amount', 'total_amount'),
+    ], 'date'),
+    'purchase-items': Export(PurchaseItem, ArchivedPurchaseItem, [
+        ('purchase_id', 'purchase_id'),
+        ('date', 'purchase__date'),
+        ('supplier', 'purchase__supplier__name'),
+        ('supplier_invoice_number', 'purchase__invoice_number'),
+        ('product_id', 'product_id'),
+        ('product', 'product__name'),
+        ('size', 'product__size'),
+        ('unit', 'product__unit'),
+        ('quantity', 'quantity'),
+        ('rate', 'rate'),
+    ], 'purchase__date'),
+}
+
+
+class _Line:
+    """File-like object whose write() just returns the text, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(headers, rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(headers, rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(dict(zip(headers, row))) + '\n'
+
+
+FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'jsonl': (jsonl_lines, 'application/x-ndjson'),
+}
+
+
+def buffered(lines, size=STREAM_BUFFER_SIZE):
+    """
+    Join text lines into UTF-8 chunks of roughly ``size`` bytes. The first
+    line is sent on its own so the download starts before the first chunk fills.
+    """
+    parts, length, first = [], 0, True
+    for line in lines:
+        data = line.encode('utf-8')
+        parts.append(data)
+        length += len(data)
+        if length >= size or first:
+            first = False
+            yield b''.join(parts)
+            parts, length = [], 0
+    if parts:
+        yield b''.join(parts)
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(export, fmt, start=None, end=None, store=None, gzip=False):
+    encode, _ = FORMATS[fmt]
+    chunks = buffered(encode(export.headers, export.rows(start, end, store)))
+    return gzipped(chunks) if gzip else chunks
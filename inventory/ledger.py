@@ -0,0 +1,211 @@
+"""
+Stock movement ledger.
+
+Every change to a Stock quantity is written here as a StockMovement, in the
+same transaction as the Stock update. Stock rows are a cached projection of
+the ledger: ``ledger_balances()`` recomputes them from the latest snapshot run
+plus the movements after it, and ``rebuild_stock()`` writes them back.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Max, Q, Sum, When
+from django.utils import timezone
+
+from .models import Stock, StockMovement, StockSnapshot
+from .product_stats import bump_stock
+from . import catalog_cache
+from .catalog_sync import now_version
+
+# Keeps CASE expressions and IN lists well below database parameter limits.
+STOCK_UPDATE_BATCH_SIZE = 500
+
+
+class InsufficientStock(Exception):
+    """Raised by post_movements(require_stock=True) when a decrement would go below zero."""
+
+    def __init__(self, available):
+        super().__init__(f"Insufficient stock for product(s) {sorted(available)}")
+        # {product_id: quantity on hand} for the rows that failed the check
+        self.available = available
+
+
+def post_movements(stocks, deltas, kind, invoice=None, purchase=None, note='', require_stock=False):
+    """
+    Record ``deltas`` ({product_id: Decimal}) against ``stocks`` ({product_id:
+    Stock}) as one movement per product, and apply them to the Stock rows with
+    one UPDATE per batch instead of one save() per row.
+
+    With ``require_stock``, each row is only changed while ``quantity + delta
+    >= 0`` still holds at write time (a conditional UPDATE, so concurrent
+    sellers cannot both take the last units). If any row fails the condition,
+    InsufficientStock is raised and the caller's transaction must roll back.
+    """
+    deltas = {pid: delta for pid, delta in deltas.items() if delta}
+
+    pairs = [(pid, stocks[pid].pk, delta) for pid, delta in deltas.items()]
+    version = now_version()
+    updated = 0
+    for start in range(0, len(pairs), STOCK_UPDATE_BATCH_SIZE):
+        batch = pairs[start:start + STOCK_UPDATE_BATCH_SIZE]
+        rows = Stock.objects.filter(pk__in=[pk for _, pk, _ in batch])
+        if require_stock:
+            guard = Q()
+            for _, pk, delta in batch:
+                guard |= Q(pk=pk, quantity__gte=-delta) if delta < 0 else Q(pk=pk)
+            rows = rows.filter(guard)
+        updated += rows.update(
+            quantity=Case(
+                *[When(pk=pk, then=F('quantity') + delta) for _, pk, delta in batch],
+                default=F('quantity'),
+            ),
+            version=version,
+        )
+    if require_stock and updated != len(pairs):
+        current = dict(
+            Stock.objects.filter(pk__in=[pk for _, pk, _ in pairs]).values_list('product_id', 'quantity')
+        )
+        raise InsufficientStock({
+            pid: current.get(pid, Decimal('0')) for pid, _, delta in pairs if current.get(pid, 0) + delta < 0
+        })
+
+    now = timezone.now()
+    StockMovement.objects.bulk_create([
+        StockMovement(
+            product_id=pid,
+            store_id=stocks[pid].store_id,
+            quantity=delta,
+            kind=kind,
+            created_at=now,
+            invoice=invoice,
+            purchase=purchase,
+            note=note,
+        )
+        for pid, delta in deltas.items()
+    ])
+    for pid, delta in deltas.items():
+        stocks[pid].quantity += delta
+        stocks[pid].version = version
+    bump_stock(deltas)
+    catalog_cache.bump(catalog_cache.STOCK)
+
+
+def set_stock_quantity(stock, quantity, kind='ADJUSTMENT', note=''):
+    """
+    Save ``stock`` with ``quantity`` and record the difference from the stored
+    value as a movement. Used for manual corrections and opening balances.
+    """
+    with transaction.atomic():
+        current = Decimal('0')
+        if stock.pk:
+            current = Stock.objects.select_for_update().filter(pk=stock.pk).values_list('quantity', flat=True).get()
+        stock.quantity = quantity
+        stock.save()
+        delta = Decimal(quantity) - current
+        if delta:
+            StockMovement.objects.create(
+                product_id=stock.product_id, store_id=stock.store_id, quantity=delta, kind=kind, note=note
+            )
+            bump_stock({stock.product_id: delta})
+
+
+def delete_stock(stock, note=''):
+    """Delete a Stock row, recording its remaining quantity as an outgoing adjustment."""
+    with transaction.atomic():
+        current = Stock.objects.select_for_update().filter(pk=stock.pk).values_list('quantity', flat=True).get()
+        if current:
+            StockMovement.objects.create(
+                product_id=stock.product_id, store_id=stock.store_id, quantity=-current, kind='ADJUSTMENT', note=note
+            )
+            bump_stock({stock.product_id: -current})
+        stock.delete()
+
+
+def latest_snapshot_cutoff():
+    return StockSnapshot.objects.aggregate(cutoff=Max('last_movement_id'))['cutoff'] or 0
+
+
+def ledger_balances(up_to=None):
+    """
+    {(product_id, store_id): quantity} from the latest snapshot run plus the
+    movements after it (up to movement id ``up_to`` when given).
+    """
+    cutoff = latest_snapshot_cutoff()
+    balances = {
+        (row['product_id'], row['store_id']): row['quantity']
+        for row in StockSnapshot.objects.filter(last_movement_id=cutoff).values('product_id', 'store_id', 'quantity')
+    } if cutoff else {}
+    movements = StockMovement.objects.filter(id__gt=cutoff)
+    if up_to is not None:
+        movements = movements.filter(id__lte=up_to)
+    for row in movements.values('product_id', 'store_id').annotate(total=Sum('quantity')).order_by():
+        key = (row['product_id'], row['store_id'])
+        balances[key] = balances.get(key, Decimal('0')) + row['total']
+    return balances
+
+
+def take_snapshots():
+    """
+    Write one snapshot per (product, store) covering every movement so far.
+    Returns the number of snapshot rows written (0 when nothing moved since
+    the last run).
+    """
+    with transaction.atomic():
+        last_id = StockMovement.objects.aggregate(last=Max('id'))['last']
+        if not last_id or last_id == latest_snapshot_cutoff():
+            return 0
+        now = timezone.now()
+        snapshots = [
+            StockSnapshot(product_id=pid, store_id=sid, quantity=qty, last_movement_id=last_id, taken_at=now)
+            for (pid, sid), qty in ledger_balances(up_to=last_id).items()
+        ]
+        StockSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+    return len(snapshots)
+
+
+def stock_at(product_id, store_id, when=None):
+    """Quantity of a product in a store at ``when`` (default: now), replayed from the ledger."""
+    when = when or timezone.now()
+    snapshot = (
+        StockSnapshot.objects.filter(product_id=product_id, store_id=store_id, taken_at__lte=when)
+        .order_by('-taken_at').first()
+    )
+    movements = StockMovement.objects.filter(product_id=product_id, store_id=store_id, created_at__lte=when)
+    base = Decimal('0')
+    if snapshot:
+        movements = movements.filter(id__gt=snapshot.last_movement_id)
+        base = snapshot.quantity
+    return base + (movements.aggregate(total=Sum('quantity'))['total'] or 0)
+
+
+def find_stock_drift():
+    """Return (stock, ledger_quantity) for every Stock row that disagrees with the ledger."""
+    balances = ledger_balances()
+    drift = []
+    for stock in Stock.objects.select_related('product', 'store'):
+        expected = balances.pop((stock.product_id, stock.store_id), Decimal('0'))
+        if stock.quantity != expected:
+            drift.append((stock, expected))
+    # Ledger balances without a Stock row at all
+    for (pid, sid), expected in balances.items():
+        if expected:
+            drift.append((Stock(product_id=pid, store_id=sid, quantity=Decimal('0')), expected))
+    return drift
+
+
+def rebuild_stock():
+    """Overwrite Stock quantities with the ledger balances. Returns the number of rows changed."""
+    with transaction.atomic():
+        drift = find_stock_drift()
+        existing = [stock for stock, _ in drift if stock.pk]
+        missing = [stock for stock, _ in drift if not stock.pk]
+        changes = {}
+        version = now_version()
+        for stock, expected in drift:
+            changes[stock.product_id] = changes.get(stock.product_id, 0) + expected - stock.quantity
+            stock.quantity, stock.version = expected, version
+        Stock.objects.bulk_update(existing, ['quantity', 'version'], batch_size=STOCK_UPDATE_BATCH_SIZE)
+        Stock.objects.bulk_create(missing, batch_size=STOCK_UPDATE_BATCH_SIZE)
+        bump_stock(changes)
+        catalog_cache.bump(catalog_cache.STOCK)
+    return len(drift)
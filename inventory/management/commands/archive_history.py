@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from inventory.archive import (
+    ARCHIVE_CHUNK_SIZE, archivable_invoices, archivable_purchases, archive_invoices, archive_purchases,
+    financial_year_start,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move settled invoices and purchases of closed financial years into the archive tables, "
+        "in small transactions so it can run during opening hours."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before', help="Archive rows dated before this day (YYYY-MM-DD). Default: start of the current financial year.",
+        )
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE, help="Invoices or purchases per transaction.")
+        parser.add_argument('--pause', type=float, default=0.05, help="Seconds to wait between transactions.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count what would be archived.")
+
+    def handle(self, *args, **options):
+        current_year = financial_year_start()
+        before = current_year
+        if options['before']:
+            try:
+                before = parse_date(options['before'])
+            except ValueError:
+                before = None
+            if not before:
+                raise CommandError("--before must be a date, YYYY-MM-DD.")
+            if before > current_year:
+                raise CommandError(f"Only closed financial years are archived; --before must be on or before {current_year}.")
+
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size must be a positive number.")
+
+        if options['dry_run']:
+            self.stdout.write(
+                f"{archivable_invoices(before).count()} invoice(s) and {archivable_purchases(before).count()} "
+                f"purchase(s) dated before {before} would be archived."
+            )
+            return
+
+        kwargs = {'size': options['chunk_size'], 'pause': options['pause']}
+        invoices = archive_invoices(before, progress=lambda n: self.stdout.write(f"{n} invoice(s) archived"), **kwargs)
+        purchases = archive_purchases(before, progress=lambda n: self.stdout.write(f"{n} purchase(s) archived"), **kwargs)
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {invoices} invoice(s) and {purchases} purchase(s) dated before {before}."
+        ))
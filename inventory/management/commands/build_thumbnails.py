@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from inventory import catalog_cache
+from inventory.catalog_sync import now_version
+from inventory.models import Product
+from inventory.thumbnails import DERIVATIVE_WORKERS, build_derivatives
+
+
+class Command(BaseCommand):
+    help = "Build missing thumbnail and WebP derivatives for product images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild derivatives even if they already exist.")
+        parser.add_argument('--workers', type=int, default=DERIVATIVE_WORKERS)
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['force']:
+            products = products.filter(image_hash='')
+        jobs = list(products.values_list('pk', 'image'))
+
+        built = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = [(pk, name, pool.submit(build_derivatives, name, options['force'])) for pk, name in jobs]
+            for pk, name, future in futures:
+                try:
+                    image_hash = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"product={pk} {name}: {e}")
+                    continue
+                Product.objects.filter(pk=pk, image=name).update(image_hash=image_hash, version=now_version())
+                built += 1
+
+        if built:
+            catalog_cache.bump(catalog_cache.CATALOG)
+        style = self.style.WARNING if failed else self.style.SUCCESS
+        self.stdout.write(style(f"Built derivatives for {built} image(s); {failed} failed."))
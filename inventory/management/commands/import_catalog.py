@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.catalog_import import (
+    CATALOG_COLUMNS, IMAGE_WORKERS, IMPORT_BATCH_SIZE, CatalogImportError, import_catalog,
+)
+
+
+class Command(BaseCommand):
+    help = f"Create or update products from a CSV catalog, or a ZIP of one CSV plus images. Columns: {CATALOG_COLUMNS}."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Path to a .csv or .zip catalog file.")
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="List what would be created or changed without writing anything.",
+        )
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=IMAGE_WORKERS, help="Threads used to decode and store images.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as f:
+                result = import_catalog(
+                    f, options['path'], dry_run=options['dry_run'],
+                    batch_size=options['batch_size'], workers=options['workers'],
+                )
+        except (OSError, CatalogImportError) as e:
+            raise CommandError(str(e))
+
+        if options['dry_run']:
+            for change in result.changes:
+                self.stdout.write(change)
+            hidden = result.created + result.updated - len(result.changes)
+            if hidden > 0:
+                self.stdout.write(f"... and {hidden} more change(s)")
+        for error in result.errors:
+            self.stderr.write(error)
+        style = self.style.WARNING if result.errors else self.style.SUCCESS
+        self.stdout.write(style(result.summary()))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from inventory.rollups import compute_daily_sales, find_drift, rebuild_daily_sales
+
+
+class Command(BaseCommand):
+    help = "Rebuild the DailyStoreSales rollup from invoices and purchases and report any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report drift between the rollup and history; do not rewrite it.",
+        )
+
+    def handle(self, *args, **options):
+        drift = find_drift(compute_daily_sales())
+        for store_id, day, field, stored, expected in drift:
+            self.stdout.write(f"store={store_id} day={day} {field}: stored {stored}, expected {expected}")
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Rollup matches history."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} drifted value(s) found."))
+
+        if options['check']:
+            if drift:
+                raise SystemExit(1)
+            return
+
+        rows = rebuild_daily_sales()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup row(s)."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from inventory.product_stats import compute_product_stats, find_drift, rebuild_product_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild ProductStats from stock and purchase history and report any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report drift between ProductStats and history; do not rewrite it.",
+        )
+
+    def handle(self, *args, **options):
+        drift = find_drift(compute_product_stats())
+        for product_id, field, stored, expected in drift:
+            self.stdout.write(f"product={product_id} {field}: stored {stored}, expected {expected}")
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Product stats match history."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} drifted value(s) found."))
+
+        if options['check']:
+            if drift:
+                raise SystemExit(1)
+            return
+
+        rows = rebuild_product_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} product stats row(s)."))
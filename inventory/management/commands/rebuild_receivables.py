@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from inventory.receivables import compute_balances, find_drift, invoice_drift, rebuild_receivables
+
+
+class Command(BaseCommand):
+    help = "Rebuild invoice due amounts and customer balances from payments and report any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report drift between the stored balances and payments; do not rewrite them.",
+        )
+
+    def handle(self, *args, **options):
+        invoices = invoice_drift()
+        for invoice, paid, due in invoices:
+            self.stdout.write(
+                f"invoice={invoice.pk} paid {invoice.paid_amount}, expected {paid}; due {invoice.due_amount}, expected {due}"
+            )
+        drift = find_drift(compute_balances())
+        for customer_id, field, stored, expected in drift:
+            self.stdout.write(f"customer={customer_id} {field}: stored {stored}, expected {expected}")
+
+        if not invoices and not drift:
+            self.stdout.write(self.style.SUCCESS("Receivables match payments."))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"{len(invoices)} drifted invoice(s) and {len(drift)} drifted balance value(s) found."
+            ))
+
+        if options['check']:
+            if invoices or drift:
+                raise SystemExit(1)
+            return
+
+        fixed, rows = rebuild_receivables()
+        self.stdout.write(self.style.SUCCESS(f"Fixed {fixed} invoice(s); rebuilt {rows} customer balance row(s)."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from inventory.ledger import find_stock_drift, rebuild_stock
+
+
+class Command(BaseCommand):
+    help = "Rebuild Stock quantities from the stock movement ledger and report any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report drift between Stock and the ledger; do not rewrite it.",
+        )
+
+    def handle(self, *args, **options):
+        drift = find_stock_drift()
+        for stock, expected in drift:
+            self.stdout.write(
+                f"product={stock.product_id} store={stock.store_id}: stored {stock.quantity}, ledger {expected}"
+            )
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Stock matches the ledger."))
+            return
+        self.stdout.write(self.style.WARNING(f"{len(drift)} stock row(s) drifted from the ledger."))
+
+        if options['check']:
+            raise SystemExit(1)
+
+        rows = rebuild_stock()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} stock row(s)."))
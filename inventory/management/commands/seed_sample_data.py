@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.models import Invoice, Product, Store
+from inventory.sample_data import SEED_BATCH_SIZE, SIZES, seed_sample_data
+
+
+class Command(BaseCommand):
+    help = "Fill an empty database with a synthetic shop history (stores, catalog, purchases, invoices) for benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=sorted(SIZES), default='small', help="Preset product and invoice counts.")
+        parser.add_argument('--products', type=int, help="Overrides the preset.")
+        parser.add_argument('--invoices', type=int, help="Overrides the preset.")
+        parser.add_argument('--purchases', type=int, help="Default: one per 100 invoices.")
+        parser.add_argument('--customers', type=int, help="Default: one per 10 invoices.")
+        parser.add_argument('--days', type=int, default=365, help="Days of history the invoices are spread over.")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed; the same arguments give the same data.")
+        parser.add_argument('--batch-size', type=int, default=SEED_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if Store.objects.exists() or Product.objects.exists() or Invoice.objects.exists():
+            raise CommandError("The database already has stores, products or invoices; seed an empty one.")
+
+        counts = dict(SIZES[options['size']])
+        for name in ('products', 'invoices'):
+            if options[name] is not None:
+                counts[name] = options[name]
+        started = time.perf_counter()
+        rows = seed_sample_data(
+            **counts, purchases=options['purchases'], customers=options['customers'], days=options['days'],
+            seed=options['seed'], batch_size=options['batch_size'],
+        )
+        for model, count in rows.items():
+            self.stdout.write(f"{model}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.perf_counter() - started:.1f}s."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from inventory.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Write a stock snapshot for every product and store. Run periodically (e.g. nightly from cron)."
+
+    def handle(self, *args, **options):
+        count = take_snapshots()
+        if count:
+            self.stdout.write(self.style.SUCCESS(f"Wrote {count} stock snapshot(s)."))
+        else:
+            self.stdout.write("No stock movements since the last snapshot.")
@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from inventory.ledger import stock_at
+from inventory.models import Product, Store
+from inventory.reports import day_bounds
+
+
+class Command(BaseCommand):
+    help = "Show the ledger stock of a product at a point in time (default: Central Godown, now)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_id', type=int)
+        parser.add_argument(
+            '--at',
+            help="Date (YYYY-MM-DD, meaning end of that day) or datetime (YYYY-MM-DD HH:MM).",
+        )
+        parser.add_argument('--store', type=int, help="Store id; defaults to the Central Godown.")
+
+    def handle(self, *args, **options):
+        try:
+            product = Product.objects.get(pk=options['product_id'])
+        except Product.DoesNotExist:
+            raise CommandError(f"Product {options['product_id']} does not exist.")
+
+        if options['store']:
+            store = Store.objects.filter(pk=options['store']).first()
+        else:
+            store = Store.objects.filter(store_type='GODOWN').first()
+        if not store:
+            raise CommandError("Store not found.")
+
+        when = timezone.now()
+        if options['at']:
+            moment = parse_datetime(options['at'])
+            day = None if moment else parse_date(options['at'])
+            if moment:
+                when = timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+            elif day:
+                # End of the day: everything before midnight of the next day
+                when = day_bounds(day, day)[1] - timedelta(microseconds=1)
+            else:
+                raise CommandError("--at must be YYYY-MM-DD or YYYY-MM-DD HH:MM.")
+
+        quantity = stock_at(product.pk, store.pk, when)
+        self.stdout.write(f"{product} at {store.name} on {timezone.localtime(when):%Y-%m-%d %H:%M}: {quantity} {product.unit}")
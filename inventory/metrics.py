@@ -0,0 +1,234 @@
+"""
+Per-view request metrics in Prometheus text format.
+
+MetricsMiddleware records, for each URL name, a latency histogram, SQL query
+count and time, template render time and response bytes. Each process keeps
+its totals in a dict and rewrites its own JSON file under METRICS_DIR at most
+once every METRICS_FLUSH_INTERVAL seconds; ``/metrics`` sums the files of all
+workers. Totals only ever grow, so files of exited workers keep counting and
+the directory is emptied when the server starts (gunicorn.conf.py).
+
+Template time comes from TimedDjangoTemplates, the template backend set in
+settings, which times every top-level render. Queries are counted by a wrapper
+installed on every database connection as it opens, because async views run
+theirs on other threads' connections; the request's stats travel with it in a
+context variable.
+"""
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_FLUSH_INTERVAL = 1.0
+# Per-view counters: key in the totals dict -> (metric name, help text)
+COUNTERS = {
+    'queries': ('myshop_request_db_queries_total', "SQL queries run while handling requests."),
+    'db_seconds': ('myshop_request_db_seconds_total', "Time spent in SQL queries."),
+    'template_seconds': ('myshop_request_template_seconds_total', "Time spent rendering templates."),
+    'response_bytes': ('myshop_response_bytes_total', "Response body bytes (streamed responses excluded)."),
+}
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+_lock = threading.Lock()
+_totals = {}
+_last_flush = 0.0
+
+
+def metrics_dir():
+    return Path(getattr(settings, 'METRICS_DIR', None) or Path(tempfile.gettempdir()) / 'my_shop_metrics')
+
+
+def _empty():
+    return {
+        'buckets': [0] * len(LATENCY_BUCKETS), 'count': 0, 'seconds': 0.0,
+        **dict.fromkeys(COUNTERS, 0),
+    }
+
+
+class _RequestStats:
+    __slots__ = ('queries', 'db_seconds', 'template_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    # Wrappers outlive reconnects of the same connection object
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend whose templates report render time to the request metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def record(view, seconds, stats, response_bytes):
+    global _last_flush
+    with _lock:
+        totals = _totals.setdefault(view, _empty())
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                totals['buckets'][i] += 1
+                break
+        totals['count'] += 1
+        totals['seconds'] += seconds
+        totals['queries'] += stats.queries
+        totals['db_seconds'] += stats.db_seconds
+        totals['template_seconds'] += stats.template_seconds
+        totals['response_bytes'] += response_bytes
+        now = time.monotonic()
+        if now - _last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL):
+            return
+        _last_flush = now
+        snapshot = json.dumps(_totals)
+    flush(snapshot)
+
+
+def flush(snapshot=None):
+    """Write this process's totals to its file in METRICS_DIR."""
+    if snapshot is None:
+        with _lock:
+            snapshot = json.dumps(_totals)
+    directory = metrics_dir()
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'{os.getpid()}.json'
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(snapshot)
+        os.replace(tmp, path)
+    except OSError:
+        # Metrics must never break a request
+        pass
+
+
+def merged_totals():
+    """Totals of every worker that has flushed, summed per view."""
+    flush()
+    merged = {}
+    for path in metrics_dir().glob('*.json'):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for view, totals in data.items():
+            target = merged.setdefault(view, _empty())
+            target['buckets'] = [a + b for a, b in zip(target['buckets'], totals['buckets'])]
+            for key in ('count', 'seconds', *COUNTERS):
+                target[key] += totals.get(key, 0)
+    return merged
+
+
+def _label(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def render_prometheus(totals):
+    lines = [
+        '# HELP myshop_request_duration_seconds Request latency by URL name.',
+        '# TYPE myshop_request_duration_seconds histogram',
+    ]
+    for view in sorted(totals):
+        data, label = totals[view], _label(view)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, data['buckets']):
+            cumulative += count
+            lines.append(f'myshop_request_duration_seconds_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'myshop_request_duration_seconds_bucket{{view="{label}",le="+Inf"}} {data["count"]}')
+        lines.append(f'myshop_request_duration_seconds_sum{{view="{label}"}} {data["seconds"]}')
+        lines.append(f'myshop_request_duration_seconds_count{{view="{label}"}} {data["count"]}')
+    for key, (name, help_text) in COUNTERS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for view in sorted(totals):
+            lines.append(f'{name}{{view="{_label(view)}"}} {totals[view][key]}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = _RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = _RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def _finish(self, request, response, stats, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match and match.view_name else 'unmatched'
+        size = 0 if response.streaming else len(response.content)
+        record(view, elapsed, stats, size)
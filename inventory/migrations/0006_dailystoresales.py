@@ -0,0 +1,66 @@
+# Generated by Django 6.0 on 2026-10-18 05:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_sales(apps, schema_editor):
+    Invoice = apps.get_model('inventory', 'Invoice')
+    Purchase = apps.get_model('inventory', 'Purchase')
+    Store = apps.get_model('inventory', 'Store')
+    DailyStoreSales = apps.get_model('inventory', 'DailyStoreSales')
+
+    rows = {}
+    invoice_rows = (
+        Invoice.objects.annotate(day=TruncDate('date'))
+        .values('store_id', 'day')
+        .annotate(sales=Sum('total_amount'), paid=Sum('paid_amount'), count=Count('id'))
+        .order_by()
+    )
+    for row in invoice_rows:
+        rows[(row['store_id'], row['day'])] = DailyStoreSales(
+            store_id=row['store_id'], day=row['day'],
+            sales_total=row['sales'], paid_total=row['paid'], invoice_count=row['count'],
+        )
+    godown = Store.objects.filter(store_type='GODOWN').first()
+    if godown:
+        purchase_rows = (
+            Purchase.objects.annotate(day=TruncDate('date'))
+            .values('day')
+            .annotate(total=Sum('total_amount'))
+            .order_by()
+        )
+        for row in purchase_rows:
+            key = (godown.pk, row['day'])
+            rows.setdefault(key, DailyStoreSales(store_id=godown.pk, day=row['day'])).purchase_total = row['total']
+    DailyStoreSales.objects.bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_location_invoicecontact_invoiceitem_location_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStoreSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('sales_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('invoice_count', models.PositiveIntegerField(default=0)),
+                ('purchase_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='inventory.store')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily store sales',
+                'indexes': [models.Index(fields=['day', 'store'], name='inventory_d_day_e14b07_idx')],
+                'unique_together': {('store', 'day')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_sales, migrations.RunPython.noop),
+    ]
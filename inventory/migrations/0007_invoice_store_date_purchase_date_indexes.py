@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-18 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_dailystoresales'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['store', 'date'], name='inventory_i_store_i_9e6061_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['date'], name='inventory_p_date_75417c_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 6.0 on 2026-10-18 05:43
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def seed_opening_balances(apps, schema_editor):
+    Stock = apps.get_model('inventory', 'Stock')
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    StockMovement.objects.bulk_create(
+        [
+            StockMovement(
+                product_id=stock.product_id,
+                store_id=stock.store_id,
+                quantity=stock.quantity,
+                kind='OPENING',
+                note='Balance when the stock ledger was introduced',
+            )
+            for stock in Stock.objects.exclude(quantity=0).iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_invoice_store_date_purchase_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=2, help_text='Signed change in stock', max_digits=10)),
+                ('kind', models.CharField(choices=[('OPENING', 'Opening balance'), ('SALE', 'Sale'), ('PURCHASE', 'Purchase'), ('ADJUSTMENT', 'Adjustment')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('invoice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='inventory.invoice')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='inventory.product')),
+                ('purchase', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='inventory.purchase')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.store')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'store', 'created_at'], name='inventory_s_product_b19abb_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('last_movement_id', models.BigIntegerField()),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='inventory.product')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.store')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'store', 'taken_at'], name='inventory_s_product_f53879_idx'), models.Index(fields=['last_movement_id'], name='inventory_s_last_mo_4ab9cc_idx')],
+            },
+        ),
+        migrations.RunPython(seed_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 05:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+    ]
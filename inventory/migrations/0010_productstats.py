@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-18 05:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def backfill_product_stats(apps, schema_editor):
+    Product = apps.get_model('inventory', 'Product')
+    Stock = apps.get_model('inventory', 'Stock')
+    PurchaseItem = apps.get_model('inventory', 'PurchaseItem')
+    ProductStats = apps.get_model('inventory', 'ProductStats')
+
+    rows = {pid: ProductStats(product_id=pid) for pid in Product.objects.values_list('id', flat=True)}
+    for row in Stock.objects.values('product_id').annotate(total=Sum('quantity')).order_by():
+        rows[row['product_id']].total_stock = row['total']
+    purchase_rows = (
+        PurchaseItem.objects.values('product_id')
+        .annotate(count=Count('id'), last=Max('purchase__date'))
+        .order_by()
+    )
+    for row in purchase_rows:
+        rows[row['product_id']].purchase_count = row['count']
+        rows[row['product_id']].last_purchase_date = row['last']
+    ProductStats.objects.bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_product_image_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='inventory.product')),
+                ('total_stock', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('purchase_count', models.PositiveIntegerField(default=0)),
+                ('last_purchase_date', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Product stats',
+                'indexes': [models.Index(fields=['total_stock', 'product'], name='inventory_p_total_s_263634_idx'), models.Index(fields=['purchase_count', 'product'], name='inventory_p_purchas_694921_idx'), models.Index(fields=['last_purchase_date', 'product'], name='inventory_p_last_pu_5d415c_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_product_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,112 @@
+# Generated by Django 6.0 on 2026-10-18 06:01
+
+import django.db.models.deletion
+import django.utils.timezone
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalize_phone(raw):
+    # Frozen copy of inventory.customers.normalize_phone
+    code = getattr(settings, 'PHONE_DEFAULT_COUNTRY_CODE', '91')
+    raw = (raw or '').strip()
+    digits = re.sub(r'\D', '', raw)
+    if not raw.startswith('+'):
+        if digits.startswith('00'):
+            digits = digits[2:]
+        else:
+            digits = digits.lstrip('0')
+            if not (len(digits) > 10 and digits.startswith(code)):
+                digits = code + digits if digits else ''
+    if len(digits) - len(code) < 7 or len(digits) > 15:
+        return None
+    return '+' + digits
+
+
+def backfill_customers(apps, schema_editor):
+    Invoice = apps.get_model('inventory', 'Invoice')
+    InvoiceContact = apps.get_model('inventory', 'InvoiceContact')
+    Customer = apps.get_model('inventory', 'Customer')
+    CustomerPhone = apps.get_model('inventory', 'CustomerPhone')
+
+    contacts = {}
+    for invoice_id, mobile in InvoiceContact.objects.values_list('invoice_id', 'mobile').iterator(chunk_size=2000):
+        contacts.setdefault(invoice_id, []).append(mobile)
+
+    # Walk invoices oldest first; an invoice sharing any number with an earlier
+    # one belongs to the same customer.
+    owner = {}
+    groups = []  # [name, [numbers], [invoice ids]]
+    invoices = Invoice.objects.order_by('id').values_list('id', 'customer_name', 'customer_mobile')
+    for pk, name, mobile in invoices.iterator(chunk_size=2000):
+        numbers = [n for n in dict.fromkeys(map(normalize_phone, [mobile, *contacts.pop(pk, [])])) if n]
+        if not numbers:
+            continue
+        matched = [owner[n] for n in numbers if n in owner]
+        if matched:
+            group = min(matched)
+        else:
+            group = len(groups)
+            groups.append([name, [], []])
+        for number in numbers:
+            if number not in owner:
+                owner[number] = group
+                groups[group][1].append(number)
+        groups[group][2].append(pk)
+
+    for start in range(0, len(groups), 1000):
+        batch = groups[start:start + 1000]
+        customers = Customer.objects.bulk_create([
+            Customer(name=name, name_key=' '.join(name.split()).casefold()[:100]) for name, _, _ in batch
+        ])
+        CustomerPhone.objects.bulk_create([
+            CustomerPhone(customer_id=customer.pk, number=number)
+            for customer, (_, numbers, _) in zip(customers, batch) for number in numbers
+        ])
+        Invoice.objects.bulk_update([
+            Invoice(pk=pk, customer_id=customer.pk)
+            for customer, (_, _, invoice_ids) in zip(customers, batch) for pk in invoice_ids
+        ], ['customer'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_productstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('name_key', models.CharField(db_index=True, max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CustomerPhone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.CharField(max_length=16, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='customer',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoices', to='inventory.customer'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['customer', 'date'], name='inventory_i_custome_73cc1a_idx'),
+        ),
+        migrations.AddField(
+            model_name='customerphone',
+            name='customer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='phones', to='inventory.customer'),
+        ),
+        migrations.RunPython(backfill_customers, migrations.RunPython.noop),
+    ]
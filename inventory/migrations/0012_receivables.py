@@ -0,0 +1,102 @@
+# Generated by Django 6.0 on 2026-10-18 06:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Sum
+
+
+def backfill_receivables(apps, schema_editor):
+    Invoice = apps.get_model('inventory', 'Invoice')
+    Payment = apps.get_model('inventory', 'Payment')
+    CustomerBalance = apps.get_model('inventory', 'CustomerBalance')
+
+    Invoice.objects.update(due_amount=F('total_amount') - F('paid_amount'))
+    # What was paid at the counter becomes one payment on the invoice's date
+    paid = Invoice.objects.filter(paid_amount__gt=0).values_list('id', 'paid_amount', 'date')
+    batch = []
+    for invoice_id, amount, date in paid.iterator(chunk_size=2000):
+        batch.append(Payment(invoice_id=invoice_id, amount=amount, date=date, method='CASH'))
+        if len(batch) >= 1000:
+            Payment.objects.bulk_create(batch)
+            batch = []
+    Payment.objects.bulk_create(batch)
+
+    rows = (
+        Invoice.objects.filter(customer__isnull=False).values('customer_id')
+        .annotate(count=Count('id'), billed=Sum('total_amount'), paid=Sum('paid_amount'))
+        .order_by()
+    )
+    last_payment = dict(
+        Payment.objects.filter(invoice__customer__isnull=False).values('invoice__customer_id')
+        .annotate(last=Max('date')).order_by().values_list('invoice__customer_id', 'last')
+    )
+    CustomerBalance.objects.bulk_create([
+        CustomerBalance(
+            customer_id=row['customer_id'], invoice_count=row['count'], billed=row['billed'],
+            paid=row['paid'], balance=row['billed'] - row['paid'],
+            last_payment_at=last_payment.get(row['customer_id']),
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_customers'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerBalance',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='inventory.customer')),
+                ('invoice_count', models.PositiveIntegerField(default=0)),
+                ('billed', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('last_payment_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('method', models.CharField(choices=[('CASH', 'Cash'), ('UPI', 'UPI'), ('CARD', 'Card'), ('BANK', 'Bank transfer'), ('OTHER', 'Other')], default='CASH', max_length=10)),
+                ('date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('note', models.CharField(blank=True, max_length=200)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='due_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('due_amount__gt', 0)), fields=['customer', 'date'], name='invoice_open_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customerbalance',
+            index=models.Index(fields=['balance', 'customer'], name='inventory_c_balance_2f148f_idx'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='invoice',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='inventory.invoice'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='recorded_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['date'], name='inventory_p_date_a747d3_idx'),
+        ),
+        migrations.RunPython(backfill_receivables, migrations.RunPython.noop),
+    ]
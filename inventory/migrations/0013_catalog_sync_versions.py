@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-18 06:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_receivables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='SyncTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('product', 'Product'), ('location', 'Location'), ('stock', 'Stock')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('version', models.BigIntegerField(db_index=True)),
+                ('store', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='inventory.store')),
+            ],
+        ),
+    ]
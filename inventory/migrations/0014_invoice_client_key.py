@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_catalog_sync_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='client_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 6.0 on 2026-10-18 07:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_invoice_client_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedInvoice',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('customer_name', models.CharField(max_length=100)),
+                ('customer_mobile', models.CharField(blank=True, max_length=15, null=True)),
+                ('date', models.DateTimeField()),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('paid_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('due_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('client_key', models.CharField(blank=True, editable=False, max_length=64, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('customer', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_invoices', to='inventory.customer')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.store')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedInvoiceContact',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('mobile', models.CharField(max_length=15)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contacts', to='inventory.archivedinvoice')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedInvoiceItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='inventory.archivedinvoice')),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='inventory.location')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPayment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('method', models.CharField(choices=[('CASH', 'Cash'), ('UPI', 'UPI'), ('CARD', 'Card'), ('BANK', 'Bank transfer'), ('OTHER', 'Other')], default='CASH', max_length=10)),
+                ('date', models.DateTimeField()),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='inventory.archivedinvoice')),
+                ('recorded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPurchase',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateTimeField()),
+                ('invoice_number', models.CharField(blank=True, max_length=50)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('supplier', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='inventory.supplier')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPurchaseItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.product')),
+                ('purchase', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='inventory.archivedpurchase')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedinvoice',
+            index=models.Index(fields=['store', 'date'], name='inventory_a_store_i_48d713_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedinvoice',
+            index=models.Index(fields=['customer', 'date'], name='inventory_a_custome_cbd098_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedinvoice',
+            index=models.Index(fields=['date'], name='inventory_a_date_993223_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedpurchase',
+            index=models.Index(fields=['date'], name='inventory_a_date_a02380_idx'),
+        ),
+    ]
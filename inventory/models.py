@@ -1,6 +1,7 @@
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -34,6 +35,8 @@ class Product(models.Model):
     unit = models.CharField(max_length=20, default='sqft')
     description = models.TextField(blank=True, null=True)
     image = models.ImageField(upload_to='product_images/', blank=True, null=True)
+    # Content hash of image once its thumbnails exist (see inventory/thumbnails.py)
+    image_hash = models.CharField(max_length=32, blank=True, default='', editable=False)
     # Optional: multiple physical locations where this product can be found
     # Admin can assign one or more locations to a product
     # Used to select source location in invoice items
@@ -43,14 +46,38 @@ class Product(models.Model):
     
     # Declared below Location model; using string reference here to avoid re-ordering
     locations = models.ManyToManyField('Location', blank=True, related_name='products')
+    # Time of the last change in milliseconds, for catalog delta sync (inventory/catalog_sync.py)
+    version = models.BigIntegerField(default=0, db_index=True, editable=False)
 
     def __str__(self):
         return f"{self.name} - {self.size}"
 
+    def derivative_url(self, size, ext):
+        """URL of a generated thumbnail, or the original image until one has been built."""
+        if not self.image:
+            return ''
+        if not self.image_hash:
+            return self.image.url
+        from .thumbnails import derivative_url
+        return derivative_url(self.image_hash, size, ext)
+
+    @property
+    def thumbnail_url(self):
+        return self.derivative_url('thumb', 'jpg')
+
+    @property
+    def thumbnail_webp_url(self):
+        return self.derivative_url('thumb', 'webp')
+
+    @property
+    def preview_webp_url(self):
+        return self.derivative_url('medium', 'webp')
+
 class Stock(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     store = models.ForeignKey(Store, on_delete=models.CASCADE)
     quantity = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    version = models.BigIntegerField(default=0, db_index=True, editable=False)
 
     class Meta:
         unique_together = ('product', 'store')
@@ -66,17 +93,54 @@ class Stock(models.Model):
     def __str__(self):
         return f"{self.product.name} - {self.quantity} {self.product.unit} in {self.store.name}"
 
+class Customer(models.Model):
+    """
+    A returning customer, identified by any of their phone numbers. Invoices
+    are linked when they are recorded; see inventory/customers.py.
+    """
+    name = models.CharField(max_length=100)
+    # Case-folded name with collapsed spaces, for indexed prefix search
+    name_key = models.CharField(max_length=100, db_index=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.name
+
+class CustomerPhone(models.Model):
+    customer = models.ForeignKey(Customer, related_name='phones', on_delete=models.CASCADE)
+    # E.164, e.g. +919876543210
+    number = models.CharField(max_length=16, unique=True)
+
+    def __str__(self):
+        return self.number
+
 class Invoice(models.Model):
     store = models.ForeignKey(Store, on_delete=models.CASCADE, help_text="Store where sale happened")
     customer_name = models.CharField(max_length=100)
     customer_mobile = models.CharField(max_length=15, blank=True, null=True)
+    # Set when the sale had a phone number; indexed together with date below
+    customer = models.ForeignKey(
+        Customer, related_name='invoices', on_delete=models.SET_NULL, null=True, blank=True, db_index=False
+    )
     date = models.DateTimeField(auto_now_add=True)
     total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    # Sum of the invoice's payments; kept in step by services.record_payment
     paid_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    due_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Idempotency key sent with the sale form or an offline sync; a resubmitted sale finds its invoice
+    client_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['store', 'date']),
+            models.Index(fields=['customer', 'date']),
+            # Only unpaid invoices, so dues and aging never scan settled history
+            models.Index(fields=['customer', 'date'], condition=models.Q(due_amount__gt=0), name='invoice_open_due_idx'),
+        ]
 
     @property
     def balance_due(self):
-        return self.total_amount - self.paid_amount
+        return self.due_amount
 
     def __str__(self):
         return f"Invoice #{self.id} - {self.customer_name}"
@@ -99,6 +163,7 @@ class InvoiceItem(models.Model):
 class Location(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.CharField(max_length=200, blank=True)
+    version = models.BigIntegerField(default=0, db_index=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -123,7 +188,10 @@ class Purchase(models.Model):
     date = models.DateTimeField(auto_now_add=True)
     invoice_number = models.CharField(max_length=50, blank=True, help_text="Supplier's Invoice Number")
     total_amount = models.DecimalField(max_digits=12, decimal_places=2)
-    
+
+    class Meta:
+        indexes = [models.Index(fields=['date'])]
+
     def __str__(self):
         return f"Purchase #{self.id} - {self.supplier.name if self.supplier else 'Unknown'}"
 
@@ -139,3 +207,254 @@ class PurchaseItem(models.Model):
 
     def __str__(self):
         return f"{self.product.name} ({self.quantity})"
+
+class DailyStoreSales(models.Model):
+    """
+    Per-store, per-day totals kept up to date in the same transaction as each
+    invoice and purchase, so dashboards read a handful of rows instead of
+    aggregating every invoice. Purchases are booked against the Central Godown.
+    Rebuild with ``manage.py rebuild_daily_sales``.
+    """
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    sales_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    invoice_count = models.PositiveIntegerField(default=0)
+    purchase_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('store', 'day')
+        indexes = [models.Index(fields=['day', 'store'])]
+        verbose_name_plural = 'Daily store sales'
+
+    @property
+    def due_total(self):
+        return self.sales_total - self.paid_total
+
+    def __str__(self):
+        return f"{self.store.name} - {self.day}"
+
+class StockMovement(models.Model):
+    """
+    Append-only record of every change to a Stock quantity. Stock is a cached
+    projection of this ledger; see inventory.ledger.
+    """
+    KINDS = (
+        ('OPENING', 'Opening balance'),
+        ('SALE', 'Sale'),
+        ('PURCHASE', 'Purchase'),
+        ('ADJUSTMENT', 'Adjustment'),
+    )
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    store = models.ForeignKey(Store, on_delete=models.CASCADE)
+    quantity = models.DecimalField(max_digits=10, decimal_places=2, help_text="Signed change in stock")
+    kind = models.CharField(max_length=20, choices=KINDS)
+    created_at = models.DateTimeField(default=timezone.now)
+    invoice = models.ForeignKey(Invoice, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    purchase = models.ForeignKey(Purchase, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    note = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['product', 'store', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.quantity:+} of product #{self.product_id} at store #{self.store_id}"
+
+class StockSnapshot(models.Model):
+    """
+    Stock quantity of a product in a store including every movement up to
+    ``last_movement_id``, so stock-at-time queries only replay later movements.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    store = models.ForeignKey(Store, on_delete=models.CASCADE)
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    last_movement_id = models.BigIntegerField()
+    taken_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'store', 'taken_at']),
+            models.Index(fields=['last_movement_id']),
+        ]
+
+    def __str__(self):
+        return f"Product #{self.product_id} at store #{self.store_id}: {self.quantity} ({self.taken_at:%Y-%m-%d %H:%M})"
+
+
+class ProductStats(models.Model):
+    """
+    Per-product totals shown and sorted on in the product admin, kept up to
+    date in the same transaction as stock movements and purchases so the
+    changelist never aggregates stock and purchase history. Rebuild with
+    ``manage.py rebuild_product_stats``.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total_stock = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Number of purchase lines for the product
+    purchase_count = models.PositiveIntegerField(default=0)
+    last_purchase_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # The admin breaks ties on the primary key, so each index ends with it
+        indexes = [
+            models.Index(fields=['total_stock', 'product']),
+            models.Index(fields=['purchase_count', 'product']),
+            models.Index(fields=['last_purchase_date', 'product']),
+        ]
+        verbose_name_plural = 'Product stats'
+
+    def __str__(self):
+        return f"Stats for product #{self.product_id}"
+
+
+class Payment(models.Model):
+    """Money received against an invoice, at the sale or later. Record with services.record_payment."""
+    METHOD_CHOICES = (
+        ('CASH', 'Cash'),
+        ('UPI', 'UPI'),
+        ('CARD', 'Card'),
+        ('BANK', 'Bank transfer'),
+        ('OTHER', 'Other'),
+    )
+    invoice = models.ForeignKey(Invoice, related_name='payments', on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    method = models.CharField(max_length=10, choices=METHOD_CHOICES, default='CASH')
+    date = models.DateTimeField(default=timezone.now)
+    note = models.CharField(max_length=200, blank=True)
+    recorded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['date'])]
+
+    def __str__(self):
+        return f"{self.amount} for invoice #{self.invoice_id}"
+
+
+class CustomerBalance(models.Model):
+    """
+    Running totals per customer, updated in the same transaction as each
+    sale and payment. Rebuild with ``manage.py rebuild_receivables``.
+    """
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, related_name='balance')
+    invoice_count = models.PositiveIntegerField(default=0)
+    billed = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_payment_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['balance', 'customer'])]
+
+    def __str__(self):
+        return f"Balance of customer #{self.customer_id}: {self.balance}"
+
+
+class SyncTombstone(models.Model):
+    """A deleted product, location or stock row, so catalog delta sync can tell clients to drop it."""
+    KIND_CHOICES = (
+        ('product', 'Product'),
+        ('location', 'Location'),
+        ('stock', 'Stock'),
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Product or location id; for stock, the product id
+    object_id = models.BigIntegerField()
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, null=True, blank=True, db_constraint=False)
+    version = models.BigIntegerField(db_index=True)
+
+    def __str__(self):
+        return f"Deleted {self.kind} #{self.object_id}"
+
+
+# Closed financial years, moved out of the tables above by inventory/archive.py.
+# Each row keeps its original id and columns, so the same lookups work on both.
+
+class ArchivedInvoice(models.Model):
+    """A settled invoice from a closed financial year; see inventory/archive.py."""
+    id = models.BigIntegerField(primary_key=True)
+    store = models.ForeignKey(Store, on_delete=models.CASCADE)
+    customer_name = models.CharField(max_length=100)
+    customer_mobile = models.CharField(max_length=15, blank=True, null=True)
+    customer = models.ForeignKey(
+        Customer, related_name='archived_invoices', on_delete=models.SET_NULL, null=True, blank=True, db_index=False
+    )
+    date = models.DateTimeField()
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    paid_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    due_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    client_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['store', 'date']),
+            models.Index(fields=['customer', 'date']),
+            models.Index(fields=['date']),
+        ]
+
+    def __str__(self):
+        return f"Invoice #{self.id} - {self.customer_name} (archived)"
+
+class ArchivedInvoiceItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    invoice = models.ForeignKey(ArchivedInvoice, related_name='items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    rate = models.DecimalField(max_digits=10, decimal_places=2)
+    location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True)
+
+    @property
+    def item_total(self):
+        return self.quantity * self.rate
+
+    def __str__(self):
+        return f"{self.product.name} ({self.quantity})"
+
+class ArchivedInvoiceContact(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    invoice = models.ForeignKey(ArchivedInvoice, related_name='contacts', on_delete=models.CASCADE)
+    mobile = models.CharField(max_length=15)
+
+    def __str__(self):
+        return self.mobile
+
+class ArchivedPayment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    invoice = models.ForeignKey(ArchivedInvoice, related_name='payments', on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    method = models.CharField(max_length=10, choices=Payment.METHOD_CHOICES, default='CASH')
+    date = models.DateTimeField()
+    note = models.CharField(max_length=200, blank=True)
+    recorded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    def __str__(self):
+        return f"{self.amount} for invoice #{self.invoice_id}"
+
+class ArchivedPurchase(models.Model):
+    """A purchase from a closed financial year; see inventory/archive.py."""
+    id = models.BigIntegerField(primary_key=True)
+    supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True)
+    date = models.DateTimeField()
+    invoice_number = models.CharField(max_length=50, blank=True)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['date'])]
+
+    def __str__(self):
+        return f"Purchase #{self.id} - {self.supplier.name if self.supplier else 'Unknown'} (archived)"
+
+class ArchivedPurchaseItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    purchase = models.ForeignKey(ArchivedPurchase, related_name='items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    rate = models.DecimalField(max_digits=10, decimal_places=2)
+
+    @property
+    def item_total(self):
+        return self.quantity * self.rate
+
+    def __str__(self):
+        return f"{self.product.name} ({self.quantity})"
@@ -0,0 +1,240 @@
+"""
+In-process fuzzy product search for the typeahead pickers.
+
+Each worker keeps a trigram index over product name, size and category:
+``postings`` maps every three-character piece of a word (padded with a
+leading and trailing space) to the ids of the products containing it. A query
+is split into the same pieces; the products sharing the most of them are
+ranked by how much of each query word they contain, with a bonus for words
+they start with, so "ivry 2x4" still finds "Ivory Matt" in 2x4.
+
+The index is built from the catalog cache on first use and kept current
+without rebuilding: in this process by Product signals once the transaction
+commits, and from other processes' writes by reading the rows whose sync
+``version`` changed (and their tombstones) whenever the catalog version moves.
+Searches themselves never touch the database.
+
+Postings are append-only. A product that changes or goes away leaves stale
+ids behind, which ranking ignores because it checks each candidate's current
+text; the postings are rebuilt in memory once stale ids pile up.
+"""
+import re
+import threading
+from collections import Counter
+from itertools import islice
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Product, SyncTombstone
+from . import catalog_cache, catalog_sync
+
+SEARCH_LIMIT = 20
+# Products ranked per query, picked by the number of shared trigrams
+CANDIDATES = 200
+# Posting entries counted per query; rarer trigrams go first and the commonest are skipped
+POSTINGS_BUDGET = 10_000
+PREFIX_BONUS = 0.5
+# Results must share at least this share of one query word's trigrams
+MIN_SCORE = 0.3
+
+_SIZE = re.compile(r'(\d)\s*[x*×]\s*(\d)')
+_NON_WORD = re.compile(r'[^\w.]+')
+
+
+def normalize(text):
+    """Casefolded words, with sizes written as ``600x1200`` however they were typed."""
+    text = _SIZE.sub(r'\1x\2', (text or '').casefold())
+    return _NON_WORD.sub(' ', text).split()
+
+
+def _word_trigrams(word):
+    padded = f' {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _query_trigrams(word):
+    # No trailing space, so a word still being typed matches longer ones
+    padded = f' {word}'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _document(product):
+    words = normalize(f"{product['name']} {product['size']} {product['category_display']}")
+    return ' %s ' % ' '.join(words)
+
+
+class ProductIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        # product id -> (text, result dict)
+        self.docs = {}
+        # trigram -> [product id], in insertion order
+        self.postings = {}
+        self.entries = 0
+        self.stale = 0
+        self.seen_version = None
+        self.synced = None
+
+    def _trigrams(self, text):
+        grams = set()
+        for word in text.split():
+            grams |= _word_trigrams(word)
+        return grams
+
+    def _put(self, product):
+        text = _document(product)
+        old = self.docs.get(product['id'])
+        self.docs[product['id']] = (text, {
+            'id': product['id'],
+            'name': product['name'],
+            'size': product['size'],
+            'category': product['category'],
+            'category_display': product['category_display'],
+        })
+        grams = self._trigrams(text)
+        if old:
+            old_grams = self._trigrams(old[0])
+            self.stale += len(old_grams - grams)
+            grams -= old_grams
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(product['id'])
+        self.entries += len(grams)
+
+    def _remove(self, product_id):
+        old = self.docs.pop(product_id, None)
+        if old:
+            self.stale += len(self._trigrams(old[0]))
+
+    def _compact(self):
+        if self.stale * 4 <= self.entries:
+            return
+        docs = self.docs
+        self.docs, self.postings, self.entries, self.stale = {}, {}, 0, 0
+        for _, product in docs.values():
+            self._put(product)
+
+    def put(self, products):
+        with self._lock:
+            if self.synced is not None:
+                for product in products:
+                    self._put(product)
+                self._compact()
+
+    def remove(self, product_ids):
+        with self._lock:
+            if self.synced is not None:
+                for product_id in product_ids:
+                    self._remove(product_id)
+                self._compact()
+
+    def refresh(self):
+        """Bring the index up to date with the database when the catalog version has moved."""
+        current = catalog_cache.version(catalog_cache.CATALOG)
+        if current == self.seen_version:
+            return
+        with self._lock:
+            if current == self.seen_version:
+                return
+            # Taken before reading, as for catalog_sync deltas
+            started = catalog_sync.now_version()
+            if self.synced is None:
+                for product in catalog_cache.catalog():
+                    self._put(product)
+            else:
+                after = self.synced - catalog_sync.SYNC_LOOKBACK
+                changed = Product.objects.filter(version__gt=after).order_by('name')
+                for product in catalog_cache.product_dicts(changed):
+                    self._put(product)
+                deleted = SyncTombstone.objects.filter(kind='product', version__gt=after)
+                for product_id in deleted.values_list('object_id', flat=True):
+                    self._remove(product_id)
+                self._compact()
+            self.synced = started
+            self.seen_version = current
+
+    def _candidates(self, grams):
+        counts = Counter()
+        used = 0
+        for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+            posting = self.postings.get(gram)
+            if not posting:
+                continue
+            if used and used + len(posting) > POSTINGS_BUDGET:
+                break
+            counts.update(posting)
+            used += len(posting)
+        if len(counts) <= CANDIDATES:
+            return list(counts)
+        # Lowest count that still yields CANDIDATES products, from a histogram of the counts
+        histogram = Counter(counts.values())
+        cutoff, total = 0, 0
+        for count in sorted(histogram, reverse=True):
+            cutoff, total = count, total + histogram[count]
+            if total >= CANDIDATES:
+                break
+        above = [pid for pid, count in counts.items() if count > cutoff]
+        at = (pid for pid, count in counts.items() if count == cutoff)
+        return above + list(islice(at, CANDIDATES - len(above)))
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """The ``limit`` best matches for ``query`` as dicts with a ``score``, best first."""
+        words = [(f' {word}', _query_trigrams(word)) for word in normalize(query)]
+        grams = set().union(*(word_grams for _, word_grams in words))
+        if not grams:
+            return []
+        self.refresh()
+        with self._lock:
+            scored = []
+            for product_id in self._candidates(grams):
+                doc = self.docs.get(product_id)
+                if doc is None:
+                    continue
+                text = doc[0]
+                score = 0.0
+                for prefix, word_grams in words:
+                    if word_grams:
+                        score += sum(gram in text for gram in word_grams) / len(word_grams)
+                    if prefix in text:
+                        score += PREFIX_BONUS
+                if score >= MIN_SCORE:
+                    scored.append((-score, doc[1]['name'], product_id, doc[1]))
+        scored.sort(key=lambda row: row[:3])
+        return [{**product, 'score': round(-score, 3)} for score, _, _, product in scored[:limit]]
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+
+index = ProductIndex()
+
+
+def search_products(query, limit=SEARCH_LIMIT):
+    return index.search(query, limit)
+
+
+def _product_dict(instance):
+    return {
+        'id': instance.pk,
+        'name': instance.name,
+        'size': instance.size,
+        'category': instance.category,
+        'category_display': instance.get_category_display(),
+    }
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    product = _product_dict(instance)
+    transaction.on_commit(lambda: index.put([product]))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: index.remove([product_id]))
@@ -0,0 +1,127 @@
+"""
+ProductStats maintenance.
+
+The ledger calls ``bump_stock`` for every stock change and ``record_purchase``
+in services calls ``record_purchase_items``, both inside the transaction that
+wrote the source rows. ``rebuild_product_stats`` recomputes everything from
+Stock and the purchase items, hot and archived.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Max, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import ArchivedPurchaseItem, Product, ProductStats, PurchaseItem, Stock
+
+STATS_FIELDS = ('total_stock', 'purchase_count', 'last_purchase_date')
+STATS_BATCH_SIZE = 500
+
+
+def _bump(changes, initial):
+    """
+    Apply ``changes`` ({product_id: {field: expression}}) with one UPDATE per
+    batch, and create missing rows from ``initial`` ({product_id: {field: value}}).
+    """
+    product_ids = list(changes)
+    for start in range(0, len(product_ids), STATS_BATCH_SIZE):
+        batch = product_ids[start:start + STATS_BATCH_SIZE]
+        rows = ProductStats.objects.filter(product_id__in=batch)
+        update = {
+            name: Case(
+                *[When(product_id=pid, then=changes[pid][name]) for pid in batch],
+                default=F(name),
+                output_field=ProductStats._meta.get_field(name),
+            )
+            for name in changes[batch[0]]
+        }
+        if rows.update(**update) == len(batch):
+            continue
+        present = set(rows.values_list('product_id', flat=True))
+        missing = [pid for pid in batch if pid not in present]
+        try:
+            with transaction.atomic():
+                ProductStats.objects.bulk_create([ProductStats(product_id=pid, **initial[pid]) for pid in missing])
+        except IntegrityError:
+            # Another transaction created some of the rows first.
+            ProductStats.objects.filter(product_id__in=missing).update(**update)
+
+
+def bump_stock(deltas):
+    """Add ``deltas`` ({product_id: quantity}) to the products' total stock."""
+    deltas = {pid: delta for pid, delta in deltas.items() if delta}
+    _bump(
+        {pid: {'total_stock': F('total_stock') + delta} for pid, delta in deltas.items()},
+        {pid: {'total_stock': delta} for pid, delta in deltas.items()},
+    )
+
+
+def record_purchase_items(purchase, counts):
+    """Book ``counts`` ({product_id: number of lines}) from ``purchase``."""
+    date = Value(purchase.date)
+    _bump(
+        {
+            pid: {
+                'purchase_count': F('purchase_count') + count,
+                'last_purchase_date': Greatest(Coalesce('last_purchase_date', date), date),
+            }
+            for pid, count in counts.items()
+        },
+        {pid: {'purchase_count': count, 'last_purchase_date': purchase.date} for pid, count in counts.items()},
+    )
+
+
+def ensure_stats(product_ids):
+    """Create zero rows for new products so they sort with the rest in the admin."""
+    ProductStats.objects.bulk_create(
+        [ProductStats(product_id=pid) for pid in product_ids], batch_size=STATS_BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def compute_product_stats():
+    """Recompute the stats from Stock and purchase items (archived ones too) as {product_id: {field: value}}."""
+    expected = {
+        pid: {'total_stock': Decimal('0'), 'purchase_count': 0, 'last_purchase_date': None}
+        for pid in Product.objects.values_list('id', flat=True)
+    }
+    for row in Stock.objects.values('product_id').annotate(total=Sum('quantity')).order_by():
+        expected[row['product_id']]['total_stock'] = row['total']
+    for model in (PurchaseItem, ArchivedPurchaseItem):
+        purchase_rows = (
+            model.objects.values('product_id')
+            .annotate(count=Count('id'), last=Max('purchase__date'))
+            .order_by()
+        )
+        for row in purchase_rows:
+            stats = expected[row['product_id']]
+            stats['purchase_count'] += row['count']
+            if stats['last_purchase_date'] is None or row['last'] > stats['last_purchase_date']:
+                stats['last_purchase_date'] = row['last']
+    return expected
+
+
+def find_drift(expected):
+    """Return (product_id, field, stored, expected) for every mismatch."""
+    actual = {row['product_id']: row for row in ProductStats.objects.values('product_id', *STATS_FIELDS)}
+    drift = []
+    for pid in sorted(set(expected) | set(actual)):
+        stored = actual.get(pid)
+        wanted = expected.get(pid)
+        for field in STATS_FIELDS:
+            stored_value = stored[field] if stored else None
+            wanted_value = wanted[field] if wanted else None
+            if stored_value != wanted_value:
+                drift.append((pid, field, stored_value, wanted_value))
+    return drift
+
+
+def rebuild_product_stats():
+    """Replace every ProductStats row with values recomputed from history."""
+    with transaction.atomic():
+        expected = compute_product_stats()
+        ProductStats.objects.all().delete()
+        ProductStats.objects.bulk_create(
+            [ProductStats(product_id=pid, **stats) for pid, stats in expected.items()],
+            batch_size=1000,
+        )
+    return len(expected)
@@ -0,0 +1,141 @@
+"""
+SQL query counting and N+1 detection.
+
+``QueryRecorder`` wraps database execution (``connection.execute_wrapper``)
+and groups statements by shape: the SQL with placeholders, IN lists collapsed,
+so the same lookup for different rows counts as one shape. A shape that runs
+``QUERY_REPEAT_THRESHOLD`` times or more in one request is an N+1 suspect;
+the call stack of its first repeat is kept for the report.
+
+QueryBudgetMiddleware logs requests that go over ``settings.QUERY_BUDGETS``
+(keyed by URL name) or contain N+1 suspects. Tests use ``assert_query_budget``
+to fail instead.
+"""
+import logging
+import re
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('inventory.queries')
+
+DEFAULT_REPEAT_THRESHOLD = 5
+# Frames outside the project (Django, the stdlib) are left out of reported stacks.
+PROJECT_DIR = str(Path(__file__).resolve().parent.parent)
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_VALUES_LIST = re.compile(r'VALUES (?:\((?:%s, )*%s\), )*\((?:%s, )*%s\)')
+
+
+def fingerprint(sql):
+    """Query shape: parameterised SQL with variable-length lists collapsed."""
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _VALUES_LIST.sub('VALUES (...)', sql)
+
+
+def project_stack():
+    """The current call stack, limited to this project's own code."""
+    frames = [
+        frame for frame in traceback.extract_stack()[:-1]
+        if frame.filename.startswith(PROJECT_DIR) and '/site-packages/' not in frame.filename
+        and not frame.filename.endswith('querycount.py')
+    ]
+    return ''.join(traceback.format_list(frames))
+
+
+def budget_for(view_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+
+
+def repeat_threshold():
+    return getattr(settings, 'QUERY_REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD)
+
+
+class QueryRecorder:
+    """Counts, times and fingerprints every query run on all connections while active."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        # fingerprint -> [count, stack of the first repeat]
+        self.shapes = {}
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            key = fingerprint(sql)
+            shape = self.shapes.get(key)
+            if shape is None:
+                self.shapes[key] = [1, None]
+            else:
+                shape[0] += 1
+                if shape[1] is None:
+                    shape[1] = project_stack()
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def suspects(self, threshold=None):
+        """[(fingerprint, count, stack)] for shapes repeated at least ``threshold`` times."""
+        threshold = threshold or repeat_threshold()
+        return sorted(
+            ((sql, count, stack) for sql, (count, stack) in self.shapes.items() if count >= threshold),
+            key=lambda item: -item[1],
+        )
+
+    def report(self, view_name, budget=None, threshold=None):
+        """Text describing budget overruns and N+1 suspects, or '' when there are none."""
+        lines = []
+        if budget is not None and self.count > budget:
+            lines.append(f"{view_name} ran {self.count} queries (budget {budget})")
+        for sql, count, stack in self.suspects(threshold):
+            lines.append(f"{view_name}: possible N+1, {count}x {sql}\n{stack}")
+        return '\n'.join(lines)
+
+
+class QueryBudgetMiddleware:
+    """
+    Opt-in: add to MIDDLEWARE (settings does when QUERY_BUDGET_CHECKS is set)
+    to log over-budget requests and N+1 suspects as warnings.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        match = request.resolver_match
+        view_name = match.view_name if match else request.path
+        report = recorder.report(view_name, budget_for(view_name))
+        if report:
+            logger.warning("%s %s\n%s", request.method, request.path, report)
+        return response
+
+
+@contextmanager
+def assert_query_budget(view_name, budget=None, threshold=None):
+    """
+    Fail with the N+1 report when the block goes over the view's budget from
+    settings.QUERY_BUDGETS (or ``budget``) or repeats a query shape.
+    """
+    budget = budget if budget is not None else budget_for(view_name)
+    with QueryRecorder() as recorder:
+        yield recorder
+    report = recorder.report(view_name, budget, threshold)
+    if report:
+        raise AssertionError(report)
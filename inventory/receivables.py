@@ -0,0 +1,194 @@
+"""
+Customer receivables.
+
+Each invoice carries its outstanding ``due_amount`` and each customer a
+CustomerBalance row, both changed in the transaction that records the sale or
+payment. The dues page pages through CustomerBalance by balance and ages each
+customer's open invoices through a partial index on unpaid invoices only, so
+it costs the same however many settled invoices pile up.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, Max, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import ArchivedInvoice, ArchivedPayment, CustomerBalance, Invoice, Payment
+from .reports import day_bounds
+
+# (label, newest age in days, oldest age in days or None)
+AGING_BUCKETS = (('0-30', 0, 30), ('31-60', 31, 60), ('60+', 61, None))
+BALANCE_FIELDS = ('invoice_count', 'billed', 'paid', 'balance', 'last_payment_at')
+DUES_PAGE_SIZE = 50
+
+
+def bump_balance(customer_id, billed=Decimal('0'), paid=Decimal('0'), invoices=0, paid_at=None):
+    """Add a sale (``billed``, ``invoices``) and/or a payment (``paid``) to a customer's running balance."""
+    changes = {
+        'invoice_count': F('invoice_count') + invoices,
+        'billed': F('billed') + billed,
+        'paid': F('paid') + paid,
+        'balance': F('balance') + billed - paid,
+    }
+    if paid_at:
+        changes['last_payment_at'] = Greatest(Coalesce('last_payment_at', Value(paid_at)), Value(paid_at))
+    rows = CustomerBalance.objects.filter(customer_id=customer_id)
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            CustomerBalance.objects.create(
+                customer_id=customer_id, invoice_count=invoices, billed=billed, paid=paid,
+                balance=billed - paid, last_payment_at=paid_at,
+            )
+    except IntegrityError:
+        # Another transaction created the row first.
+        rows.update(**changes)
+
+
+def _bucket_sums(today):
+    sums = {}
+    for label, newest, oldest in AGING_BUCKETS:
+        condition = Q()
+        if newest:
+            condition &= Q(date__lt=day_bounds(today - timedelta(days=newest - 1), today)[0])
+        if oldest is not None:
+            condition &= Q(date__gte=day_bounds(today - timedelta(days=oldest), today)[0])
+        sums[label] = Coalesce(
+            Sum(Case(When(condition, then='due_amount'), default=Value(0), output_field=DecimalField())),
+            Value(0), output_field=DecimalField(),
+        )
+    return sums
+
+
+def open_invoices():
+    return Invoice.objects.filter(due_amount__gt=0)
+
+
+def aging_by_customer(customer_ids, today=None):
+    """{customer_id: {bucket label: due}} from the customers' unpaid invoices."""
+    today = today or timezone.localdate()
+    rows = (
+        open_invoices().filter(customer_id__in=customer_ids)
+        .values('customer_id').annotate(**_bucket_sums(today)).order_by()
+    )
+    return {row.pop('customer_id'): row for row in rows}
+
+
+def aging_totals(today=None):
+    """Bucket totals over every unpaid invoice, plus the part owed by walk-in (unlinked) sales."""
+    today = today or timezone.localdate()
+    totals = open_invoices().aggregate(**_bucket_sums(today))
+    walk_in = open_invoices().filter(customer__isnull=True).aggregate(due=Sum('due_amount'))['due'] or 0
+    return totals, walk_in
+
+
+def decode_dues_cursor(value):
+    """Return (balance, customer_id) from a dues page cursor, or None when malformed."""
+    balance, _, pk = (value or '').partition('_')
+    try:
+        return Decimal(balance), int(pk)
+    except (ArithmeticError, ValueError):
+        return None
+
+
+def dues_page(cursor=None, size=DUES_PAGE_SIZE, today=None):
+    """
+    Customers who owe money, largest balance first, each with the aging of
+    their unpaid invoices. Seeks on the (balance, customer) index from
+    ``cursor`` instead of using OFFSET. Returns (rows, next_cursor).
+    """
+    balances = CustomerBalance.objects.filter(balance__gt=0).select_related('customer')
+    if cursor:
+        balance, pk = cursor
+        balances = balances.filter(Q(balance__lt=balance) | Q(balance=balance, customer_id__lt=pk))
+    rows = list(balances.order_by('-balance', '-customer_id')[:size + 1])
+    next_cursor = f'{rows[size - 1].balance}_{rows[size - 1].customer_id}' if len(rows) > size else None
+    rows = rows[:size]
+    aging = aging_by_customer([row.customer_id for row in rows], today)
+    for row in rows:
+        row.aging = [aging.get(row.customer_id, {}).get(label, 0) for label, _, _ in AGING_BUCKETS]
+    return rows, next_cursor
+
+
+def compute_balances():
+    """
+    Recompute CustomerBalance from invoices and payments, archived ones
+    included, as {customer_id: {field: value}}.
+    """
+    expected = {}
+    for model in (Invoice, ArchivedInvoice):
+        invoice_rows = (
+            model.objects.filter(customer__isnull=False).values('customer_id')
+            .annotate(count=Count('id'), billed=Sum('total_amount'), paid=Sum('paid_amount'))
+            .order_by()
+        )
+        for row in invoice_rows:
+            totals = expected.setdefault(row['customer_id'], {
+                'invoice_count': 0, 'billed': Decimal('0'), 'paid': Decimal('0'),
+                'balance': Decimal('0'), 'last_payment_at': None,
+            })
+            totals['invoice_count'] += row['count']
+            totals['billed'] += row['billed']
+            totals['paid'] += row['paid']
+            totals['balance'] = totals['billed'] - totals['paid']
+    for model in (Payment, ArchivedPayment):
+        payment_rows = (
+            model.objects.filter(invoice__customer__isnull=False).values('invoice__customer_id')
+            .annotate(last=Max('date')).order_by()
+        )
+        for row in payment_rows:
+            totals = expected[row['invoice__customer_id']]
+            if totals['last_payment_at'] is None or row['last'] > totals['last_payment_at']:
+                totals['last_payment_at'] = row['last']
+    return expected
+
+
+def invoice_drift():
+    """Invoices whose paid or due amount disagrees with their payments: [(invoice, paid, due)]."""
+    paid_by_invoice = dict(
+        Payment.objects.values('invoice_id').annotate(total=Sum('amount')).order_by().values_list('invoice_id', 'total')
+    )
+    drift = []
+    for invoice in Invoice.objects.only('id', 'total_amount', 'paid_amount', 'due_amount').iterator(chunk_size=2000):
+        paid = paid_by_invoice.get(invoice.id, Decimal('0'))
+        due = invoice.total_amount - paid
+        if invoice.paid_amount != paid or invoice.due_amount != due:
+            drift.append((invoice, paid, due))
+    return drift
+
+
+def find_drift(expected):
+    """Return (customer_id, field, stored, expected) for every mismatch."""
+    actual = {row['customer_id']: row for row in CustomerBalance.objects.values('customer_id', *BALANCE_FIELDS)}
+    drift = []
+    for customer_id in sorted(set(expected) | set(actual)):
+        stored, wanted = actual.get(customer_id), expected.get(customer_id)
+        for field in BALANCE_FIELDS:
+            stored_value = stored[field] if stored else None
+            wanted_value = wanted[field] if wanted else None
+            if stored_value != wanted_value:
+                drift.append((customer_id, field, stored_value, wanted_value))
+    return drift
+
+
+def rebuild_receivables():
+    """
+    Reset invoice paid/due amounts from payments, then every CustomerBalance
+    from the invoices. Returns (invoices fixed, balance rows written).
+    """
+    with transaction.atomic():
+        drift = invoice_drift()
+        for invoice, paid, due in drift:
+            invoice.paid_amount, invoice.due_amount = paid, due
+        Invoice.objects.bulk_update([invoice for invoice, _, _ in drift], ['paid_amount', 'due_amount'], batch_size=500)
+
+        expected = compute_balances()
+        CustomerBalance.objects.all().delete()
+        CustomerBalance.objects.bulk_create(
+            [CustomerBalance(customer_id=cid, **values) for cid, values in expected.items()],
+            batch_size=1000,
+        )
+    return len(drift), len(expected)
@@ -0,0 +1,82 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+# Invoices shown per store before an "Older invoices" link.
+SUMMARY_PAGE_SIZE = 25
+
+
+def parse_day(value, default):
+    try:
+        return parse_date(value or '') or default
+    except ValueError:
+        return default
+
+
+def day_bounds(first_day, last_day):
+    """
+    Half-open [start, end) datetimes covering ``first_day`` through
+    ``last_day`` in the current timezone, so ``date__gte=start, date__lt=end``
+    can use an index on the date column.
+    """
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(first_day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def encode_cursor(invoice):
+    return f"{invoice.date.isoformat()}_{invoice.id}"
+
+
+def decode_cursor(value):
+    """Return (date, id) from an ``encode_cursor`` value, or None when malformed."""
+    stamp, _, pk = (value or '').rpartition('_')
+    try:
+        moment = parse_datetime(stamp)
+        return (moment, int(pk)) if moment else None
+    except ValueError:
+        return None
+
+
+def keyset_pages_by_store(queryset, cursor=None, size=SUMMARY_PAGE_SIZE):
+    """
+    Newest-first page of invoices for every store in ``queryset``, fetched in
+    one query by numbering rows per store with a window function. Pages are
+    strictly older than ``cursor`` (a (date, id) pair) and seek on (date, id)
+    instead of OFFSET so deep pages stay cheap.
+
+    Returns {store_id: (rows, next_cursor)}; next_cursor is None on a store's
+    last page.
+    """
+    if cursor:
+        moment, pk = cursor
+        queryset = queryset.filter(Q(date__lt=moment) | Q(date=moment, id__lt=pk))
+    queryset = queryset.annotate(
+        store_row=Window(RowNumber(), partition_by=F('store_id'), order_by=[F('date').desc(), F('id').desc()])
+    ).filter(store_row__lte=size + 1).order_by('store_id', '-date', '-id')
+
+    rows_by_store = {}
+    for invoice in queryset:
+        rows_by_store.setdefault(invoice.store_id, []).append(invoice)
+    pages = {}
+    for store_id, rows in rows_by_store.items():
+        if len(rows) > size:
+            pages[store_id] = (rows[:size], encode_cursor(rows[size - 1]))
+        else:
+            pages[store_id] = (rows, None)
+    return pages
+
+
+def summary_period(params, today=None):
+    """Read ``from``/``to`` from query params; both default to today and are kept in order."""
+    today = today or timezone.localdate()
+    first_day = parse_day(params.get('from'), today)
+    last_day = parse_day(params.get('to'), today)
+    if last_day < first_day:
+        first_day, last_day = last_day, first_day
+    return first_day, last_day
+
@@ -0,0 +1,120 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ArchivedInvoice, ArchivedPurchase, DailyStoreSales, Invoice, Purchase, Store
+
+ROLLUP_FIELDS = ('sales_total', 'paid_total', 'invoice_count', 'purchase_total')
+
+
+def bump_daily_sales(store_id, day, **amounts):
+    """
+    Add ``amounts`` (keyed by ROLLUP_FIELDS) to the (store_id, day) rollup row,
+    creating it on first use. Call inside the transaction that wrote the
+    underlying invoice or purchase.
+    """
+    changes = {field: F(field) + value for field, value in amounts.items() if value}
+    if not changes:
+        return
+    rows = DailyStoreSales.objects.filter(store_id=store_id, day=day)
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailyStoreSales.objects.create(store_id=store_id, day=day, **amounts)
+    except IntegrityError:
+        # Another transaction created the row first.
+        rows.update(**changes)
+
+
+def record_invoice(invoice):
+    bump_daily_sales(
+        invoice.store_id,
+        timezone.localdate(invoice.date),
+        sales_total=invoice.total_amount,
+        paid_total=invoice.paid_amount,
+        invoice_count=1,
+    )
+
+
+def record_purchase(purchase, godown):
+    bump_daily_sales(godown.pk, timezone.localdate(purchase.date), purchase_total=purchase.total_amount)
+
+
+def daily_totals(store, day):
+    """Rollup values for one store and day, all zero when nothing was booked."""
+    row = DailyStoreSales.objects.filter(store=store, day=day).first() if store else None
+    return row or DailyStoreSales(store=store, day=day)
+
+
+async def adaily_totals(store_id, day):
+    """daily_totals() for async views, by store id."""
+    row = await DailyStoreSales.objects.filter(store_id=store_id, day=day).afirst() if store_id else None
+    return row or DailyStoreSales(store_id=store_id, day=day)
+
+
+def compute_daily_sales():
+    """
+    Recompute the rollup from invoices and purchases, archived ones included,
+    as {(store_id, day): {field: value}}.
+    """
+    expected = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+    for model in (Invoice, ArchivedInvoice):
+        invoice_rows = (
+            model.objects.annotate(day=TruncDate('date'))
+            .values('store_id', 'day')
+            .annotate(sales=Sum('total_amount'), paid=Sum('paid_amount'), count=Count('id'))
+            .order_by()
+        )
+        for row in invoice_rows:
+            totals = expected[(row['store_id'], row['day'])]
+            totals['sales_total'] += row['sales']
+            totals['paid_total'] += row['paid']
+            totals['invoice_count'] += row['count']
+
+    godown = Store.objects.filter(store_type='GODOWN').first()
+    if godown:
+        for model in (Purchase, ArchivedPurchase):
+            purchase_rows = (
+                model.objects.annotate(day=TruncDate('date'))
+                .values('day')
+                .annotate(total=Sum('total_amount'))
+                .order_by()
+            )
+            for row in purchase_rows:
+                expected[(godown.pk, row['day'])]['purchase_total'] += row['total']
+    return expected
+
+
+def find_drift(expected):
+    """Return (store_id, day, field, stored, expected) for every mismatch."""
+    actual = {
+        (row.store_id, row.day): row
+        for row in DailyStoreSales.objects.all()
+    }
+    drift = []
+    for key in sorted(set(expected) | set(actual), key=lambda k: (k[1], k[0])):
+        row = actual.get(key)
+        totals = expected.get(key, {})
+        for field in ROLLUP_FIELDS:
+            stored = getattr(row, field) if row else 0
+            wanted = totals.get(field, 0)
+            if Decimal(stored) != Decimal(wanted):
+                drift.append((key[0], key[1], field, stored, wanted))
+    return drift
+
+
+def rebuild_daily_sales():
+    """Replace the whole rollup with values recomputed from history."""
+    with transaction.atomic():
+        expected = compute_daily_sales()
+        DailyStoreSales.objects.all().delete()
+        DailyStoreSales.objects.bulk_create(
+            [DailyStoreSales(store_id=store_id, day=day, **totals) for (store_id, day), totals in expected.items()],
+            batch_size=1000,
+        )
+    return len(expected)
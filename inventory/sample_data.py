@@ -0,0 +1,259 @@
+"""
+Synthetic shop data for benchmarks and load tests.
+
+seed_sample_data() fills an empty database with stores, a catalog with
+locations, suppliers and purchases, and a year (by default) of invoices with
+items, contacts, customers and payments, all drawn from one random seed so
+the same arguments always give the same rows. History is written with
+bulk_create in date order; stock movements mirror what record_sale and
+record_purchase post, and Stock, ProductStats, DailyStoreSales and the
+customer balances are then rebuilt from that history with the same functions
+as the rebuild_* commands, so every invariant those commands check holds.
+Used by ``manage.py seed_sample_data`` and benchmarks/scenarios.py.
+"""
+import random
+from contextlib import contextmanager
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .catalog_sync import now_version
+from .customers import name_key
+from .models import (
+    Customer, CustomerPhone, Invoice, InvoiceContact, InvoiceItem, Location, Payment, Product, Purchase,
+    PurchaseItem, Stock, StockMovement, Store, Supplier,
+)
+from .ledger import rebuild_stock
+from .product_stats import rebuild_product_stats
+from .receivables import rebuild_receivables
+from .rollups import rebuild_daily_sales
+from . import catalog_cache
+
+# Counts per preset; anything can also be given on its own
+SIZES = {
+    'small': {'products': 2_000, 'invoices': 20_000},
+    'medium': {'products': 20_000, 'invoices': 200_000},
+    'large': {'products': 100_000, 'invoices': 2_000_000},
+}
+SEED_BATCH_SIZE = 5000
+WHOLE = Decimal('1')
+
+SERIES = ['Ivory', 'Glossy', 'Statuario', 'Carrara', 'Onyx', 'Rustic', 'Sahara', 'Nero', 'Crema', 'Slate',
+          'Terrazzo', 'Travertine', 'Calacatta', 'Emperador', 'Pietra', 'Sandstone', 'Concrete', 'Oak', 'Walnut']
+FINISHES = ['Matt', 'Gloss', 'Satin', 'Carving', 'Sugar', 'Lappato', 'Polished', 'Anti Skid']
+COLOURS = ['White', 'Beige', 'Grey', 'Black', 'Brown', 'Blue', 'Green', 'Gold', 'Silver', 'Cream']
+TILE_SIZES = ['2x2', '2x4', '1x1', '12x18', '300x300', '300x600', '600x600', '600x1200', '800x1600']
+CATEGORIES = ['TILES'] * 6 + ['MARBLE', 'GRANITE', 'SANITARY', 'OTHER']
+FIRST_NAMES = ['Ravi', 'Anita', 'Suresh', 'Priya', 'Mohan', 'Kavita', 'Arjun', 'Deepa', 'Rahul', 'Meena',
+               'Vikram', 'Sunita', 'Ajay', 'Pooja', 'Manoj', 'Rekha', 'Sanjay', 'Neha', 'Amit', 'Lata']
+LAST_NAMES = ['Sharma', 'Verma', 'Patel', 'Yadav', 'Gupta', 'Singh', 'Jain', 'Mishra', 'Tiwari', 'Chauhan']
+METHODS = [code for code, _ in Payment.METHOD_CHOICES]
+
+
+@contextmanager
+def _explicit_dates():
+    # Invoice and Purchase dates are auto_now_add; history needs them in the past
+    fields = [Invoice._meta.get_field('date'), Purchase._meta.get_field('date')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _moments(rng, start, size, count, days):
+    """Datetimes of items start..start+size of ``count`` spread over the last ``days`` days, in shop hours."""
+    today = timezone.localdate()
+    tz = timezone.get_current_timezone()
+    now = timezone.now()
+    moments = sorted(
+        datetime.combine(today - timedelta(days=days - 1 - i * days // count), dt_time())
+        + timedelta(seconds=rng.randrange(10 * 3600, 20 * 3600))
+        for i in range(start, start + size)
+    )
+    return [min(timezone.make_aware(moment, tz), now) for moment in moments]
+
+
+def _batches(count, size):
+    for start in range(0, count, size):
+        yield start, min(size, count - start)
+
+
+def _create_catalog(rng, products, locations, batch_size):
+    version = now_version()
+    Location.objects.bulk_create(
+        [Location(name=f'Rack {chr(65 + i // 100 % 26)}{i % 100 + 1}', version=version) for i in range(locations)],
+        batch_size=batch_size,
+    )
+    location_ids = list(Location.objects.values_list('id', flat=True))
+    Product.objects.bulk_create(
+        [
+            Product(
+                name=f'{rng.choice(SERIES)} {rng.choice(COLOURS)} {rng.choice(FINISHES)} {i + 1}',
+                size=rng.choice(TILE_SIZES), category=rng.choice(CATEGORIES), version=version,
+            )
+            for i in range(products)
+        ],
+        batch_size=batch_size,
+    )
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    Through = Product.locations.through
+    Through.objects.bulk_create(
+        [
+            Through(product_id=pid, location_id=lid)
+            for pid in product_ids for lid in rng.sample(location_ids, min(len(location_ids), rng.randint(1, 2)))
+        ],
+        batch_size=batch_size,
+    )
+    return product_ids, location_ids
+
+
+def _create_customers(rng, count, batch_size):
+    """[(customer_id, name, [phone numbers])], registered as record_sale would."""
+    names = [f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}' for _ in range(count)]
+    customers = Customer.objects.bulk_create(
+        [Customer(name=name, name_key=name_key(name)) for name in names], batch_size=batch_size,
+    )
+    # Every fifth customer has a second number
+    numbers = iter(map(str, rng.sample(range(6_000_000_000, 10_000_000_000), count + (count + 4) // 5)))
+    phones, result = [], []
+    for i, customer in enumerate(customers):
+        owned = [next(numbers)] + ([next(numbers)] if i % 5 == 0 else [])
+        phones.extend(CustomerPhone(customer_id=customer.pk, number='+91' + n) for n in owned)
+        result.append((customer.pk, customer.name, owned))
+    CustomerPhone.objects.bulk_create(phones, batch_size=batch_size)
+    return result
+
+
+def _create_purchases(rng, godown, product_ids, count, days, batch_size, received):
+    suppliers = Supplier.objects.bulk_create(
+        [Supplier(name=f'{rng.choice(SERIES)} Ceramics {i + 1}') for i in range(max(1, min(50, count // 20)))]
+    )
+    for start, size in _batches(count, max(1, batch_size // 10)):
+        moments = _moments(rng, start, size, count, days)
+        purchases, lines = [], []
+        for i, moment in enumerate(moments):
+            purchase_lines = [
+                (pid, Decimal(rng.randrange(50, 1000, 10)), Decimal(rng.randrange(15, 120)))
+                for pid in rng.sample(product_ids, min(len(product_ids), rng.randint(5, 30)))
+            ]
+            purchases.append(Purchase(
+                supplier=rng.choice(suppliers), date=moment, invoice_number=f'SUP-{start + i + 1:06d}',
+                total_amount=sum(qty * rate for _, qty, rate in purchase_lines),
+            ))
+            lines.append(purchase_lines)
+        Purchase.objects.bulk_create(purchases)
+        items, movements = [], []
+        for purchase, purchase_lines in zip(purchases, lines):
+            for pid, qty, rate in purchase_lines:
+                items.append(PurchaseItem(purchase=purchase, product_id=pid, quantity=qty, rate=rate))
+                movements.append(StockMovement(
+                    product_id=pid, store=godown, quantity=qty, kind='PURCHASE', purchase=purchase,
+                    created_at=purchase.date,
+                ))
+                received[pid] = received.get(pid, Decimal('0')) + qty
+        PurchaseItem.objects.bulk_create(items, batch_size=batch_size)
+        StockMovement.objects.bulk_create(movements, batch_size=batch_size)
+
+
+def _create_invoices(rng, godown, shops, product_ids, location_ids, customers, count, days, batch_size, sold):
+    for start, size in _batches(count, batch_size):
+        moments = _moments(rng, start, size, count, days)
+        invoices, lines = [], []
+        for moment in moments:
+            invoice_lines = [
+                (pid, Decimal(rng.randint(1, 40) * 4), Decimal(rng.randrange(25, 150)),
+                 rng.choice(location_ids) if location_ids and rng.random() < 0.7 else None)
+                for pid in rng.sample(product_ids, min(len(product_ids), rng.choice((1, 1, 2, 3, 3, 4, 6))))
+            ]
+            total = sum(qty * rate for _, qty, rate, _ in invoice_lines)
+            # Most sales are paid in full, some in part and a few on credit
+            roll = rng.random()
+            if roll < 0.8:
+                paid = total
+            elif roll < 0.95:
+                paid = (total * rng.randint(1, 9) / 10).quantize(WHOLE)
+            else:
+                paid = Decimal('0')
+            customer = rng.choice(customers) if customers and rng.random() < 0.6 else None
+            name = customer[1] if customer else f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+            mobiles = customer[2] if customer else []
+            invoices.append(Invoice(
+                store=rng.choice(shops), customer_name=name, customer_mobile=mobiles[0] if mobiles else None,
+                customer_id=customer[0] if customer else None, date=moment,
+                total_amount=total, paid_amount=paid, due_amount=total - paid,
+            ))
+            lines.append((invoice_lines, mobiles))
+        Invoice.objects.bulk_create(invoices)
+        items, contacts, payments, movements = [], [], [], []
+        for invoice, (invoice_lines, mobiles) in zip(invoices, lines):
+            contacts.extend(InvoiceContact(invoice=invoice, mobile=m) for m in mobiles)
+            if invoice.paid_amount:
+                payments.append(Payment(
+                    invoice=invoice, amount=invoice.paid_amount, date=invoice.date, method=rng.choice(METHODS),
+                ))
+            for pid, qty, rate, lid in invoice_lines:
+                items.append(InvoiceItem(invoice=invoice, product_id=pid, quantity=qty, rate=rate, location_id=lid))
+                movements.append(StockMovement(
+                    product_id=pid, store=godown, quantity=-qty, kind='SALE', invoice=invoice, created_at=invoice.date,
+                ))
+                sold[pid] = sold.get(pid, Decimal('0')) + qty
+        InvoiceItem.objects.bulk_create(items, batch_size=batch_size)
+        InvoiceContact.objects.bulk_create(contacts, batch_size=batch_size)
+        Payment.objects.bulk_create(payments, batch_size=batch_size)
+        StockMovement.objects.bulk_create(movements, batch_size=batch_size)
+
+
+def seed_sample_data(products, invoices, purchases=None, customers=None, locations=200, shops=4, days=365,
+                     seed=1, batch_size=SEED_BATCH_SIZE):
+    """
+    Write a shop's history into an empty database; returns {model name: rows}.
+    ``purchases`` and ``customers`` default to one per 100 and one per 10 invoices.
+    """
+    rng = random.Random(seed)
+    purchases = invoices // 100 if purchases is None else purchases
+    customers = invoices // 10 if customers is None else customers
+
+    with transaction.atomic(), _explicit_dates():
+        godown = Store.objects.create(name='Central Godown', store_type='GODOWN')
+        shop_stores = [Store.objects.create(name=f'Display Shop {i + 1}', store_type='DISPLAY') for i in range(shops)]
+        product_ids, location_ids = _create_catalog(rng, products, locations, batch_size)
+        customer_rows = _create_customers(rng, customers, batch_size)
+
+        received, sold = {}, {}
+        _create_purchases(rng, godown, product_ids, purchases, days, batch_size, received)
+        _create_invoices(
+            rng, godown, shop_stores, product_ids, location_ids, customer_rows, invoices, days, batch_size, sold,
+        )
+        # Opening balances cover every sale, with some left on hand (or none, for some products)
+        opened_at = timezone.now() - timedelta(days=days + 1)
+        StockMovement.objects.bulk_create(
+            [
+                StockMovement(
+                    product_id=pid, store=godown, kind='OPENING', created_at=opened_at,
+                    quantity=max(Decimal('0'), sold.get(pid, 0) - received.get(pid, 0))
+                    + (Decimal(rng.randrange(0, 2000, 10)) if rng.random() < 0.9 else 0),
+                )
+                for pid in product_ids
+            ],
+            batch_size=batch_size,
+        )
+        Stock.objects.bulk_create(
+            [Stock(product_id=pid, store=godown, version=now_version()) for pid in product_ids], batch_size=batch_size,
+        )
+
+        rebuild_stock()
+        rebuild_product_stats()
+        rebuild_daily_sales()
+        rebuild_receivables()
+        catalog_cache.bump(catalog_cache.CATALOG)
+
+    return {
+        model.__name__: model.objects.count()
+        for model in (Store, Location, Product, Customer, Supplier, Purchase, PurchaseItem, Invoice, InvoiceItem,
+                      InvoiceContact, Payment, StockMovement)
+    }
@@ -0,0 +1,478 @@
+import csv
+import functools
+import io
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Product, Stock, Invoice, InvoiceItem, Location, InvoiceContact, Supplier, Purchase, PurchaseItem, Payment
+from .ledger import InsufficientStock, post_movements
+from .rollups import bump_daily_sales, record_invoice, record_purchase as record_purchase_rollup
+from .product_stats import record_purchase_items
+from .customers import customer_for_sale
+from .receivables import bump_balance
+from .write_queue import write_turn
+from . import catalog_cache
+
+
+class SaleError(Exception):
+    """Raised when a sale cannot be recorded; the message is shown to the user."""
+
+    def __init__(self, message, shortfall=None):
+        super().__init__(message)
+        # {product_id: quantity on hand} when the sale failed for lack of stock
+        self.shortfall = shortfall or {}
+
+
+class PurchaseError(Exception):
+    """Raised when a purchase cannot be recorded; the message is shown to the user."""
+
+
+class PaymentError(Exception):
+    """Raised when a payment cannot be recorded; the message is shown to the user."""
+
+
+# Backoff for SQLite "database is locked" errors: delays double from
+# LOCK_RETRY_BASE_DELAY up to LOCK_RETRY_MAX_DELAY, giving up after
+# LOCK_RETRY_TIMEOUT seconds in total.
+LOCK_RETRY_BASE_DELAY = 0.005
+LOCK_RETRY_MAX_DELAY = 0.1
+LOCK_RETRY_TIMEOUT = 3.0
+
+# Sales accepted by one sync_sales() call
+SYNC_BATCH_LIMIT = 200
+# How old an offline sale may be when it is synced, and how far ahead a
+# sales screen's clock may run before its sale times are refused
+SYNC_MAX_SALE_AGE = timedelta(days=7)
+SYNC_CLOCK_SKEW = timedelta(minutes=5)
+
+
+def is_lock_error(exc):
+    return isinstance(exc, OperationalError) and 'locked' in str(exc).lower()
+
+
+def retry_on_lock(func):
+    """
+    Retry ``func`` when the database reports it is locked, sleeping with
+    jittered exponential backoff between attempts. Only the outermost
+    transaction can be retried, so calls made inside an atomic block run once.
+    Outermost calls also wait for their turn in the write queue (see
+    write_queue.py) when it is enabled.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if connection.in_atomic_block:
+            return func(*args, **kwargs)
+        with write_turn():
+            deadline = time.monotonic() + LOCK_RETRY_TIMEOUT
+            delay = LOCK_RETRY_BASE_DELAY
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as exc:
+                    if not is_lock_error(exc) or time.monotonic() + delay > deadline:
+                        raise
+                    time.sleep(delay * random.uniform(0.5, 1.5))
+                    delay = min(LOCK_RETRY_MAX_DELAY, delay * 2)
+    return wrapper
+
+
+def get_godown():
+    return catalog_cache.godown()
+
+
+@retry_on_lock
+def record_sale(store, customer_name, mobiles, paid_amount, lines, client_key=None, sold_at=None):
+    """
+    Create an invoice for ``store`` and deduct the sold quantities from the
+    Central Godown.
+
+    ``lines`` is a list of (product_id, quantity, rate, location_id) tuples.
+    ``client_key`` is stored on the invoice; a second sale with the same key
+    fails with IntegrityError (see sale_for_key). ``sold_at`` dates the invoice,
+    its payment and its rollup day when the sale was made earlier, offline.
+    Products, stock rows and locations are fetched in bulk and the writes are
+    batched, so the number of queries does not grow with the number of lines.
+    Stock is taken with a conditional UPDATE rather than read-modify-write, so
+    two counters selling the last units at the same moment cannot both succeed.
+    """
+    if not lines:
+        raise SaleError("Invalid sale items submitted.")
+    for _, qty, rate, _ in lines:
+        # A non-positive quantity would add stock back instead of taking it
+        if qty <= 0:
+            raise SaleError("Sale quantities must be positive.")
+        if rate < 0:
+            raise SaleError("Sale rates cannot be negative.")
+
+    total_amount = sum((qty * rate for _, qty, rate, _ in lines), Decimal('0'))
+    if paid_amount < 0 or paid_amount > total_amount:
+        raise SaleError(f"Paid amount must be between 0 and the invoice total ({total_amount}).")
+
+    with transaction.atomic():
+        # Write first: on SQLite this takes the write lock up front instead of
+        # failing to upgrade a read lock when another counter is selling.
+        invoice = Invoice.objects.create(
+            store=store,
+            customer_name=customer_name,
+            customer_mobile=mobiles[0] if mobiles else None,
+            total_amount=total_amount,
+            paid_amount=paid_amount,
+            due_amount=total_amount - paid_amount,
+            client_key=client_key,
+        )
+        if sold_at:
+            # Invoice.date is auto_now_add; the UPDATE below stores the sale time
+            invoice.date = sold_at
+        if paid_amount:
+            Payment.objects.create(invoice=invoice, amount=paid_amount, date=invoice.date)
+
+        invoice.customer_id = customer_for_sale(customer_name, mobiles)
+        if invoice.customer_id or sold_at:
+            Invoice.objects.filter(pk=invoice.pk).update(customer_id=invoice.customer_id, date=invoice.date)
+        if invoice.customer_id:
+            bump_balance(
+                invoice.customer_id, billed=total_amount, paid=paid_amount, invoices=1,
+                paid_at=invoice.date if paid_amount else None,
+            )
+
+        godown = get_godown()
+        if not godown:
+            raise SaleError("Central Godown not found.")
+
+        product_ids = {int(pid) for pid, _, _, _ in lines}
+        location_ids = {int(lid) for _, _, _, lid in lines if lid}
+
+        products = Product.objects.in_bulk(product_ids)
+        if len(products) != len(product_ids):
+            raise SaleError("Invalid sale items submitted.")
+        stocks = {
+            s.product_id: s
+            for s in Stock.objects.filter(store=godown, product_id__in=product_ids)
+        }
+        locations = Location.objects.in_bulk(location_ids)
+
+        # The same product may appear on several lines; check the combined quantity.
+        # This read only fails fast with a clear message; the conditional UPDATE
+        # in post_movements() is what guarantees stock never goes negative.
+        needed = {}
+        for pid, qty, _, _ in lines:
+            needed[int(pid)] = needed.get(int(pid), Decimal('0')) + qty
+        shortfall = {}
+        for pid, qty in needed.items():
+            stock = stocks.get(pid)
+            if not stock or stock.quantity < qty:
+                shortfall[pid] = stock.quantity if stock else Decimal('0')
+        if shortfall:
+            raise SaleError(_shortfall_message(products, shortfall), shortfall)
+
+        InvoiceContact.objects.bulk_create(
+            [InvoiceContact(invoice=invoice, mobile=m) for m in mobiles if m]
+        )
+        InvoiceItem.objects.bulk_create([
+            InvoiceItem(
+                invoice=invoice,
+                product=products[int(pid)],
+                quantity=qty,
+                rate=rate,
+                location=locations.get(int(lid)) if lid else None
+            )
+            for pid, qty, rate, lid in lines
+        ])
+
+        try:
+            post_movements(stocks, {pid: -qty for pid, qty in needed.items()}, 'SALE', invoice=invoice, require_stock=True)
+        except InsufficientStock as e:
+            raise SaleError(_shortfall_message(products, e.available), e.available)
+        record_invoice(invoice)
+
+    return invoice
+
+
+def _shortfall_message(products, shortfall):
+    return ' '.join(
+        f"Insufficient stock for {products[pid].name}. Available: {available}"
+        for pid, available in shortfall.items()
+    )
+
+
+def sale_for_key(client_key):
+    """The invoice already recorded under ``client_key``, or None."""
+    if not client_key:
+        return None
+    return Invoice.objects.filter(client_key=client_key).first()
+
+
+def _sync_lines(entry):
+    try:
+        return [
+            (line['product'], Decimal(str(line['quantity'])), Decimal(str(line['rate'])), line.get('location') or None)
+            for line in entry['lines']
+        ]
+    except (KeyError, TypeError, InvalidOperation):
+        raise SaleError("Invalid sale items submitted.")
+
+
+def _sync_sold_at(entry):
+    """When an offline sale was made, from its ``sold_at``; None for entries queued without one."""
+    value = entry.get('sold_at')
+    if value is None:
+        return None
+    try:
+        sold_at = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        sold_at = None
+    if sold_at is None or timezone.is_naive(sold_at):
+        raise SaleError("Invalid sale time.")
+    now = timezone.now()
+    if sold_at > now + SYNC_CLOCK_SKEW:
+        raise SaleError("The sale time is in the future; check the clock on this device.")
+    if sold_at < now - SYNC_MAX_SALE_AGE:
+        raise SaleError(f"This offline sale is older than {SYNC_MAX_SALE_AGE.days} days and cannot be synced; enter it again.")
+    # Within the allowed clock skew
+    return min(sold_at, now)
+
+
+@retry_on_lock
+def sync_sales(store, entries):
+    """
+    Record a batch of sales queued by an offline sales screen, in one
+    transaction with a savepoint per sale, so a sale that fails (for lack of
+    stock, say) is skipped and the rest are kept.
+
+    Each entry is a dict with ``key`` (the client's idempotency key),
+    ``customer_name``, ``mobiles``, ``paid_amount``, ``sold_at`` (ISO 8601 with
+    a UTC offset; see SYNC_MAX_SALE_AGE) and ``lines`` (dicts with ``product``,
+    ``quantity``, ``rate`` and optional ``location``). Sales whose
+    key is already recorded are not recorded again, so a batch can be resent
+    after a lost response. Returns one result dict per entry, in order.
+    """
+    keys = [entry.get('key') for entry in entries if isinstance(entry.get('key'), str)]
+    known = dict(Invoice.objects.filter(client_key__in=keys).values_list('client_key', 'id'))
+    results = []
+    with transaction.atomic():
+        for entry in entries:
+            key = entry.get('key')
+            if not isinstance(key, str) or not 0 < len(key) <= 64:
+                results.append({'key': key, 'status': 'rejected', 'error': "Missing or invalid key."})
+                continue
+            if key in known:
+                results.append({'key': key, 'status': 'duplicate', 'invoice': known[key]})
+                continue
+            try:
+                lines = _sync_lines(entry)
+                sold_at = _sync_sold_at(entry)
+                mobiles = entry.get('mobiles') if isinstance(entry.get('mobiles'), list) else []
+                invoice = record_sale(
+                    store, str(entry.get('customer_name') or ''), [str(m) for m in mobiles if m],
+                    Decimal(str(entry.get('paid_amount') or 0)), lines, client_key=key, sold_at=sold_at,
+                )
+            except IntegrityError:
+                # Synced by a concurrent request (record_sale's savepoint has rolled back)
+                invoice = sale_for_key(key)
+                if invoice is None:
+                    raise
+                known[key] = invoice.id
+                results.append({'key': key, 'status': 'duplicate', 'invoice': invoice.id})
+            except SaleError as e:
+                results.append({
+                    'key': key, 'status': 'rejected', 'error': str(e),
+                    'shortfall': [{'product': pid, 'available': str(qty)} for pid, qty in e.shortfall.items()],
+                })
+            except (InvalidOperation, TypeError, ValueError):
+                results.append({'key': key, 'status': 'rejected', 'error': "Invalid sale submitted."})
+            else:
+                known[key] = invoice.id
+                results.append({'key': key, 'status': 'created', 'invoice': invoice.id})
+    return results
+
+
+@retry_on_lock
+def record_payment(invoice, amount, method='CASH', note='', user=None):
+    """
+    Record a payment against ``invoice``, reducing its due amount and its
+    customer's balance in the same transaction. The due amount is taken with a
+    conditional UPDATE, so two counters cannot together collect more than is owed.
+    The payment counts towards the paid total of the day the invoice was raised.
+    """
+    if amount <= 0:
+        raise PaymentError("Payment amount must be positive.")
+    if method not in dict(Payment.METHOD_CHOICES):
+        raise PaymentError("Unknown payment method.")
+
+    with transaction.atomic():
+        payment = Payment.objects.create(
+            invoice=invoice, amount=amount, method=method, note=note, recorded_by=user
+        )
+        updated = Invoice.objects.filter(pk=invoice.pk, due_amount__gte=amount).update(
+            paid_amount=F('paid_amount') + amount, due_amount=F('due_amount') - amount
+        )
+        if not updated:
+            due = Invoice.objects.filter(pk=invoice.pk).values_list('due_amount', flat=True).first()
+            raise PaymentError(f"Payment exceeds the amount due on invoice #{invoice.pk} ({due}).")
+        bump_daily_sales(invoice.store_id, timezone.localdate(invoice.date), paid_total=amount)
+        if invoice.customer_id:
+            bump_balance(invoice.customer_id, paid=amount, paid_at=payment.date)
+
+    invoice.paid_amount += amount
+    invoice.due_amount -= amount
+    return payment
+
+
+# Products are looked up and stock rows created in batches of this size.
+PURCHASE_BATCH_SIZE = 500
+
+
+@retry_on_lock
+def record_purchase(supplier_name, invoice_number, lines):
+    """
+    Record a supplier delivery and add it to Central Godown stock.
+
+    ``lines`` is a list of (product_id, quantity, rate) tuples. Items are
+    bulk-created and godown stock is upserted for all lines with a handful of
+    statements, so large goods-received notes import in one transaction.
+    """
+    if not lines:
+        raise PurchaseError("No purchase items submitted.")
+
+    received = {}
+    for pid, qty, rate in lines:
+        if qty <= 0:
+            raise PurchaseError("Purchase quantities must be positive.")
+        if rate < 0:
+            raise PurchaseError("Purchase rates cannot be negative.")
+        received[int(pid)] = received.get(int(pid), Decimal('0')) + qty
+    total_amount = sum((qty * rate for _, qty, rate in lines), Decimal('0'))
+
+    with transaction.atomic():
+        supplier, _ = Supplier.objects.get_or_create(name=supplier_name)
+        purchase = Purchase.objects.create(
+            supplier=supplier,
+            invoice_number=invoice_number,
+            total_amount=total_amount
+        )
+
+        godown = get_godown()
+        if not godown:
+            raise PurchaseError("Central Godown not found.")
+
+        product_ids = list(received)
+        known = set()
+        for start in range(0, len(product_ids), PURCHASE_BATCH_SIZE):
+            batch = product_ids[start:start + PURCHASE_BATCH_SIZE]
+            known.update(Product.objects.filter(id__in=batch).values_list('id', flat=True))
+        if len(known) != len(product_ids):
+            missing = sorted(set(product_ids) - known)
+            raise PurchaseError(f"Unknown product id(s): {', '.join(map(str, missing[:10]))}")
+
+        PurchaseItem.objects.bulk_create(
+            [PurchaseItem(purchase=purchase, product_id=int(pid), quantity=qty, rate=rate) for pid, qty, rate in lines],
+            batch_size=PURCHASE_BATCH_SIZE,
+        )
+
+        stocks = godown_stock_rows(godown, product_ids)
+        post_movements(stocks, received, 'PURCHASE', purchase=purchase)
+        record_purchase_rollup(purchase, godown)
+        line_counts = {}
+        for pid, _, _ in lines:
+            line_counts[int(pid)] = line_counts.get(int(pid), 0) + 1
+        record_purchase_items(purchase, line_counts)
+
+    return purchase
+
+
+def godown_stock_rows(godown, product_ids):
+    """
+    {product_id: Stock} for ``product_ids`` in the godown, creating missing
+    rows with zero quantity in bulk.
+    """
+    def fetch(ids):
+        rows = {}
+        for start in range(0, len(ids), PURCHASE_BATCH_SIZE):
+            batch = ids[start:start + PURCHASE_BATCH_SIZE]
+            rows.update((s.product_id, s) for s in Stock.objects.filter(store=godown, product_id__in=batch))
+        return rows
+
+    stocks = fetch(product_ids)
+    missing = [pid for pid in product_ids if pid not in stocks]
+    if missing:
+        Stock.objects.bulk_create(
+            [Stock(product_id=pid, store=godown, quantity=0) for pid in missing],
+            batch_size=PURCHASE_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        stocks.update(fetch(missing))
+    return stocks
+
+
+GRN_COLUMNS = "product_id or name and size, quantity, rate"
+
+
+def read_goods_received_note(file):
+    """
+    Parse a goods-received CSV into (product_id, quantity, rate) lines.
+
+    The header must contain ``quantity`` and ``rate`` plus either
+    ``product_id`` or ``name`` and ``size``. The file is read row by row and
+    products named by name and size are resolved in bulk at the end. Raises
+    PurchaseError listing the first problems found, with line numbers.
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    fields = {f.strip().lower() for f in reader.fieldnames or []}
+    if not {'quantity', 'rate'} <= fields or not ('product_id' in fields or {'name', 'size'} <= fields):
+        raise PurchaseError(f"The CSV header must contain: {GRN_COLUMNS}.")
+
+    rows, errors, wanted_names = [], [], set()
+    for row in reader:
+        row = {(k or '').strip().lower(): (v or '').strip() for k, v in row.items()}
+        if not any(row.values()):
+            continue
+        try:
+            qty = Decimal(row['quantity'])
+            rate = Decimal(row['rate'])
+        except InvalidOperation:
+            errors.append(f"line {reader.line_num}: quantity and rate must be numbers")
+            continue
+        if rate < 0:
+            errors.append(f"line {reader.line_num}: rate cannot be negative")
+            continue
+        if row.get('product_id'):
+            if not row['product_id'].isdigit():
+                errors.append(f"line {reader.line_num}: invalid product_id {row['product_id']!r}")
+                continue
+            key = int(row['product_id'])
+        else:
+            key = (row.get('name', ''), row.get('size', '').lower())
+            wanted_names.add(row.get('name', ''))
+        rows.append((reader.line_num, key, qty, rate))
+
+    by_name = {}
+    names = sorted(wanted_names)
+    for start in range(0, len(names), PURCHASE_BATCH_SIZE):
+        for pid, name, size in Product.objects.filter(name__in=names[start:start + PURCHASE_BATCH_SIZE]).values_list('id', 'name', 'size'):
+            by_name.setdefault((name, size.lower()), []).append(pid)
+
+    lines = []
+    for line_num, key, qty, rate in rows:
+        if isinstance(key, tuple):
+            matches = by_name.get(key, [])
+            if len(matches) != 1:
+                problem = "no product" if not matches else "several products"
+                errors.append(f"line {line_num}: {problem} named {key[0]!r} with size {key[1]!r}")
+                continue
+            key = matches[0]
+        lines.append((key, qty, rate))
+
+    if errors:
+        more = f" (and {len(errors) - 10} more)" if len(errors) > 10 else ""
+        raise PurchaseError("; ".join(errors[:10]) + more)
+    if not lines:
+        raise PurchaseError("The CSV file has no purchase lines.")
+    return lines
@@ -1,3 +1,1178 @@
-from django.test import TestCase
+import gzip
+import importlib
+import json
+import tempfile
+import zipfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import archive, catalog_cache, catalog_sync, metrics as request_metrics, product_search, receivables, rollups, thumbnails, warmup, write_queue
+from . import customers as customers_module
+from .customers import normalize_phone, search_customers
+from .catalog_import import import_catalog
+from .models import Store, Product, Stock, Invoice, InvoiceItem, UserProfile, Location, InvoiceContact, DailyStoreSales, Purchase, PurchaseItem, StockMovement, StockSnapshot, ProductStats, Customer, CustomerPhone, Payment, CustomerBalance, ArchivedInvoice, ArchivedPurchase
+from .ledger import InsufficientStock, delete_stock, post_movements, set_stock_quantity, stock_at, take_snapshots
+from .querycount import assert_query_budget
+from .product_stats import compute_product_stats, find_drift as find_product_stats_drift
+from .services import PaymentError, PurchaseError, SaleError, read_goods_received_note, record_payment, record_purchase, record_sale, retry_on_lock
+from .write_queue import WriteQueueFull, write_turn
+
+
+class InventoryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.godown = Store.objects.create(name='Central Godown', store_type='GODOWN')
+        cls.silwani = Store.objects.create(name='Silwani', store_type='DISPLAY')
+        cls.location = Location.objects.create(name='Rack A1')
+        cls.products = []
+        for i in range(30):
+            product = Product.objects.create(name=f'Tile {i}', size='2x2')
+            product.locations.add(cls.location)
+            set_stock_quantity(Stock(product=product, store=cls.godown), Decimal('100'), kind='OPENING')
+            cls.products.append(product)
+        cls.user = User.objects.create_user('staff', password='staffpass')
+        UserProfile.objects.create(user=cls.user, store=cls.silwani)
+
+    def setUp(self):
+        # Rolled-back test data leaves cache versions and indexed products behind
+        catalog_cache.clear()
+        product_search.index.clear()
+
+    def sale_lines(self, count, quantity='2', rate='50'):
+        return [
+            (p.id, Decimal(quantity), Decimal(rate), self.location.id)
+            for p in self.products[:count]
+        ]
+
+
+class RecordSaleTests(InventoryTestCase):
+    def test_sale_deducts_godown_stock(self):
+        invoice = record_sale(self.silwani, 'Ravi', ['9876543210', '9123456780'], Decimal('100'), self.sale_lines(3))
+        self.assertEqual(invoice.total_amount, Decimal('300'))
+        self.assertEqual(invoice.customer_mobile, '9876543210')
+        self.assertEqual(invoice.items.count(), 3)
+        self.assertEqual(invoice.contacts.count(), 2)
+        for product in self.products[:3]:
+            self.assertEqual(Stock.objects.get(product=product).quantity, Decimal('98'))
+        self.assertEqual(Stock.objects.get(product=self.products[3]).quantity, Decimal('100'))
+
+    def test_repeated_product_lines_are_checked_together(self):
+        product = self.products[0]
+        lines = [(product.id, Decimal('60'), Decimal('10'), None)] * 2
+        with self.assertRaisesMessage(SaleError, 'Insufficient stock for Tile 0'):
+            record_sale(self.silwani, 'Ravi', [], Decimal('0'), lines)
+        self.assertEqual(Stock.objects.get(product=product).quantity, Decimal('100'))
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_non_positive_quantities_and_negative_rates_are_rejected(self):
+        product = self.products[0]
+        for qty, rate in ((Decimal('-5'), Decimal('10')), (Decimal('0'), Decimal('10')), (Decimal('1'), Decimal('-10'))):
+            with self.assertRaises(SaleError):
+                record_sale(self.silwani, 'Ravi', [], Decimal('0'), [(product.id, qty, rate, None)])
+        self.assertEqual(Stock.objects.get(product=product).quantity, Decimal('100'))
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_query_count_does_not_depend_on_line_count(self):
+        # The first sale of the day also creates the daily rollup row and the customer.
+        record_sale(self.silwani, 'Ravi', ['9876543210'], Decimal('0'), self.sale_lines(1))
+        with CaptureQueriesContext(connection) as one_line:
+            record_sale(self.silwani, 'Ravi', ['9876543210'], Decimal('0'), self.sale_lines(1))
+        with CaptureQueriesContext(connection) as thirty_lines:
+            record_sale(self.silwani, 'Ravi', ['9876543210'], Decimal('0'), self.sale_lines(30))
+        self.assertEqual(len(one_line), len(thirty_lines))
+        self.assertLessEqual(len(thirty_lines), 16)
+        self.assertEqual(InvoiceItem.objects.count(), 32)
+
+
+class SalesNewViewTests(InventoryTestCase):
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_post_records_sale(self):
+        products = self.products[:2]
+        response = self.client.post(reverse('sales_new'), {
+            'customer_name': 'Ravi',
+            'customer_mobile[]': ['9876543210', ''],
+            'paid_amount': '150',
+            'product_ids[]': [p.id for p in products],
+            'quantities[]': ['1', '2'],
+            'rates[]': ['100', '50'],
+            'locations[]': [self.location.id, ''],
+        })
+        self.assertRedirects(response, reverse('sales_new'))
+        invoice = Invoice.objects.get()
+        self.assertEqual(invoice.total_amount, Decimal('200'))
+        self.assertEqual(invoice.paid_amount, Decimal('150'))
+        self.assertEqual(InvoiceContact.objects.get().mobile, '9876543210')
+        self.assertEqual(Stock.objects.get(product=products[1]).quantity, Decimal('98'))
+
+    def test_insufficient_stock_shows_error(self):
+        response = self.client.post(reverse('sales_new'), {
+            'customer_name': 'Ravi',
+            'paid_amount': '0',
+            'product_ids[]': [self.products[0].id],
+            'quantities[]': ['500'],
+            'rates[]': ['10'],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Insufficient stock for Tile 0')
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_resubmitted_form_records_once(self):
+        form = {
+            'client_key': 'a' * 32,
+            'customer_name': 'Ravi',
+            'paid_amount': '0',
+            'product_ids[]': [self.products[0].id],
+            'quantities[]': ['3'],
+            'rates[]': ['10'],
+        }
+        self.client.post(reverse('sales_new'), form)
+        response = self.client.post(reverse('sales_new'), form, follow=True)
+        self.assertContains(response, 'Sale already recorded')
+        self.assertEqual(Invoice.objects.get().client_key, 'a' * 32)
+        self.assertEqual(Stock.objects.get(product=self.products[0], store=self.godown).quantity, Decimal('97'))
+
+
+class DailyStoreSalesTests(InventoryTestCase):
+    def test_sale_updates_rollup(self):
+        record_sale(self.silwani, 'Ravi', [], Decimal('50'), self.sale_lines(2))
+        record_sale(self.silwani, 'Asha', [], Decimal('20'), self.sale_lines(1))
+        row = DailyStoreSales.objects.get(store=self.silwani, day=timezone.localdate())
+        self.assertEqual(row.sales_total, Decimal('300'))
+        self.assertEqual(row.paid_total, Decimal('70'))
+        self.assertEqual(row.invoice_count, 2)
+
+    def test_rebuild_command_reports_and_fixes_drift(self):
+        record_sale(self.silwani, 'Ravi', [], Decimal('50'), self.sale_lines(2))
+        Purchase.objects.create(total_amount=Decimal('500'))
+        DailyStoreSales.objects.update(sales_total=Decimal('1'))
+
+        out = StringIO()
+        with self.assertRaises(SystemExit):
+            call_command('rebuild_daily_sales', '--check', stdout=out)
+        self.assertIn('sales_total: stored 1.00, expected 200', out.getvalue())
+        self.assertIn('purchase_total', out.getvalue())
+
+        call_command('rebuild_daily_sales', stdout=StringIO())
+        today = timezone.localdate()
+        self.assertEqual(DailyStoreSales.objects.get(store=self.silwani, day=today).sales_total, Decimal('200'))
+        self.assertEqual(DailyStoreSales.objects.get(store=self.godown, day=today).purchase_total, Decimal('500'))
+
+    def test_sales_new_cards_read_rollup(self):
+        self.client.force_login(self.user)
+        record_sale(self.silwani, 'Ravi', [], Decimal('50'), self.sale_lines(2))
+        response = self.client.get(reverse('sales_new'))
+        self.assertEqual(response.context['today_sales'], Decimal('200'))
+        self.assertEqual(response.context['today_due'], Decimal('150'))
+
+
+class SalesSummaryTests(InventoryTestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('owner', password='ownerpass', is_staff=True)
+        self.client.force_login(self.admin)
+
+    def make_invoices(self, count, when):
+        for _ in range(count):
+            invoice = record_sale(self.silwani, 'Ravi', [], Decimal('0'), self.sale_lines(1, quantity='1'))
+            Invoice.objects.filter(pk=invoice.pk).update(date=when)
+        call_command('rebuild_daily_sales', stdout=StringIO())
+
+    def test_date_range_and_store_filter(self):
+        now = timezone.now()
+        self.make_invoices(2, now)
+        self.make_invoices(3, now - timedelta(days=40))
+        last_month = timezone.localdate(now - timedelta(days=45))
+
+        response = self.client.get(reverse('sales_summary'))
+        self.assertEqual(response.context['total_invoices'], 2)
+        self.assertEqual(len(response.context['store_sections'][0]['invoices']), 2)
+
+        response = self.client.get(reverse('sales_summary'), {'from': last_month.isoformat(), 'store': self.silwani.id})
+        self.assertEqual(response.context['total_invoices'], 5)
+        self.assertEqual(response.context['total_sales'], Decimal('250'))
+
+    def test_invoice_list_uses_keyset_pages(self):
+        self.make_invoices(30, timezone.now())
+        response = self.client.get(reverse('sales_summary'))
+        section = response.context['store_sections'][0]
+        first_page = section['invoices']
+        self.assertEqual(len(first_page), 25)
+        self.assertIsNotNone(section['next_cursor'])
+
+        response = self.client.get(reverse('sales_summary'), {
+            'store': self.silwani.id, 'before': section['next_cursor'],
+        })
+        section = response.context['store_sections'][0]
+        second_page = section['invoices']
+        self.assertEqual(len(second_page), 5)
+        self.assertIsNone(section['next_cursor'])
+        self.assertFalse({i.id for i in first_page} & {i.id for i in second_page})
+
+    def test_query_count_does_not_grow_with_stores(self):
+        self.make_invoices(3, timezone.now())
+        with CaptureQueriesContext(connection) as two_stores:
+            self.client.get(reverse('sales_summary'))
+        for i in range(5):
+            store = Store.objects.create(name=f'Branch {i}', store_type='DISPLAY')
+            record_sale(store, 'Ravi', [], Decimal('0'), self.sale_lines(2, quantity='1'))
+        with CaptureQueriesContext(connection) as seven_stores:
+            response = self.client.get(reverse('sales_summary'))
+        self.assertEqual(len(two_stores), len(seven_stores))
+        self.assertEqual(len(response.context['store_sections']), 6)
+        self.assertContains(response, 'Branch 4 Store')
+
+
+class StockLedgerTests(InventoryTestCase):
+    def test_sale_and_purchase_write_movements(self):
+        product = self.products[0]
+        invoice = record_sale(self.silwani, 'Ravi', [], Decimal('0'), self.sale_lines(1, quantity='5'))
+        self.client.force_login(User.objects.create_user('owner', password='x', is_staff=True))
+        self.client.post(reverse('purchase_new'), {
+            'supplier_name': 'Kajaria', 'invoice_number': 'K-1', 'product': product.id, 'quantity': '20', 'rate': '30',
+        })
+        movements = StockMovement.objects.filter(product=product).order_by('id')
+        self.assertEqual(
+            [(m.kind, m.quantity) for m in movements],
+            [('OPENING', Decimal('100')), ('SALE', Decimal('-5')), ('PURCHASE', Decimal('20'))],
+        )
+        self.assertEqual(movements[1].invoice, invoice)
+        self.assertEqual(Stock.objects.get(product=product).quantity, Decimal('115'))
+
+    def test_admin_edit_records_adjustment(self):
+        admin_user = User.objects.create_superuser('boss', password='x')
+        self.client.force_login(admin_user)
+        stock = Stock.objects.get(product=self.products[0])
+        response = self.client.post(reverse('admin:inventory_stock_change', args=[stock.pk]), {'quantity': '90'})
+        self.assertEqual(response.status_code, 302)
+        adjustment = StockMovement.objects.get(kind='ADJUSTMENT')
+        self.assertEqual(adjustment.quantity, Decimal('-10'))
+        self.assertIn('boss', adjustment.note)
+
+    def test_stock_at_replays_from_snapshot(self):
+        product = self.products[0]
+        record_sale(self.silwani, 'Ravi', [], Decimal('0'), self.sale_lines(1, quantity='10'))
+        self.assertEqual(take_snapshots(), 30)
+        snapshot_time = timezone.now()
+        record_sale(self.silwani, 'Ravi', [], Decimal('0'), self.sale_lines(1, quantity='15'))
+
+        self.assertEqual(StockSnapshot.objects.get(product=product).quantity, Decimal('90'))
+        self.assertEqual(stock_at(product.id, self.godown.id, snapshot_time), Decimal('90'))
+        self.assertEqual(stock_at(product.id, self.godown.id), Decimal('75'))
+        self.assertEqual(take_snapshots(), 30)
+        self.assertEqual(take_snapshots(), 0)
+
+    def test_rebuild_stock_repairs_drift(self):
+        product = self.products[0]
+        Stock.objects.filter(product=product).update(quantity=Decimal('7'))
+        out = StringIO()
+        with self.assertRaises(SystemExit):
+            call_command('rebuild_stock', '--check', stdout=out)
+        self.assertIn(f'product={product.id} store={self.godown.id}: stored 7.00, ledger 100', out.getvalue())
+        call_command('rebuild_stock', stdout=StringIO())
+        self.assertEqual(Stock.objects.get(product=product).quantity, Decimal('100'))
+
+
+class ConditionalDecrementTests(InventoryTestCase):
+    def test_stale_read_cannot_oversell(self):
+        product = self.products[0]
+        stale = Stock.objects.get(product=product)
+        # Another counter sells 95 units after our read
+        Stock.objects.filter(pk=stale.pk).update(quantity=Decimal('5'))
+        with self.assertRaises(InsufficientStock) as ctx:
+            post_movements({product.id: stale}, {product.id: Decimal('-10')}, 'SALE', require_stock=True)
+        self.assertEqual(ctx.exception.available, {product.id: Decimal('5')})
+        self.assertEqual(Stock.objects.get(pk=stale.pk).quantity, Decimal('5'))
+        self.assertFalse(StockMovement.objects.filter(kind='SALE').exists())
+
+    def test_retry_on_lock_retries_outside_transactions(self):
+        calls = []
+
+        @retry_on_lock
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'done'
+
+        with mock.patch('inventory.services.connection') as fake_connection:
+            fake_connection.in_atomic_block = False
+            self.assertEqual(flaky(), 'done')
+        self.assertEqual(len(calls), 3)
+
+        # Inside an atomic block (as in this TestCase) the error is not retried
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            flaky()
+        self.assertEqual(len(calls), 1)
+
+
+class PurchaseTests(InventoryTestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('owner', password='x', is_staff=True))
+
+    def test_multi_line_purchase_form(self):
+        new_product = Product.objects.create(name='Marble Slab', size='8x4')
+        response = self.client.post(reverse('purchase_new'), {
+            'supplier_name': 'Kajaria',
+            'invoice_number': 'K-7',
+            'product_ids[]': [self.products[0].id, new_product.id, self.products[0].id],
+            'quantities[]': ['10', '5', '2'],
+            'rates[]': ['30', '100', '30'],
+        })
+        self.assertRedirects(response, reverse('purchase_new'))
+        purchase = Purchase.objects.get()
+        self.assertEqual(purchase.total_amount, Decimal('860'))
+        self.assertEqual(purchase.items.count(), 3)
+        self.assertEqual(Stock.objects.get(product=self.products[0]).quantity, Decimal('112'))
+        self.assertEqual(Stock.objects.get(product=new_product, store=self.godown).quantity, Decimal('5'))
+
+    def test_goods_received_csv_import(self):
+        new_products = Product.objects.bulk_create(
+            [Product(name=f'Granite {i}', size='600x1200') for i in range(2000)]
+        )
+        rows = ['name,size,quantity,rate'] + [f'{p.name},600X1200,4,25' for p in new_products]
+        rows.append(f'{self.products[0].name},2x2,1,10')
+        upload = SimpleUploadedFile('grn.csv', '\n'.join(rows).encode(), content_type='text/csv')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('purchase_new'), {
+                'supplier_name': 'Somany', 'invoice_number': 'S-1', 'grn_file': upload,
+            })
+        self.assertRedirects(response, reverse('purchase_new'))
+        self.assertLess(len(queries), 60)
+        self.assertEqual(PurchaseItem.objects.count(), 2001)
+        self.assertEqual(Stock.objects.filter(store=self.godown, quantity=4).count(), 2000)
+        self.assertEqual(Stock.objects.get(product=self.products[0]).quantity, Decimal('101'))
+        self.assertEqual(StockMovement.objects.filter(kind='PURCHASE').count(), 2001)
+
+    def test_goods_received_csv_errors_are_reported(self):
+        upload = SimpleUploadedFile('grn.csv', b'name,size,quantity,rate\nNo Such Tile,2x2,1,1\nTile 1,2x2,abc,1\n')
+        with self.assertRaisesMessage(PurchaseError, "line 2: no product named 'No Such Tile'"):
+            read_goods_received_note(upload)
+
+        response = self.client.post(reverse('purchase_new'), {
+            'supplier_name': 'Somany', 'invoice_number': 'S-2',
+            'grn_file': SimpleUploadedFile('grn.csv', b'quantity,rate\n1,1\n'),
+        })
+        self.assertContains(response, 'The CSV header must contain')
+        self.assertFalse(Purchase.objects.exists())
+
+    def test_negative_rates_are_rejected(self):
+        with self.assertRaisesMessage(PurchaseError, 'Purchase rates cannot be negative.'):
+            record_purchase('Kajaria', 'K-8', [(self.products[0].id, Decimal('5'), Decimal('-30'))])
+        upload = SimpleUploadedFile('grn.csv', b'product_id,quantity,rate\n%d,1,10\n%d,1,-10\n' % (self.products[0].id, self.products[1].id))
+        with self.assertRaisesMessage(PurchaseError, 'line 3: rate cannot be negative'):
+            read_goods_received_note(upload)
+        self.assertFalse(Purchase.objects.exists())
+
+    def test_unknown_product_rolls_back(self):
+        with self.assertRaisesMessage(PurchaseError, 'Unknown product id(s): 999999'):
+            record_purchase('Kajaria', 'K-9', [(999999, Decimal('1'), Decimal('1'))])
+        self.assertFalse(Purchase.objects.exists())
+
+
+class ExportTests(InventoryTestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('owner', password='x', is_staff=True))
+        self.invoice = record_sale(self.silwani, 'Ravi, Jr.', ['9876543210'], Decimal('20'), self.sale_lines(2))
+        old = record_sale(self.silwani, 'Asha', [], Decimal('0'), self.sale_lines(1))
+        Invoice.objects.filter(pk=old.pk).update(date=timezone.now() - timedelta(days=30))
+        record_purchase('Kajaria', 'K-1', [(self.products[0].id, Decimal('5'), Decimal('30'))])
+
+    def fetch(self, dataset, **params):
+        response = self.client.get(reverse('export_data', args=[dataset]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_invoice_items_csv_for_date_range(self):
+        today = timezone.localdate().isoformat()
+        response, body = self.fetch('invoice-items', **{'from': today, 'to': today, 'store': self.silwani.id})
+        lines = body.decode().splitlines()
+        self.assertEqual(lines[0], 'invoice_id,date,store,product_id,product,size,unit,quantity,rate,location')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith(f'{self.invoice.id},'))
+        self.assertIn('attachment; filename="invoice-items-silwani-', response['Content-Disposition'])
+
+    def test_invoices_jsonl_gzip(self):
+        response, body = self.fetch('invoices', format='jsonl', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = [json.loads(line) for line in gzip.decompress(body).decode().splitlines()]
+        self.assertEqual([r['customer_name'] for r in rows], ['Ravi, Jr.', 'Asha'])
+        self.assertEqual(rows[0]['total_amount'], '200.00')
+
+    def test_purchase_items_and_unknown_dataset(self):
+        _, body = self.fetch('purchase-items')
+        self.assertIn(b'Kajaria,K-1', body)
+        response = self.client.get(reverse('export_data', args=['stock']))
+        self.assertEqual(response.status_code, 404)
+
+
+class CatalogImportTests(InventoryTestCase):
+    CSV = (
+        'name,size,category,unit,description,locations,image\n'
+        'Tile 0,2x2,Marble,box,,Rack A1;Rack B2,\n'
+        'Onyx White,4x2,GRANITE,,Polished,Rack B2,onyx.png\n'
+        'Onyx White,4x2,GRANITE,,Polished slab,Rack B2,onyx.png\n'
+        'Broken,1x1,,,,,broken.png\n'
+        'Bad,1x1,Wood,,,,\n'
+    )
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media.name))
+
+    def catalog_zip(self):
+        png = BytesIO()
+        Image.new('RGB', (4, 4), 'white').save(png, 'PNG')
+        data = BytesIO()
+        with zipfile.ZipFile(data, 'w') as archive:
+            archive.writestr('catalog.csv', self.CSV)
+            archive.writestr('onyx.png', png.getvalue())
+            archive.writestr('broken.png', b'not an image')
+        data.seek(0)
+        return data
+
+    def test_dry_run_reports_diff_without_writing(self):
+        out = StringIO()
+        with tempfile.NamedTemporaryFile(suffix='.zip') as f:
+            f.write(self.catalog_zip().read())
+            f.flush()
+            call_command('import_catalog', f.name, '--dry-run', stdout=out, stderr=StringIO())
+        output = out.getvalue()
+        self.assertIn("~ Tile 0 (2x2): category 'TILES' -> 'MARBLE', unit 'sqft' -> 'box'", output)
+        self.assertIn('+ Onyx White (4x2)', output)
+        self.assertIn('rows/s', output)
+        self.assertFalse(Product.objects.filter(name='Onyx White').exists())
+        self.assertFalse(Location.objects.filter(name='Rack B2').exists())
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).category, 'TILES')
+
+    def test_dry_run_counts_match_the_import_across_batches(self):
+        def counts(result):
+            return (result.rows, result.created, result.updated, result.unchanged,
+                    result.locations_created, result.links_created)
+
+        dry = import_catalog(self.catalog_zip(), 'catalog.zip', dry_run=True, batch_size=2)
+        self.assertEqual(dry.rows, dry.created + dry.updated + dry.unchanged)
+        self.assertEqual(counts(dry), counts(import_catalog(self.catalog_zip(), 'catalog.zip', batch_size=2)))
+
+    def test_zip_import_upserts_products_links_and_images(self):
+        result = import_catalog(self.catalog_zip(), 'catalog.zip', batch_size=2)
+        # With two rows per batch the second "Onyx White" row lands in a later batch and updates it
+        self.assertEqual((result.rows, result.created, result.updated), (4, 2, 2))
+        self.assertEqual(len(result.errors), 2)
+
+        tile = Product.objects.get(pk=self.products[0].pk)
+        self.assertEqual((tile.category, tile.unit), ('MARBLE', 'box'))
+        self.assertEqual(sorted(tile.locations.values_list('name', flat=True)), ['Rack A1', 'Rack B2'])
+        onyx = Product.objects.get(name='Onyx White', size='4x2')
+        self.assertEqual(onyx.description, 'Polished slab')
+        self.assertTrue(onyx.image.name.startswith('product_images/onyx-white-'))
+        self.assertTrue(onyx.image_hash)
+        self.assertFalse(Product.objects.get(name='Broken').image)
+
+        # Importing the same file again changes nothing
+        again = import_catalog(self.catalog_zip(), 'catalog.zip')
+        self.assertEqual((again.created, again.updated, again.links_created, again.images_stored), (0, 0, 0, 0))
+
+    def test_admin_upload(self):
+        self.client.force_login(User.objects.create_superuser('owner', password='x'))
+        upload = SimpleUploadedFile('catalog.csv', self.CSV.encode(), content_type='text/csv')
+        response = self.client.post(reverse('admin:inventory_product_import'), {'catalog_file': upload})
+        self.assertContains(response, '2 product(s) were created')
+        self.assertEqual(Product.objects.filter(name='Onyx White').count(), 1)
+
+
+class ThumbnailTests(InventoryTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media.name))
+        photo = BytesIO()
+        Image.new('RGB', (2000, 1500), 'teal').save(photo, 'JPEG', quality=95)
+        self.product = self.products[0]
+        self.product.image.save('tile.jpg', ContentFile(photo.getvalue()))
+
+    def test_backfill_builds_webp_and_jpeg_derivatives(self):
+        self.assertEqual(self.product.thumbnail_url, self.product.image.url)
+        out = StringIO()
+        call_command('build_thumbnails', stdout=out)
+        self.assertIn('Built derivatives for 1 image(s); 0 failed.', out.getvalue())
+
+        self.product.refresh_from_db()
+        self.assertTrue(self.product.image_hash)
+        name = thumbnails.derivative_name(self.product.image_hash, 'thumb', 'webp')
+        with default_storage.open(name) as f, Image.open(f) as img:
+            self.assertEqual((img.format, img.size), ('WEBP', (80, 80)))
+        name = thumbnails.derivative_name(self.product.image_hash, 'medium', 'jpg')
+        with default_storage.open(name) as f, Image.open(f) as img:
+            self.assertEqual((img.format, img.size), ('JPEG', (480, 360)))
+
+        self.client.login(username='staff', password='staffpass')
+        response = self.client.get(reverse('product_options'))
+        self.assertContains(response, self.product.thumbnail_webp_url)
+        self.assertNotContains(response, self.product.image.url)
+
+        out = StringIO()
+        call_command('build_thumbnails', stdout=out)
+        self.assertIn('Built derivatives for 0 image(s)', out.getvalue())
+
+    def test_admin_image_upload_schedules_derivatives(self):
+        self.client.force_login(User.objects.create_superuser('owner', password='x'))
+        photo = BytesIO()
+        Image.new('RGB', (64, 64), 'red').save(photo, 'PNG')
+        data = {
+            'name': 'Tile 0', 'category': 'TILES', 'size': '2x2', 'unit': 'sqft', 'locations': [self.location.id],
+            'image': SimpleUploadedFile('red.png', photo.getvalue(), content_type='image/png'),
+        }
+        with mock.patch.object(thumbnails, '_submit') as submit, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:inventory_product_change', args=[self.product.pk]), data)
+        self.assertEqual(response.status_code, 302)
+        self.product.refresh_from_db()
+        submit.assert_called_once_with(self.product.pk, self.product.image.name)
+        self.assertEqual(self.product.image_hash, '')
+
+
+class ProductStatsTests(InventoryTestCase):
+    def test_sales_purchases_and_adjustments_keep_stats_in_sync(self):
+        record_sale(self.silwani, 'Ravi', [], Decimal('0'), self.sale_lines(2, quantity='5'))
+        purchase = record_purchase('Kajaria', 'K-1', [
+            (self.products[0].id, Decimal('10'), Decimal('30')),
+            (self.products[0].id, Decimal('2'), Decimal('30')),
+        ])
+        delete_stock(Stock.objects.get(product=self.products[1], store=self.godown))
+
+        stats = ProductStats.objects.get(product=self.products[0])
+        self.assertEqual(stats.total_stock, Decimal('107'))
+        self.assertEqual((stats.purchase_count, stats.last_purchase_date), (2, purchase.date))
+        self.assertEqual(ProductStats.objects.get(product=self.products[1]).total_stock, 0)
+        self.assertEqual(find_product_stats_drift(compute_product_stats()), [])
+
+    def test_changelist_sorts_on_stats_without_joining_history(self):
+        record_purchase('Kajaria', 'K-1', [(self.products[3].id, Decimal('50'), Decimal('30'))])
+        self.client.force_login(User.objects.create_superuser('owner', password='x'))
+        url = reverse('admin:inventory_product_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            # Column 6 (after the action checkbox) is "Stock Qty (All)"
+            response = self.client.get(url, {'o': '-6'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_list[0], self.products[3])
+        sql = ' '.join(q['sql'] for q in queries.captured_queries)
+        self.assertNotIn('inventory_purchaseitem', sql)
+        self.assertNotIn('inventory_stock"', sql)
+
+    def test_rebuild_command_repairs_drift(self):
+        ProductStats.objects.filter(product=self.products[0]).update(total_stock=5, purchase_count=9)
+        with self.assertRaises(SystemExit):
+            call_command('rebuild_product_stats', '--check', stdout=StringIO())
+        out = StringIO()
+        call_command('rebuild_product_stats', stdout=out)
+        self.assertIn('Rebuilt 30 product stats row(s).', out.getvalue())
+        stats = ProductStats.objects.get(product=self.products[0])
+        self.assertEqual((stats.total_stock, stats.purchase_count), (Decimal('100'), 0))
+
+
+class QueryBudgetTests(InventoryTestCase):
+    VIEWS = [
+        'sales_new', 'sales_summary', 'purchase_new',
+        'admin:inventory_product_changelist', 'admin:inventory_stock_changelist',
+        'admin:inventory_invoice_changelist', 'admin:inventory_purchase_changelist',
+        'admin:inventory_purchaseitem_changelist', 'admin:inventory_stockmovement_changelist',
+        'admin:inventory_dailystoresales_changelist', 'dues',
+        'admin:inventory_payment_changelist', 'admin:inventory_customerbalance_changelist',
+    ]
+
+    def setUp(self):
+        for i in range(6):
+            record_sale(self.silwani, f'Customer {i}', ['9876543210', '9876543211'], Decimal('10'), self.sale_lines(3))
+            record_purchase('Kajaria', f'K-{i}', [(p.id, Decimal('5'), Decimal('30')) for p in self.products[:3]])
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+
+    def test_views_stay_within_query_budget(self):
+        for view_name in self.VIEWS:
+            with self.subTest(view_name), assert_query_budget(view_name):
+                response = self.client.get(reverse(view_name))
+                self.assertEqual(response.status_code, 200)
+
+    def test_repeated_query_shape_is_reported(self):
+        with self.assertRaisesMessage(AssertionError, 'possible N+1, 6x SELECT'):
+            with assert_query_budget('loop'):
+                [invoice.store.name for invoice in Invoice.objects.all()]
+
+    def test_middleware_logs_over_budget_requests(self):
+        middleware = ['inventory.querycount.QueryBudgetMiddleware', *settings.MIDDLEWARE]
+        budgets = {'sales_summary': 2}
+        with self.settings(MIDDLEWARE=middleware, QUERY_BUDGETS=budgets), self.assertLogs('inventory.queries') as logs:
+            self.client.get(reverse('sales_summary'))
+        self.assertIn('sales_summary ran', logs.output[0])
+        self.assertIn('(budget 2)', logs.output[0])
+
+
+class MetricsTests(InventoryTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(self.settings(METRICS_DIR=directory.name, METRICS_TOKEN='scrape-me'))
+        self.enterContext(mock.patch.dict(request_metrics._totals, clear=True))
+
+    def test_sales_screen_is_measured(self):
+        self.client.login(username='staff', password='staffpass')
+        self.client.get(reverse('sales_new'))
+        self.client.get(reverse('sales_new'))
+
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('myshop_request_duration_seconds_count{view="sales_new"} 2', body)
+        self.assertIn('myshop_request_duration_seconds_bucket{view="sales_new",le="+Inf"} 2', body)
+        totals = request_metrics.merged_totals()['sales_new']
+        self.assertGreater(totals['queries'], 0)
+        self.assertGreater(totals['template_seconds'], 0)
+        self.assertGreater(totals['response_bytes'], 1000)
+
+    async def test_async_views_are_measured_under_asgi(self):
+        await sync_to_async(record_sale)(self.silwani, 'Ravi', [], Decimal('30'), self.sale_lines(1, quantity='2'))
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('today_totals'))
+        self.assertEqual(response.json(), {'sales': '100.00', 'received': '30.00', 'due': '70.00'})
+        self.assertGreater(request_metrics._totals['today_totals']['queries'], 0)
+
+    def test_other_workers_are_merged_and_access_is_restricted(self):
+        other = request_metrics._empty()
+        other.update(count=3, queries=12)
+        (Path(settings.METRICS_DIR) / '99999.json').write_text(json.dumps({'sales_summary': other}))
+
+        self.client.login(username='staff', password='staffpass')
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('myshop_request_db_queries_total{view="sales_summary"} 12', body)
+
+
+class CustomerTests(InventoryTestCase):
+    def test_normalize_phone(self):
+        self.assertEqual(normalize_phone('98765 43210'), '+919876543210')
+        self.assertEqual(normalize_phone('098765-43210'), '+919876543210')
+        self.assertEqual(normalize_phone('+91 98765 43210'), '+919876543210')
+        self.assertEqual(normalize_phone('919876543210'), '+919876543210')
+        self.assertEqual(normalize_phone('0044 20 7946 0958'), '+442079460958')
+        self.assertIsNone(normalize_phone('12345'))
+        self.assertIsNone(normalize_phone(''))
+
+    def test_sales_link_to_one_customer_across_number_formats(self):
+        first = record_sale(self.silwani, 'Ravi Kumar', ['9876543210', '9123456789'], Decimal('50'), self.sale_lines(1))
+        second = record_sale(self.silwani, 'Ravi', ['+91 91234-56789'], Decimal('0'), self.sale_lines(2))
+        walk_in = record_sale(self.silwani, 'Walk-in', [''], Decimal('100'), self.sale_lines(1))
+
+        self.assertIsNotNone(first.customer_id)
+        self.assertEqual(Invoice.objects.get(pk=second.pk).customer_id, first.customer_id)
+        self.assertIsNone(Invoice.objects.get(pk=walk_in.pk).customer_id)
+        self.assertEqual(Customer.objects.count(), 1)
+        self.assertEqual(CustomerPhone.objects.count(), 2)
+
+        [result] = search_customers('98765')
+        self.assertEqual((result['name'], result['invoice_count']), ('Ravi Kumar', 2))
+        self.assertEqual(result['phones'], ['9123456789', '9876543210'])
+        self.assertEqual(result['total_spend'], Decimal('300'))
+        self.assertEqual(result['balance_due'], Decimal('250'))
+        self.assertEqual([row['id'] for row in result['recent_invoices']], [second.id, first.id])
+        self.assertEqual(search_customers('98766'), [])
+
+        self.client.login(username='staff', password='staffpass')
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(reverse('customer_search'), {'q': 'ravi k'}).json()
+        self.assertEqual([c['id'] for c in data['customers']], [first.customer_id])
+        self.assertLessEqual(len(queries), 8)
+
+    def test_concurrent_sale_with_the_same_new_number_leaves_no_orphan(self):
+        winner = Customer.objects.create(name='Asha', name_key='asha')
+        real_name_key = customers_module.name_key
+
+        def register_first(name):
+            # The other counter's sale registers the number between the lookup and the insert
+            CustomerPhone.objects.create(customer=winner, number='+919876543210')
+            return real_name_key(name)
+
+        with mock.patch('inventory.customers.name_key', side_effect=register_first):
+            invoice = record_sale(self.silwani, 'Asha K', ['9876543210'], Decimal('0'), self.sale_lines(1))
+        self.assertEqual(invoice.customer_id, winner.pk)
+        self.assertEqual(list(Customer.objects.values_list('pk', flat=True)), [winner.pk])
+        self.assertEqual(CustomerBalance.objects.get().customer_id, winner.pk)
+
+    def test_backfill_groups_invoices_sharing_a_number(self):
+        def invoice(name, mobile, *contacts):
+            inv = Invoice.objects.create(
+                store=self.silwani, customer_name=name, customer_mobile=mobile,
+                total_amount=Decimal('10'), paid_amount=Decimal('0'),
+            )
+            for number in contacts:
+                InvoiceContact.objects.create(invoice=inv, mobile=number)
+            return inv
+
+        a = invoice('Asha', '9876543210', '9876543210', '9000000001')
+        b = invoice('Asha M', None, '09000000001')
+        c = invoice('Bala', '9111111111', '9111111111')
+        d = invoice('Walk-in', '')
+        migration = importlib.import_module('inventory.migrations.0011_customers')
+        migration.backfill_customers(apps, None)
+
+        customers = dict(Invoice.objects.values_list('pk', 'customer_id'))
+        self.assertEqual(customers[a.pk], customers[b.pk])
+        self.assertNotEqual(customers[a.pk], customers[c.pk])
+        self.assertIsNone(customers[d.pk])
+        self.assertEqual(Customer.objects.get(pk=customers[a.pk]).name, 'Asha')
+        self.assertEqual(CustomerPhone.objects.filter(customer_id=customers[a.pk]).count(), 2)
+
+
+class ReceivablesTests(InventoryTestCase):
+    def sell(self, mobile, paid, days_ago=0):
+        invoice = record_sale(self.silwani, f'Customer {mobile}', [mobile], Decimal(paid), self.sale_lines(1))
+        if days_ago:
+            Invoice.objects.filter(pk=invoice.pk).update(date=timezone.now() - timedelta(days=days_ago))
+            invoice.refresh_from_db()
+        return invoice
+
+    def test_sale_and_later_payments_update_invoice_and_customer_balance(self):
+        invoice = self.sell('9876543210', '30')
+        self.assertEqual(invoice.due_amount, Decimal('70'))
+        self.assertEqual(Payment.objects.get(invoice=invoice).amount, Decimal('30'))
+
+        payment = record_payment(invoice, Decimal('50'), method='UPI', user=self.user)
+        invoice.refresh_from_db()
+        self.assertEqual((invoice.paid_amount, invoice.due_amount, invoice.balance_due), (Decimal('80'), Decimal('20'), Decimal('20')))
+        balance = CustomerBalance.objects.get(customer_id=invoice.customer_id)
+        self.assertEqual((balance.invoice_count, balance.billed, balance.paid, balance.balance), (1, Decimal('100'), Decimal('80'), Decimal('20')))
+        self.assertEqual(balance.last_payment_at, payment.date)
+        self.assertEqual(rollups.daily_totals(self.silwani, timezone.localdate()).paid_total, Decimal('80'))
+
+        with self.assertRaisesMessage(PaymentError, 'exceeds the amount due'):
+            record_payment(invoice, Decimal('20.01'))
+        with self.assertRaises(PaymentError):
+            record_payment(invoice, Decimal('0'))
+        with self.assertRaises(SaleError):
+            record_sale(self.silwani, 'Ravi', [], Decimal('101'), self.sale_lines(1))
+        self.assertEqual(Payment.objects.count(), 2)
+        self.assertEqual(receivables.find_drift(receivables.compute_balances()), [])
+        self.assertEqual(receivables.invoice_drift(), [])
+
+    def test_aging_and_dues_page(self):
+        self.sell('9000000001', '0', days_ago=10)
+        self.sell('9000000001', '0', days_ago=45)
+        self.sell('9000000002', '40', days_ago=90)
+        self.sell('9000000003', '100')
+        self.sell('', '25', days_ago=70)
+
+        totals, walk_in = receivables.aging_totals()
+        self.assertEqual(totals, {'0-30': Decimal('100'), '31-60': Decimal('100'), '60+': Decimal('135')})
+        self.assertEqual(walk_in, Decimal('75'))
+
+        rows, next_cursor = receivables.dues_page(size=1)
+        self.assertEqual(rows[0].customer.name, 'Customer 9000000001')
+        self.assertEqual(rows[0].aging, [Decimal('100'), Decimal('100'), 0])
+        rows, next_cursor = receivables.dues_page(receivables.decode_dues_cursor(next_cursor), size=1)
+        self.assertEqual((rows[0].balance, rows[0].aging), (Decimal('60'), [0, 0, Decimal('60')]))
+        self.assertIsNone(next_cursor)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('dues'))
+        self.assertContains(response, 'Customer 9000000002')
+        self.assertNotContains(response, 'Customer 9000000003')
+
+        invoice = Invoice.objects.filter(customer__name='Customer 9000000002').get()
+        response = self.client.post(reverse('payment_new'), {'invoice': invoice.pk, 'amount': '60', 'method': 'CASH'}, follow=True)
+        self.assertContains(response, 'Payment of')
+        self.assertEqual(CustomerBalance.objects.get(customer_id=invoice.customer_id).balance, 0)
+
+    def test_counter_collects_only_on_its_own_store(self):
+        own = self.sell('9876543210', '0')
+        other_store = Store.objects.create(name='Raisen', store_type='DISPLAY')
+        other = record_sale(other_store, 'Asha', [], Decimal('0'), self.sale_lines(1))
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('payment_new'), {'invoice': other.pk, 'amount': '10'}, follow=True)
+        self.assertContains(response, 'Invoice not found.')
+        self.client.post(reverse('payment_new'), {'invoice': own.pk, 'amount': '10'})
+        self.assertEqual(list(Payment.objects.values_list('invoice_id', flat=True)), [own.pk])
+
+    def test_rebuild_receivables_repairs_drift(self):
+        invoice = self.sell('9876543210', '30')
+        Invoice.objects.filter(pk=invoice.pk).update(paid_amount=0, due_amount=100)
+        CustomerBalance.objects.update(balance=5)
+
+        out = StringIO()
+        with self.assertRaises(SystemExit):
+            call_command('rebuild_receivables', '--check', stdout=out)
+        self.assertIn(f'invoice={invoice.pk}', out.getvalue())
+
+        call_command('rebuild_receivables', stdout=StringIO())
+        invoice.refresh_from_db()
+        self.assertEqual((invoice.paid_amount, invoice.due_amount), (Decimal('30'), Decimal('70')))
+        self.assertEqual(CustomerBalance.objects.get().balance, Decimal('70'))
+
+    def test_admin_cannot_edit_amounts_items_or_delete(self):
+        invoice = self.sell('9876543210', '30')
+        purchase = record_purchase('Kajaria', 'K-1', [(self.products[0].id, Decimal('5'), Decimal('30'))])
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+
+        for model, obj in (('invoice', invoice), ('purchase', purchase)):
+            response = self.client.get(reverse(f'admin:inventory_{model}_change', args=[obj.pk]))
+            self.assertEqual(response.status_code, 200)
+            self.assertNotContains(response, 'name="total_amount"')
+            self.assertNotContains(response, '-0-quantity"')
+            self.assertEqual(self.client.post(reverse(f'admin:inventory_{model}_delete', args=[obj.pk])).status_code, 403)
+        self.assertEqual(self.client.get(reverse('admin:inventory_invoice_add')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('admin:inventory_purchaseitem_add')).status_code, 403)
+        self.assertTrue(Invoice.objects.filter(pk=invoice.pk).exists())
+
+
+class CatalogCacheTests(InventoryTestCase):
+    def test_catalog_is_cached_until_a_product_or_location_changes(self):
+        catalog_cache.catalog()
+        catalog_cache.godown()
+        with self.assertNumQueries(0):
+            products = catalog_cache.catalog()
+            catalog_cache.godown()
+        self.assertEqual(len(products), 30)
+
+        product = self.products[0]
+        product.name = 'Renamed'
+        product.save()
+        rack = Location.objects.create(name='Rack B2')
+        product.locations.add(rack)
+        [cached] = [p for p in catalog_cache.catalog() if p['id'] == product.id]
+        self.assertEqual(cached['name'], 'Renamed')
+        self.assertEqual(cached['location_ids'], f'{self.location.id},{rack.id}')
+        self.assertIn({'id': rack.id, 'name': 'Rack B2'}, catalog_cache.locations())
+
+    def test_stock_is_written_through_by_the_ledger(self):
+        product = self.products[0]
+        self.assertEqual(catalog_cache.godown_stock()[product.id], Decimal('100'))
+        record_sale(self.silwani, 'Ravi', [], Decimal('0'), self.sale_lines(1, quantity='7'))
+        self.assertEqual(catalog_cache.godown_stock()[product.id], Decimal('93'))
+        set_stock_quantity(Stock.objects.get(product=product), Decimal('40'))
+        self.assertEqual(catalog_cache.godown_stock()[product.id], Decimal('40'))
+
+    def test_product_options_are_a_cached_fragment_with_etag(self):
+        self.client.login(username='staff', password='staffpass')
+        response = self.client.get(reverse('product_options'))
+        self.assertContains(response, f'data-location-ids="{self.location.id}"')
+        self.assertContains(response, 'Tile 29 (2x2) - Stock: 100')
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('product_options'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in queries if 'inventory_product' in q['sql'] or 'inventory_stock' in q['sql']])
+
+        record_sale(self.silwani, 'Ravi', [], Decimal('0'), self.sale_lines(1, quantity='7'))
+        response = self.client.get(reverse('product_options'), HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Tile 0 (2x2) - Stock: 93')
+        self.assertNotEqual(response['ETag'], etag)
+
+        self.client.get(reverse('sales_new'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('sales_new'))
+        self.assertContains(response, f'{self.location.id}: "Rack A1"')
+        self.assertNotContains(response, 'Tile 0')
+        self.assertFalse([q for q in queries if 'inventory_location' in q['sql']])
+
+
+class CatalogSyncTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='staff', password='staffpass')
+
+    def test_full_sync_then_deltas(self):
+        response = self.client.get(reverse('catalog_api'))
+        data = response.json()
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['products']), 30)
+        self.assertIn([self.products[0].id, '100.00'], data['stock'])
+        self.assertEqual(data['locations'], [{'id': self.location.id, 'name': 'Rack A1'}])
+        self.assertEqual(self.client.get(reverse('catalog_api'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        # Everything so far is older than the client's last sync
+        for model in (Product, Location, Stock):
+            model.objects.update(version=1)
+        since = 2
+        record_sale(self.silwani, 'Ravi', [], Decimal('0'), self.sale_lines(1, quantity='7'))
+        renamed = self.products[1]
+        renamed.name = 'Renamed'
+        renamed.save()
+        rack = Location.objects.create(name='Rack B2')
+        self.products[2].locations.add(rack)
+        deleted_id = self.products[3].id
+        self.products[3].delete()
+
+        with mock.patch.object(catalog_sync, 'SYNC_LOOKBACK', 0):
+            data = self.client.get(reverse('catalog_api'), {'since': since}).json()
+        self.assertFalse(data['full'])
+        self.assertEqual(sorted(p['id'] for p in data['products']), [self.products[1].id, self.products[2].id])
+        self.assertIn(f'{self.location.id},{rack.id}', [p['location_ids'] for p in data['products']])
+        self.assertEqual(data['locations'], [{'id': rack.id, 'name': 'Rack B2'}])
+        self.assertEqual(data['stock'], [[self.products[0].id, '93.00']])
+        self.assertEqual(data['deleted'], {'products': [deleted_id], 'locations': [], 'stock': [deleted_id]})
+        self.assertGreater(data['version'], since)
+
+
+class ProductSearchTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ivory = Product.objects.create(name='Ivory Matt', size='2x4')
+        self.glossy = Product.objects.create(name='Glossy White', size='600 X 1200', category='MARBLE')
+
+    def ids(self, query):
+        return [p['id'] for p in product_search.search_products(query)]
+
+    def test_misspelled_and_partial_queries(self):
+        self.assertEqual(self.ids('ivry 2x4')[0], self.ivory.id)
+        self.assertEqual(self.ids('glos 600x1200')[0], self.glossy.id)
+        self.assertEqual(self.ids('marble')[0], self.glossy.id)
+        self.assertEqual(self.ids('x'), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ids('gloss')[0], self.glossy.id)
+
+    def test_index_follows_changes(self):
+        self.ids('tile')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ivory.name = 'Ocean Blue'
+            self.ivory.save()
+        self.assertEqual(self.ids('ocean')[0], self.ivory.id)
+        self.assertNotIn(self.ivory.id, self.ids('ivory'))
+
+        # Writes by other processes arrive through sync versions and tombstones
+        Product.objects.filter(pk=self.products[0].pk).update(name='Sandstone', version=catalog_sync.now_version())
+        catalog_cache.bump(catalog_cache.CATALOG)
+        glossy_id = self.glossy.id
+        self.glossy.delete()
+        self.assertEqual(self.ids('sandstone')[0], self.products[0].id)
+        self.assertNotIn(glossy_id, self.ids('glossy'))
+
+    def test_view(self):
+        self.client.login(username='staff', password='staffpass')
+        data = self.client.get(reverse('product_search'), {'q': 'ivory'}).json()
+        self.assertEqual(data['products'][0]['name'], 'Ivory Matt')
+        self.assertEqual(data['products'][0]['size'], '2x4')
+
+
+class SalesSyncTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def sync(self, invoices):
+        return self.client.post(reverse('sales_sync'), json.dumps({'invoices': invoices}), content_type='application/json')
+
+    def sale(self, key, product, quantity):
+        return {
+            'key': key, 'customer_name': 'Ravi', 'mobiles': ['9876543210'], 'paid_amount': '10',
+            'lines': [{'product': product.id, 'quantity': quantity, 'rate': '10', 'location': self.location.id}],
+        }
+
+    def test_batch_is_idempotent_and_reports_shortfalls(self):
+        first = self.sync([self.sale('k1', self.products[0], '2'), self.sale('k2', self.products[1], '500')]).json()
+        created, short = first['results']
+        self.assertEqual(created['status'], 'created')
+        self.assertEqual(short['status'], 'rejected')
+        self.assertEqual(short['shortfall'], [{'product': self.products[1].id, 'available': '100.00'}])
+
+        # The response was lost and the batch is resent with a new sale
+        again = self.sync([self.sale('k1', self.products[0], '2'), self.sale('k3', self.products[2], '1')]).json()
+        self.assertEqual(again['results'][0], {'key': 'k1', 'status': 'duplicate', 'invoice': created['invoice']})
+        self.assertEqual(again['results'][1]['status'], 'created')
+        self.assertEqual(Invoice.objects.count(), 2)
+        self.assertEqual(Stock.objects.get(product=self.products[0], store=self.godown).quantity, Decimal('98'))
+        self.assertEqual(CustomerBalance.objects.get().invoice_count, 2)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.post(reverse('sales_sync'), 'nope', content_type='application/json').status_code, 400)
+        results = self.sync([{'customer_name': 'Ravi'}, {'key': 'k9', 'lines': [{'product': 'x'}]}]).json()['results']
+        self.assertEqual([r['status'] for r in results], ['rejected', 'rejected'])
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_negative_and_zero_lines_are_rejected(self):
+        negative = dict(self.sale('k1', self.products[0], '-5'), paid_amount='0')
+        results = self.sync([negative, self.sale('k2', self.products[0], '0')]).json()['results']
+        self.assertEqual([r['status'] for r in results], ['rejected', 'rejected'])
+        self.assertEqual(results[0]['error'], "Sale quantities must be positive.")
+        self.assertFalse(Invoice.objects.exists())
+        self.assertEqual(Stock.objects.get(product=self.products[0], store=self.godown).quantity, Decimal('100'))
+
+    def test_sale_queued_yesterday_is_booked_on_its_own_day(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        sold_at = timezone.make_aware(datetime.combine(yesterday, time(23, 50)))
+        entry = dict(self.sale('k1', self.products[0], '2'), sold_at=sold_at.isoformat())
+        [result] = self.sync([entry]).json()['results']
+        self.assertEqual(result['status'], 'created')
+
+        invoice = Invoice.objects.get(pk=result['invoice'])
+        self.assertEqual(invoice.date, sold_at)
+        self.assertEqual(Payment.objects.get(invoice=invoice).date, sold_at)
+        self.assertEqual(rollups.daily_totals(self.silwani, yesterday).sales_total, Decimal('20'))
+        self.assertEqual(rollups.daily_totals(self.silwani, timezone.localdate()).invoice_count, 0)
+        call_command('rebuild_daily_sales', '--check', stdout=StringIO())
+
+    def test_sale_times_outside_the_window_are_rejected(self):
+        now = timezone.now()
+        entries = [
+            dict(self.sale('k1', self.products[0], '1'), sold_at=(now + timedelta(hours=1)).isoformat()),
+            dict(self.sale('k2', self.products[0], '1'), sold_at=(now - timedelta(days=30)).isoformat()),
+            dict(self.sale('k3', self.products[0], '1'), sold_at='yesterday'),
+            dict(self.sale('k4', self.products[0], '1'), sold_at=now.replace(tzinfo=None).isoformat()),
+        ]
+        results = self.sync(entries).json()['results']
+        self.assertEqual([r['status'] for r in results], ['rejected'] * 4)
+        self.assertIn('in the future', results[0]['error'])
+        self.assertIn('older than 7 days', results[1]['error'])
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_busy_write_queue_asks_to_resend(self):
+        with mock.patch('inventory.views.sync_sales', side_effect=WriteQueueFull("busy")):
+            response = self.sync([self.sale('k1', self.products[0], '1')])
+        self.assertEqual((response.status_code, response.json()), (503, {'error': "busy"}))
+
+
+class WarmUpTests(InventoryTestCase):
+    def test_warm_up_fills_caches(self):
+        with mock.patch('inventory.warmup.connections.close_all') as close_all:
+            timings = warmup.warm_up()
+        self.assertEqual(list(timings), ['database', 'templates', 'catalog', 'product_search'])
+        self.assertNotIn(None, timings.values())
+        close_all.assert_called_once()
+        with self.assertNumQueries(0):
+            catalog_cache.product_options()
+            self.assertTrue(product_search.search_products('tile'))
+
+    def test_healthz(self):
+        response = self.client.get(reverse('healthz'))
+        self.assertEqual(response.json(), {'status': 'ok'})
+
+
+class SampleDataTests(TestCase):
+    def setUp(self):
+        catalog_cache.clear()
+        product_search.index.clear()
+
+    def test_seeded_history_is_consistent(self):
+        call_command(
+            'seed_sample_data', '--products', '40', '--invoices', '150', '--purchases', '4', '--days', '20',
+            stdout=StringIO(),
+        )
+        self.assertEqual(Invoice.objects.count(), 150)
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertFalse(Invoice.objects.filter(date__lt=timezone.now() - timedelta(days=21)).exists())
+        self.assertTrue(Invoice.objects.filter(date__lt=timezone.now() - timedelta(days=10)).exists())
+        # Everything the rebuild commands check already holds
+        for command in ('rebuild_stock', 'rebuild_daily_sales', 'rebuild_product_stats', 'rebuild_receivables'):
+            call_command(command, '--check', stdout=StringIO())
+        self.assertFalse(Stock.objects.filter(quantity__lt=0).exists())
+
+        with self.assertRaises(CommandError):
+            call_command('seed_sample_data', '--products', '1', '--invoices', '1', stdout=StringIO())
+
+
+class ArchiveTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        old = timezone.now() - timedelta(days=800)
+        self.settled = record_sale(self.silwani, 'Ravi', ['9876543210'], Decimal('200'), self.sale_lines(2))
+        self.unpaid = record_sale(self.silwani, 'Ravi', ['9876543210'], Decimal('0'), self.sale_lines(1))
+        self.current = record_sale(self.silwani, 'Ravi', ['9876543210'], Decimal('100'), self.sale_lines(1))
+        self.purchase = record_purchase('Kajaria', 'K-1', [(self.products[0].id, Decimal('5'), Decimal('30'))])
+        Invoice.objects.filter(pk__in=[self.settled.pk, self.unpaid.pk]).update(date=old)
+        Payment.objects.filter(invoice=self.settled).update(date=old)
+        Purchase.objects.filter(pk=self.purchase.pk).update(date=old)
+        for command in ('rebuild_daily_sales', 'rebuild_product_stats', 'rebuild_receivables'):
+            call_command(command, stdout=StringIO())
+
+    def test_archives_settled_invoices_and_purchases_of_closed_years(self):
+        out = StringIO()
+        call_command('archive_history', '--dry-run', stdout=out)
+        self.assertIn('1 invoice(s) and 1 purchase(s)', out.getvalue())
+        call_command('archive_history', '--pause', '0', stdout=StringIO())
+
+        self.assertEqual(set(Invoice.objects.values_list('pk', flat=True)), {self.unpaid.pk, self.current.pk})
+        archived = ArchivedInvoice.objects.get(pk=self.settled.pk)
+        self.assertEqual((archived.total_amount, archived.customer_id), (Decimal('200'), self.settled.customer_id))
+        self.assertEqual(archived.items.count(), 2)
+        self.assertEqual(archived.contacts.count(), 1)
+        self.assertEqual(archived.payments.get().amount, Decimal('200'))
+        self.assertFalse(Purchase.objects.exists())
+        self.assertEqual(ArchivedPurchase.objects.get(pk=self.purchase.pk).items.count(), 1)
+        movement = StockMovement.objects.filter(kind='SALE', note=f'Archived invoice #{self.settled.pk}')
+        self.assertEqual(movement.count(), 2)
+
+        # Totals still reconcile, counting the archive
+        for command in ('rebuild_stock', 'rebuild_daily_sales', 'rebuild_product_stats', 'rebuild_receivables'):
+            call_command(command, '--check', stdout=StringIO())
+        [customer] = search_customers('98765')
+        self.assertEqual(
+            [row['id'] for row in customer['recent_invoices']], [self.current.pk, self.unpaid.pk, self.settled.pk]
+        )
+        self.client.force_login(User.objects.create_user('owner', password='x', is_staff=True))
+        response = self.client.get(reverse('export_data', args=['invoice-items']))
+        ids = [line.split(',')[0] for line in b''.join(response.streaming_content).decode().splitlines()[1:]]
+        self.assertEqual(ids.count(str(self.settled.pk)), 2)
+        self.assertIn(str(self.current.pk), ids)
+
+    def test_only_closed_financial_years(self):
+        self.assertEqual(archive.financial_year_start(date(2026, 3, 31)), date(2025, 4, 1))
+        self.assertEqual(archive.financial_year_start(date(2026, 4, 1)), date(2026, 4, 1))
+        with self.assertRaises(CommandError):
+            call_command('archive_history', '--before', (timezone.localdate() + timedelta(days=400)).isoformat())
+        for size in ('0', '-5'):
+            with self.assertRaisesMessage(CommandError, '--chunk-size must be a positive number.'):
+                call_command('archive_history', '--chunk-size', size)
+        with self.assertRaises(ValueError):
+            archive.archive_invoices(archive.financial_year_start(), size=0)
+
+
+class WriteQueueTests(TestCase):
+    @override_settings(SQLITE_WRITE_QUEUE={'size': 1, 'timeout': 0.01})
+    def test_turns_are_reentrant_and_time_out(self):
+        with write_turn():
+            # The same thread already holds the turn
+            with write_turn():
+                pass
+        with write_queue._turn:
+            with self.assertRaises(WriteQueueFull):
+                with write_turn():
+                    pass
+        self.assertEqual(write_queue.waiting(), 0)
+
+    @override_settings(SQLITE_WRITE_QUEUE={'size': 0, 'timeout': 1})
+    def test_full_queue_raises(self):
+        with self.assertRaises(WriteQueueFull):
+            with write_turn():
+                pass
+
+    def test_off_without_setting(self):
+        with write_queue._turn:
+            with write_turn():
+                pass
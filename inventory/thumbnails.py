@@ -0,0 +1,150 @@
+"""
+Thumbnail and WebP derivatives of Product.image.
+
+Camera uploads are several megabytes; the sales screen and admin only need
+small previews. ``build_derivatives`` renders each size in DERIVATIVES as
+WebP plus a JPEG fallback, named after a hash of the source file so they can
+be cached forever and are only ever built once per picture. Product.image_hash
+records the hash once the files exist; until then pages fall back to the
+original image.
+
+Saving an image calls ``schedule`` which builds the files in a small thread
+pool after the transaction commits, off the request path. ``manage.py
+build_thumbnails`` backfills anything the pool skipped or missed.
+"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .models import Product
+from . import catalog_cache, catalog_sync
+
+logger = logging.getLogger(__name__)
+
+# name: (width, height, crop). Cropped sizes are filled exactly (like CSS
+# object-fit: cover); the others are scaled to fit inside the box.
+DERIVATIVES = {
+    'thumb': (80, 80, True),
+    'medium': (480, 480, False),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DERIVATIVE_DIR = 'product_images/derived'
+
+DERIVATIVE_WORKERS = 2
+# Images waiting for the pool beyond this are left to build_thumbnails.
+MAX_PENDING = 64
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+
+
+def derivative_name(image_hash, size, ext):
+    return f'{DERIVATIVE_DIR}/{image_hash[:2]}/{image_hash}-{size}.{ext}'
+
+
+def derivative_url(image_hash, size, ext):
+    return default_storage.url(derivative_name(image_hash, size, ext))
+
+
+def file_hash(name):
+    digest = hashlib.sha256()
+    with default_storage.open(name, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+def _render(source, width, height, crop):
+    img = source.copy()
+    if crop:
+        img = ImageOps.fit(img, (width, height), Image.Resampling.LANCZOS)
+    else:
+        img.thumbnail((width, height), Image.Resampling.LANCZOS)
+    return img
+
+
+def build_derivatives(name, force=False):
+    """
+    Render every derivative of the stored image ``name`` that is not on disk
+    yet and return its content hash. Does not touch the database, so it can
+    run in any thread.
+    """
+    image_hash = file_hash(name)
+    wanted = [
+        (size, ext) for size in DERIVATIVES for ext in FORMATS
+        if force or not default_storage.exists(derivative_name(image_hash, size, ext))
+    ]
+    if not wanted:
+        return image_hash
+
+    with default_storage.open(name, 'rb') as f, Image.open(f) as img:
+        # Let the JPEG decoder downscale while decoding; far cheaper than a full-size decode
+        largest = max(max(w, h) for w, h, _ in DERIVATIVES.values())
+        img.draft('RGB', (largest, largest))
+        source = ImageOps.exif_transpose(img).convert('RGB')
+
+    for size in dict.fromkeys(size for size, _ in wanted):
+        rendered = _render(source, *DERIVATIVES[size])
+        for ext in [ext for s, ext in wanted if s == size]:
+            fmt, options = FORMATS[ext]
+            out = io.BytesIO()
+            rendered.save(out, fmt, **options)
+            target = derivative_name(image_hash, size, ext)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(out.getvalue()))
+    return image_hash
+
+
+def refresh_product(product_id, name):
+    """Build derivatives for ``name`` and record the hash, unless the image changed meanwhile."""
+    image_hash = build_derivatives(name)
+    if Product.objects.filter(pk=product_id, image=name).update(image_hash=image_hash, version=catalog_sync.now_version()):
+        catalog_cache.bump(catalog_cache.CATALOG)
+    return image_hash
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DERIVATIVE_WORKERS, thread_name_prefix='thumbnails')
+        return _executor
+
+
+def _run(product_id, name):
+    try:
+        refresh_product(product_id, name)
+    except Exception:
+        logger.exception("Could not build derivatives for product %s (%s)", product_id, name)
+    finally:
+        _pending.release()
+        close_old_connections()
+
+
+def _submit(product_id, name):
+    if not _pending.acquire(blocking=False):
+        logger.warning("Thumbnail queue full; product %s left for build_thumbnails", product_id)
+        return
+    _get_executor().submit(_run, product_id, name)
+
+
+def schedule(products):
+    """Queue derivative builds for ``products`` once the current transaction commits."""
+    jobs = [(p.pk, p.image.name) for p in products if p.image]
+    if not jobs:
+        return
+    Product.objects.filter(pk__in=[pk for pk, _ in jobs]).update(image_hash='', version=catalog_sync.now_version())
+    catalog_cache.bump(catalog_cache.CATALOG)
+    transaction.on_commit(lambda: [_submit(pk, name) for pk, name in jobs])
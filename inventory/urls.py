@@ -1,10 +1,21 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('sales/new/', views.sales_new, name='sales_new'),
-    path('sales/summary/', views.sales_summary, name='sales_summary'),
+    path('sales/products/', async_views.product_options, name='product_options'),
+    path('sales/sync/', views.sales_sync, name='sales_sync'),
+    path('sales/today/', async_views.today_totals, name='today_totals'),
+    path('sales/summary/', async_views.sales_summary, name='sales_summary'),
     path('purchase/new/', views.purchase_new, name='purchase_new'),
+    path('dues/', views.dues, name='dues'),
+    path('payments/new/', views.payment_new, name='payment_new'),
+    path('api/catalog/', async_views.catalog_api, name='catalog_api'),
+    path('products/search/', async_views.product_search_view, name='product_search'),
+    path('customers/search/', views.customer_search, name='customer_search'),
+    path('export/<slug:dataset>/', views.export_data, name='export_data'),
+    path('metrics', views.metrics, name='metrics'),
+    path('healthz', views.healthz, name='healthz'),
     path('admin_dashboard/', views.dashboard_redirect, name='dashboard_redirect'),
 ]
 
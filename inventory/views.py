@@ -1,12 +1,24 @@
+import hmac
+import json
+import uuid
+
+from django.conf import settings
 from django.shortcuts import render, redirect
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils.text import slugify
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
-from .models import Store, Product, Stock, Invoice, InvoiceItem, UserProfile, Supplier, Purchase, PurchaseItem, Location, InvoiceContact
+from django.views.decorators.http import require_POST
+from .models import Store, Invoice, UserProfile, Supplier, Purchase, Payment
 from django.contrib import messages
-from django.db import transaction
 from django.utils import timezone
-from django.db.models import Sum
+from django.db import connection
+from django.db.models import Count
 from decimal import Decimal
+from .services import GRN_COLUMNS, SYNC_BATCH_LIMIT, PaymentError, PurchaseError, read_goods_received_note, record_payment, record_purchase, record_sale, sale_for_key, sync_sales
+from .exports import EXPORTS, FORMATS, stream_export
+from .write_queue import WriteQueueFull
+from . import catalog_cache, customers, metrics as request_metrics, receivables, reports, rollups
 
 @login_required
 def dashboard_redirect(request):
@@ -16,23 +28,8 @@ def dashboard_redirect(request):
 
 @login_required
 def sales_new(request):
-    # Fetch products with their assigned locations, ordered by category for grouping
-    products = Product.objects.prefetch_related('locations').order_by('category', 'name')
-    locations = Location.objects.all()
-    
-    # Get stock levels for Godown (assuming sales come from Godown)
-    godown = Store.objects.filter(store_type='GODOWN').first()
-    stock_map = {}
-    if godown:
-        stocks = Stock.objects.filter(store=godown)
-        stock_map = {s.product_id: s.quantity for s in stocks}
-
-    # Attach stock quantity to each product object
-    for p in products:
-        p.stock_quantity = stock_map.get(p.id, 0)
-    
     # Get today's summary
-    today = timezone.now().date()
+    today = timezone.localdate()
     # Filter invoices by the user's store if possible
     try:
         user_store = request.user.userprofile.store
@@ -44,9 +41,15 @@ def sales_new(request):
             messages.error(request, "You are not assigned to any store.")
             return redirect('sales_new')
 
+        # A resubmitted form (after a timeout, say) carries the key of the sale it already recorded
+        client_key = request.POST.get('client_key') or None
+        existing = sale_for_key(client_key)
+        if existing:
+            messages.success(request, f"Sale already recorded. Invoice #{existing.id}")
+            return redirect('sales_new')
+
         customer_name = request.POST.get('customer_name')
         mobiles = request.POST.getlist('customer_mobile[]')
-        primary_mobile = mobiles[0] if mobiles else None
         paid_amount = Decimal(request.POST.get('paid_amount'))
 
         # Support multiple items via arrays; fallback to single item if arrays not provided
@@ -65,78 +68,36 @@ def sales_new(request):
                 quantities_raw = [single_qty]
                 rates_raw = [single_rate]
 
-        try:
-            with transaction.atomic():
-                godown = Store.objects.filter(store_type='GODOWN').first()
-                if not godown:
-                    raise Exception("Central Godown not found.")
-
-                # Parse and validate lists
-                if not product_ids or len(product_ids) != len(quantities_raw) or len(product_ids) != len(rates_raw):
-                    raise Exception("Invalid sale items submitted.")
-
-                items = []
-                total_amount = Decimal('0')
-                # Pre-check stock availability for all items
-                for idx, (pid, q_raw, r_raw) in enumerate(zip(product_ids, quantities_raw, rates_raw)):
-                    product = Product.objects.get(id=pid)
-                    qty = Decimal(q_raw)
-                    rate = Decimal(r_raw)
-                    total_amount += qty * rate
-                    stock = Stock.objects.filter(product=product, store=godown).first()
-                    if not stock or stock.quantity < qty:
-                        available = stock.quantity if stock else Decimal('0')
-                        raise Exception(f"Insufficient stock for {product.name}. Available: {available}")
-                    # Resolve optional location for this item
-                    loc_id = location_ids[idx] if idx < len(location_ids) else None
-                    loc_obj = None
-                    if loc_id:
-                        try:
-                            loc_obj = Location.objects.get(id=loc_id)
-                        except Location.DoesNotExist:
-                            loc_obj = None
-                    items.append((product, qty, rate, stock, loc_obj))
-
-                # Create invoice
-                invoice = Invoice.objects.create(
-                    store=user_store,
-                    customer_name=customer_name,
-                    customer_mobile=primary_mobile,
-                    total_amount=total_amount,
-                    paid_amount=paid_amount
-                )
-
-                # Save all mobile numbers as contacts for the invoice
-                for m in mobiles:
-                    if m:
-                        InvoiceContact.objects.create(invoice=invoice, mobile=m)
-
-                # Deduct stock and create invoice items
-                for product, qty, rate, stock, loc in items:
-                    stock.quantity -= qty
-                    stock.save()
-                    InvoiceItem.objects.create(
-                        invoice=invoice,
-                        product=product,
-                        quantity=qty,
-                        rate=rate,
-                        location=loc
-                    )
-
+        if not product_ids or len(product_ids) != len(quantities_raw) or len(product_ids) != len(rates_raw):
+            messages.error(request, "Invalid sale items submitted.")
+        else:
+            try:
+                lines = [
+                    (pid, Decimal(q_raw), Decimal(r_raw), location_ids[idx] if idx < len(location_ids) else None)
+                    for idx, (pid, q_raw, r_raw) in enumerate(zip(product_ids, quantities_raw, rates_raw))
+                ]
+                invoice = record_sale(user_store, customer_name, mobiles, paid_amount, lines, client_key=client_key)
                 messages.success(request, f"Sale recorded successfully! Invoice #{invoice.id}")
                 return redirect('sales_new')
+            except Exception as e:
+                existing = sale_for_key(client_key)
+                if existing:
+                    messages.success(request, f"Sale already recorded. Invoice #{existing.id}")
+                    return redirect('sales_new')
+                messages.error(request, str(e))
 
-        except Exception as e:
-            messages.error(request, str(e))
-
-    # Calculate today's stats for the cards
-    today_sales = Invoice.objects.filter(date__date=today, store=user_store).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    today_received = Invoice.objects.filter(date__date=today, store=user_store).aggregate(Sum('paid_amount'))['paid_amount__sum'] or 0
-    today_due = today_sales - today_received
+    # Today's stats for the cards come from the daily rollup row
+    today_totals = rollups.daily_totals(user_store, today)
+    today_sales = today_totals.sales_total
+    today_received = today_totals.paid_total
+    today_due = today_totals.due_total
 
+    # The product options load from product_options; the location map is a
+    # cached fragment, so locations are only read when it is re-rendered
     context = {
-        'products': products,
-        'locations': locations,
+        'catalog_version': catalog_cache.version(catalog_cache.CATALOG),
+        'client_key': uuid.uuid4().hex,
+        'locations': catalog_cache.locations,
         'user_store': user_store,
         'today_sales': today_sales,
         'today_received': today_received,
@@ -144,105 +105,177 @@ def sales_new(request):
     }
     return render(request, 'inventory/sales_new.html', context)
 
-@staff_member_required
-def sales_summary(request):
-    today = timezone.now().date()
-    
-    total_sales = Invoice.objects.filter(date__date=today).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    total_paid = Invoice.objects.filter(date__date=today).aggregate(Sum('paid_amount'))['paid_amount__sum'] or 0
-    total_due = total_sales - total_paid
-    total_invoices = Invoice.objects.filter(date__date=today).count()
-    
-    # Purchases (Expenses)
-    total_purchases = Purchase.objects.filter(date__date=today).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    net_profit = total_sales - total_purchases
-
-    # Store-wise breakdown (Legacy summary)
-    stores = Store.objects.filter(store_type='DISPLAY')
-    store_stats = []
-    for store in stores:
-        s_sales = Invoice.objects.filter(date__date=today, store=store).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-        store_stats.append({
-            'name': store.name,
-            'sales': s_sales
-        })
-
-    # Detailed Invoices per Store
-    silwani_invoices = Invoice.objects.filter(
-        date__date=today, 
-        store__name='Silwani'
-    ).prefetch_related('items', 'items__product').order_by('-date')
-    
-    gairatganj_invoices = Invoice.objects.filter(
-        date__date=today, 
-        store__name='Gairatganj'
-    ).prefetch_related('items', 'items__product').order_by('-date')
-
-    context = {
-        'total_sales': total_sales,
-        'total_paid': total_paid,
-        'total_due': total_due,
-        'total_invoices': total_invoices,
-        'total_purchases': total_purchases,
-        'net_profit': net_profit,
-        'store_stats': store_stats,
-        'silwani_invoices': silwani_invoices,
-        'gairatganj_invoices': gairatganj_invoices,
-    }
-    return render(request, 'inventory/sales_summary.html', context)
+@login_required
+@require_POST
+def sales_sync(request):
+    """
+    Record sales queued by the sales screen while offline: a JSON body of
+    ``{"invoices": [...]}`` (see services.sync_sales), answered with one
+    result per invoice.
+    """
+    try:
+        store = request.user.userprofile.store
+    except UserProfile.DoesNotExist:
+        store = None
+    if not store:
+        return JsonResponse({'error': "You are not assigned to any store."}, status=403)
+    try:
+        entries = json.loads(request.body)['invoices']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': "Expected a JSON object with an invoices list."}, status=400)
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        return JsonResponse({'error': "Expected a JSON object with an invoices list."}, status=400)
+    if len(entries) > SYNC_BATCH_LIMIT:
+        return JsonResponse({'error': f"At most {SYNC_BATCH_LIMIT} invoices per request."}, status=400)
+    try:
+        results = sync_sales(store, entries)
+    except WriteQueueFull as e:
+        # The sales screen keeps the queue and resends it later
+        return JsonResponse({'error': str(e)}, status=503)
+    return JsonResponse({'results': results})
 
 @staff_member_required
 def purchase_new(request):
-    products = Product.objects.all()
-    suppliers = Supplier.objects.all()
-    recent_purchases = Purchase.objects.order_by('-date')[:10]
-
     if request.method == 'POST':
         supplier_name = request.POST.get('supplier_name')
         invoice_number = request.POST.get('invoice_number')
-        product_id = request.POST.get('product')
-        quantity = Decimal(request.POST.get('quantity'))
-        rate = Decimal(request.POST.get('rate'))
-        
-        # Calculate total
-        total_amount = quantity * rate
-        
+        grn_file = request.FILES.get('grn_file')
+
+        # Support multiple items via arrays; fallback to single item if arrays not provided
+        product_ids = request.POST.getlist('product_ids[]')
+        quantities_raw = request.POST.getlist('quantities[]')
+        rates_raw = request.POST.getlist('rates[]')
+        if not product_ids and request.POST.get('product'):
+            product_ids = [request.POST.get('product')]
+            quantities_raw = [request.POST.get('quantity')]
+            rates_raw = [request.POST.get('rate')]
+
         try:
-            with transaction.atomic():
-                # 1. Get or Create Supplier
-                supplier, created = Supplier.objects.get_or_create(name=supplier_name)
-                
-                # 2. Create Purchase Record
-                purchase = Purchase.objects.create(
-                    supplier=supplier,
-                    invoice_number=invoice_number,
-                    total_amount=total_amount
-                )
-                
-                # 3. Create Purchase Item
-                PurchaseItem.objects.create(
-                    purchase=purchase,
-                    product_id=product_id,
-                    quantity=quantity,
-                    rate=rate
-                )
-                
-                # 4. Add Stock to Godown
-                godown = Store.objects.get(store_type='GODOWN')
-                stock, created = Stock.objects.get_or_create(product_id=product_id, store=godown)
-                stock.quantity += quantity
-                stock.save()
-                
-                messages.success(request, f"Purchase recorded! Stock added to Godown. Purchase ID: {purchase.id}")
-                return redirect('purchase_new')
+            if grn_file:
+                # Goods-received note upload replaces the item rows
+                lines = read_goods_received_note(grn_file)
+            elif product_ids and len(product_ids) == len(quantities_raw) == len(rates_raw):
+                lines = [
+                    (pid, Decimal(q_raw), Decimal(r_raw))
+                    for pid, q_raw, r_raw in zip(product_ids, quantities_raw, rates_raw)
+                ]
+            else:
+                raise PurchaseError("Invalid purchase items submitted.")
+
+            purchase = record_purchase(supplier_name, invoice_number, lines)
+            messages.success(
+                request,
+                f"Purchase recorded! {len(lines)} item(s) added to Godown stock. Purchase ID: {purchase.id}"
+            )
+            return redirect('purchase_new')
 
         except Exception as e:
             messages.error(request, f"Error: {str(e)}")
 
+    suppliers = Supplier.objects.all()
+    recent_purchases = Purchase.objects.select_related('supplier').annotate(item_count=Count('items')).order_by('-date')[:10]
+
     context = {
-        'products': products,
         'suppliers': suppliers,
         'recent_purchases': recent_purchases,
+        'grn_columns': GRN_COLUMNS,
     }
     return render(request, 'inventory/purchase_new.html', context)
-
\ No newline at end of file
+
+
+@login_required
+def customer_search(request):
+    return JsonResponse({'customers': customers.search_customers(request.GET.get('q', ''))})
+
+
+@staff_member_required
+def dues(request):
+    cursor = receivables.decode_dues_cursor(request.GET.get('after'))
+    rows, next_cursor = receivables.dues_page(cursor)
+    totals, walk_in = receivables.aging_totals()
+    context = {
+        'rows': rows,
+        'next_cursor': next_cursor,
+        'bucket_labels': [label for label, _, _ in receivables.AGING_BUCKETS],
+        'bucket_totals': [(label, totals[label]) for label, _, _ in receivables.AGING_BUCKETS],
+        'total_due': sum(totals.values()),
+        'walk_in_due': walk_in,
+        'payment_methods': Payment.METHOD_CHOICES,
+    }
+    return render(request, 'inventory/dues.html', context)
+
+
+@login_required
+def payment_new(request):
+    if request.method != 'POST':
+        return redirect('dues')
+    try:
+        invoice_id = request.POST.get('invoice', '').lstrip('#')
+        invoices = Invoice.objects.all()
+        if not request.user.is_staff:
+            # Counter staff collect only on their own store's invoices
+            invoices = invoices.filter(store__userprofile__user=request.user)
+        invoice = invoices.filter(pk=invoice_id).first() if invoice_id.isdigit() else None
+        if invoice is None:
+            raise PaymentError("Invoice not found.")
+        amount = Decimal(request.POST.get('amount') or '0')
+        payment = record_payment(
+            invoice, amount, method=request.POST.get('method') or 'CASH',
+            note=request.POST.get('note', ''), user=request.user,
+        )
+        messages.success(request, f"Payment of ₹{payment.amount} recorded on invoice #{invoice.id}. Due: ₹{invoice.due_amount}")
+    except Exception as e:
+        messages.error(request, f"Error: {str(e)}")
+    return redirect('dues' if request.user.is_staff else 'sales_new')
+
+
+@staff_member_required
+def export_data(request, dataset):
+    export = EXPORTS.get(dataset)
+    fmt = request.GET.get('format', 'csv')
+    if export is None or fmt not in FORMATS:
+        raise Http404("Unknown export.")
+
+    # Both ends are optional; a missing end leaves that side of the range open
+    first_day = reports.parse_day(request.GET.get('from'), None)
+    last_day = reports.parse_day(request.GET.get('to'), None)
+    start = reports.day_bounds(first_day, first_day)[0] if first_day else None
+    end = reports.day_bounds(last_day, last_day)[1] if last_day else None
+    store = Store.objects.filter(pk=request.GET.get('store')).first() if request.GET.get('store', '').isdigit() else None
+    use_gzip = request.GET.get('gzip') in ('1', 'true', 'yes')
+
+    _, content_type = FORMATS[fmt]
+    filename = '-'.join(filter(None, [
+        dataset,
+        store and slugify(store.name),
+        first_day and first_day.isoformat(),
+        last_day and last_day.isoformat(),
+    ])) + f'.{fmt}'
+    if use_gzip:
+        content_type, filename = 'application/gzip', filename + '.gz'
+
+    response = StreamingHttpResponse(
+        stream_export(export, fmt, start, end, store, gzip=use_gzip),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def metrics(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not request.user.is_staff and not (token and hmac.compare_digest(supplied, token)):
+        return HttpResponseForbidden("Staff only.")
+    body = request_metrics.render_prometheus(request_metrics.merged_totals())
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def healthz(request):
+    # For the platform's health checks: no session or login, one trivial query
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except Exception:
+        return JsonResponse({'status': 'database unavailable'}, status=503)
+    return JsonResponse({'status': 'ok'})
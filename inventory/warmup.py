@@ -0,0 +1,79 @@
+"""
+Start-up warm-up, so the first request after a cold start does not pay for it.
+
+gunicorn.conf.py calls warm_up() in the master process once the preloaded
+application is imported and before workers fork, so every worker starts with
+the hot templates compiled, the catalog caches and product search index
+filled. Database connections are closed afterwards; a connection must not be
+shared by forked workers.
+
+Each step is timed and failures are only logged: a missing table on the
+first deploy must not keep the server from starting.
+"""
+import logging
+import time
+
+from django.db import connection, connections
+from django.template.loader import get_template
+
+from . import catalog_cache, product_search
+
+logger = logging.getLogger(__name__)
+
+# Parents and the templates admin changelists include, as well as the pages
+# themselves: with the cached loader each is compiled once per process
+HOT_TEMPLATES = (
+    'inventory/base.html',
+    'inventory/sales_new.html',
+    'inventory/sales_summary.html',
+    'inventory/login.html',
+    'admin/base.html',
+    'admin/base_site.html',
+    'admin/change_list.html',
+    'admin/change_list_results.html',
+    'admin/inventory/invoice/change_list.html',
+    'admin/inventory/product/change_list.html',
+    'admin/search_form.html',
+    'admin/pagination.html',
+    'admin/actions.html',
+    'admin/filter.html',
+    'admin/date_hierarchy.html',
+)
+
+
+def _database():
+    connection.ensure_connection()
+
+
+def _templates():
+    for name in HOT_TEMPLATES:
+        get_template(name)
+
+
+def _catalog():
+    catalog_cache.product_options()
+    catalog_cache.locations()
+
+
+STEPS = (
+    ('database', _database),
+    ('templates', _templates),
+    ('catalog', _catalog),
+    ('product_search', product_search.index.refresh),
+)
+
+
+def warm_up():
+    """Run every step; returns {step: seconds} (None for a step that failed)."""
+    timings = {}
+    for name, step in STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("Warm-up step %s failed", name)
+            timings[name] = None
+        else:
+            timings[name] = time.perf_counter() - started
+    connections.close_all()
+    return timings
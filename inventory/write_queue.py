@@ -0,0 +1,62 @@
+"""
+In-process queue for database writers, for SQLite production mode.
+
+SQLite has one writer at a time. In production mode (settings) a write
+transaction takes the lock at BEGIN IMMEDIATE, and connections that find it
+taken wait in SQLite's busy handler, which polls with growing sleeps. Threads
+of one worker process instead take turns on a lock here, so the database lock
+passes to the next writer as soon as it is free, and only writers from other
+processes are left to the busy handler.
+
+The queue is bounded: when ``size`` writers are already waiting, or a writer
+has waited ``timeout`` seconds, WriteQueueFull is raised and the counter is
+asked to try again, rather than requests piling up behind a slow writer.
+services.retry_on_lock enters the queue around the write services; it does
+nothing unless settings.SQLITE_WRITE_QUEUE is set.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+class WriteQueueFull(Exception):
+    """Raised when a write cannot get its turn; the message is shown to the user."""
+
+
+_turn = threading.Lock()
+_state = threading.Lock()
+_local = threading.local()
+_waiting = 0
+
+
+def waiting():
+    """Writers of this process waiting for their turn."""
+    return _waiting
+
+
+@contextmanager
+def write_turn():
+    """Hold this process's write turn for the block; re-entrant within a thread."""
+    global _waiting
+    config = getattr(settings, 'SQLITE_WRITE_QUEUE', None)
+    if not config or getattr(_local, 'holding', False):
+        yield
+        return
+    with _state:
+        if _waiting >= config['size']:
+            raise WriteQueueFull("The database is busy with other sales; please try again in a moment.")
+        _waiting += 1
+    try:
+        acquired = _turn.acquire(timeout=config['timeout'])
+    finally:
+        with _state:
+            _waiting -= 1
+    if not acquired:
+        raise WriteQueueFull("The database is busy with other sales; please try again in a moment.")
+    _local.holding = True
+    try:
+        yield
+    finally:
+        _local.holding = False
+        _turn.release()
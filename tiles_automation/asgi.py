@@ -2,6 +2,12 @@
 ASGI config for tiles_automation project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with uvicorn workers under gunicorn, e.g.:
+
+    gunicorn tiles_automation.asgi:application -k uvicorn_worker.UvicornWorker
+
+The read-only views in inventory/async_views.py then wait on the database
+without holding a worker.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
@@ -12,5 +18,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tiles_automation.settings')
+# Read by settings: async requests each run their queries on a new thread
+os.environ['DJANGO_ASGI'] = '1'
 
 application = get_asgi_application()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,8 +49,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'inventory.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -58,14 +60,57 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-view SQL query budgets, keyed by URL name. QUERY_BUDGET_CHECKS=1 logs
+# requests over budget and repeated query shapes (likely N+1s); the test
+# suite enforces the same numbers.
+QUERY_BUDGETS = {
+    'sales_new': 12,
+    'sales_summary': 10,
+    'purchase_new': 9,
+    'dues': 8,
+    'admin:inventory_product_changelist': 10,
+    'admin:inventory_stock_changelist': 10,
+    'admin:inventory_invoice_changelist': 10,
+    'admin:inventory_purchase_changelist': 10,
+    'admin:inventory_purchaseitem_changelist': 10,
+    'admin:inventory_stockmovement_changelist': 10,
+    'admin:inventory_dailystoresales_changelist': 10,
+    'admin:inventory_payment_changelist': 10,
+    'admin:inventory_customerbalance_changelist': 10,
+}
+QUERY_REPEAT_THRESHOLD = 5
+if os.environ.get('QUERY_BUDGET_CHECKS'):
+    MIDDLEWARE.insert(1, 'inventory.querycount.QueryBudgetMiddleware')
+
+# Request metrics (inventory/metrics.py). Each worker process writes its totals
+# here; /metrics merges them. Scrapers authenticate with "Authorization:
+# Bearer <METRICS_TOKEN>", staff users with their session.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Country code assumed for customer phone numbers typed without one
+PHONE_DEFAULT_COUNTRY_CODE = '91'
+
+# First month of the financial year (April); manage.py archive_history moves
+# settled invoices and purchases of closed years out of the live tables
+FINANCIAL_YEAR_START_MONTH = 4
+
 ROOT_URLCONF = 'tiles_automation.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also reports render time to /metrics
+        'BACKEND': 'inventory.metrics.TimedDjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are kept per process (and filled before workers
+            # fork, see inventory/warmup.py)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -81,13 +126,60 @@ WSGI_APPLICATION = 'tiles_automation.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Persistent connections are per thread, and under ASGI every request gets a
+# new one, so they would only pile up there (asgi.py sets DJANGO_ASGI)
 DATABASES = {
     'default': dj_database_url.config(
         default='sqlite:///' + str(BASE_DIR / 'db.sqlite3'),
-        conn_max_age=600
+        conn_max_age=0 if os.environ.get('DJANGO_ASGI') else 600
     )
 }
 
+# Opt-in production mode for SQLite (SQLITE_PRODUCTION=1): WAL journaling and
+# tuned pragmas on every connection, write transactions that take the lock at
+# BEGIN, and an in-process queue in front of the write services
+# (inventory/write_queue.py), so concurrent counters wait their turn instead of
+# failing with "database is locked"
+SQLITE_PRODUCTION = (
+    DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3'
+    and os.environ.get('SQLITE_PRODUCTION', '').lower() in ('1', 'true', 'yes')
+)
+if SQLITE_PRODUCTION:
+    DATABASES['default'].setdefault('OPTIONS', {}).update({
+        'transaction_mode': 'IMMEDIATE',
+        # Seconds a connection waits on a locked database (SQLite's busy timeout)
+        'timeout': 10,
+        'init_command': ';'.join([
+            'PRAGMA journal_mode=WAL',
+            'PRAGMA synchronous=NORMAL',
+            'PRAGMA mmap_size=268435456',
+            'PRAGMA cache_size=-65536',
+        ]),
+    })
+    # Writers allowed to wait per process, and seconds each may wait
+    SQLITE_WRITE_QUEUE = {
+        'size': int(os.environ.get('SQLITE_WRITE_QUEUE_SIZE', '32')),
+        'timeout': float(os.environ.get('SQLITE_WRITE_QUEUE_TIMEOUT', '15')),
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# File-based by default so every worker process sees the same catalog and
+# stock versions (inventory/catalog_cache.py); CACHE_BACKEND and
+# CACHE_LOCATION switch to e.g. Redis or Memcached.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'my_shop_cache')),
+    }
+}
+CATALOG_CACHE = 'default'
+# Seconds a cached godown stock figure may be served; writes through the
+# ledger invalidate it sooner
+STOCK_CACHE_TTL = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators